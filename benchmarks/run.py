@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks of datapro's hot paths, against local SQLite databases and synthetic data.
+
+Usage:
+    python benchmarks/run.py [--rows N] [--repeat N] [--only NAME [NAME ...]] [--baseline PATH] [--save]
+                             [--tolerance FRACTION]
+
+Every benchmark prepares its data, then times one call over ``--rows`` rows (the best of ``--repeat`` runs counts)
+and measures its peak memory in one more run under tracemalloc.  Results are compared with the baseline file
+(benchmarks/baseline.json by default) when it exists, and ``--save`` makes them the new baseline.  The exit status is
+1 when a benchmark is slower (rows per second) or needs more memory than its baseline by more than the tolerance.
+
+Baselines depend on the machine, so keep them local (or per CI runner) rather than in version control.
+"""
+
+import argparse
+import datetime
+import functools
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy
+from sqlalchemy import Column, event
+from sqlalchemy.types import DATE, NUMERIC, SMALLINT, VARCHAR, INTEGER
+
+from datapro import IdMixin, Model
+from datapro.base.util import dict_merge
+from datapro.core.db import engines, OrmConnection
+from datapro.core.load import BulkLoader
+from datapro.core.model.common import Date
+from datapro.core.model.init import init
+from datapro.core.tool import DimensionCache, _title_case_word, title_case, title_case_many
+from datapro.core.validation import RowValidator, Validator
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+BENCHMARKS = OrderedDict()
+
+MEMORY_FLOOR = 2 ** 20  # peak memory growth below this (bytes) is never a regression
+
+WORDS = (
+    'a an and as at but by en for if in of on or the to v vs via '
+    'data warehouse customer order invoice ledger region quarterly report north south east west total net gross '
+    'adjusted balance payment account branch product service return discount'
+).split()
+
+
+class Customer(Model, IdMixin):
+    __schema__ = None
+    __table_name__ = 'Customer'
+    __table_name_mask__ = '{__table_type__}_{__table_name__}'
+    __table_type__ = 'BENCH'
+
+    code = Column(VARCHAR(20), nullable=False)
+    region = Column(SMALLINT, nullable=False)
+    name = Column(VARCHAR(100))
+
+
+class Sale(Model, IdMixin):
+    __schema__ = None
+    __table_name__ = 'Sale'
+    __table_name_mask__ = '{__table_type__}_{__table_name__}'
+    __table_type__ = 'BENCH'
+
+    customer_id = Column(INTEGER, nullable=False)
+    booked = Column(DATE, nullable=False)
+    quantity = Column(INTEGER, nullable=False)
+    amount = Column(NUMERIC(12, 2), nullable=False)
+
+
+def benchmark(name):
+    """Register a benchmark: a function taking a Context, preparing its data and returning the callable to time and
+    the number of rows it handles.
+    """
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class Context(object):
+    """Scale and scratch databases of a benchmark run.
+    """
+
+    def __init__(self, directory, rows, seed=42):
+        self.directory = directory
+        self.rows = rows
+        self.random = random.Random(seed)
+        self._databases = 0
+
+    def connection(self, **kwargs):
+        """OrmConnection to a new SQLite database file, with a second one attached as the common schema.
+        """
+        self._databases += 1
+        path = os.path.join(self.directory, 'bench{0}.db'.format(self._databases))
+        common = os.path.join(self.directory, 'bench{0}_common.db'.format(self._databases))
+        connection = OrmConnection('bench', {'db': {'bench': {'connection_string': 'sqlite:///' + path}}}, **kwargs)
+        event.listen(connection.engine, 'connect', functools.partial(_attach_common, common))
+        Model.metadata.create_all(connection.engine, tables=[Customer.__table__, Sale.__table__])
+        return connection
+
+    def customers(self, n, offset=0):
+        return [
+            {'code': 'C{0:07d}'.format(i), 'region': i % 10, 'name': ' '.join(self.random.sample(WORDS, 3))}
+            for i in range(offset, offset + n)
+        ]
+
+    def raw_sales(self, n):
+        """Sales as extracted from a text file: every value a string."""
+        start = datetime.date(2015, 1, 1)
+        return [
+            {
+                'customer': 'C{0:07d}'.format(self.random.randrange(n)),
+                'booked': (start + datetime.timedelta(days=self.random.randrange(1500))).isoformat(),
+                'quantity': str(self.random.randrange(1, 100)),
+                'amount': '{0:.3f}'.format(self.random.uniform(0, 10000)),
+            }
+            for _ in range(n)
+        ]
+
+    def sales(self, n):
+        start = datetime.date(2015, 1, 1)
+        return [
+            {
+                'customer_id': self.random.randrange(1, n + 1),
+                'booked': start + datetime.timedelta(days=self.random.randrange(1500)),
+                'quantity': self.random.randrange(1, 100),
+                'amount': round(self.random.uniform(0, 10000), 2)
+            }
+            for _ in range(n)
+        ]
+
+    def text(self, lines, words_per_line=12):
+        return [
+            ' '.join(self.random.choice(WORDS) for _ in range(words_per_line)) + self.random.choice(['', '.', ':', '?'])
+            for _ in range(lines)
+        ]
+
+    def config(self, n, depth=3, fanout=10):
+        """Nested configuration with about n leaves."""
+        def build(level, prefix, leaves):
+            if level == depth or leaves <= fanout:
+                return dict(('{0}{1}'.format(prefix, i), i) for i in range(leaves))
+            return dict(('{0}{1}'.format(prefix, i), build(level + 1, prefix + str(i) + '_', leaves // fanout))
+                        for i in range(fanout))
+        return build(1, 'k', n)
+
+
+def _attach_common(path, dbapi_connection, connection_record):
+    dbapi_connection.execute("ATTACH DATABASE '{0}' AS common".format(path))
+
+
+@benchmark('dimension_cache.warm')
+def bench_cache_warm(context):
+    connection = context.connection()
+    BulkLoader(connection, Customer).load(context.customers(context.rows))
+    connection.session.commit()
+    return lambda: DimensionCache(connection, Customer, ['code', 'region']), context.rows
+
+
+@benchmark('dimension_cache.merge_many')
+def bench_cache_merge_many(context):
+    connection = context.connection()
+    BulkLoader(connection, Customer).load(context.customers(context.rows // 2))
+    connection.session.commit()
+    cache = DimensionCache(connection, Customer, ['code', 'region'])
+    records = context.customers(context.rows)   # half known, half new
+
+    def run():
+        for i in range(0, len(records), 1000):
+            cache.merge_many(records[i:i + 1000])
+        connection.session.commit()
+    return run, context.rows
+
+
+@benchmark('dimension_cache.merge')
+def bench_cache_merge(context):
+    connection = context.connection()
+    BulkLoader(connection, Customer).load(context.customers(context.rows // 2))
+    connection.session.commit()
+    cache = DimensionCache(connection, Customer, ['code', 'region'], batch_size=1000)
+    records = context.customers(context.rows)
+
+    def run():
+        for record in records:
+            cache.merge(record)
+        cache.flush()
+        connection.session.commit()
+    return run, context.rows
+
+
+_SALE_FIELDS = (
+    ('customer', 'string', {'max_length': 20}),
+    ('booked', 'date', {'format': '%Y-%m-%d'}),
+    ('quantity', 'int', {}),
+    ('amount', 'decimal', {'precision': 2}),
+)
+
+
+@benchmark('validator.per_field')
+def bench_validator(context):
+    rows = context.raw_sales(context.rows)
+    validator = Validator()
+
+    def run():
+        for row in rows:
+            validator.reset('{key}: {message}')
+            for key, kind, options in _SALE_FIELDS:
+                getattr(validator, kind)(key, row[key], **options)
+    return run, context.rows
+
+
+@benchmark('validator.row')
+def bench_row_validator(context):
+    rows = context.raw_sales(context.rows)
+    validator = RowValidator([(key, dict(options, type=kind)) for key, kind, options in _SALE_FIELDS])
+
+    def run():
+        for row in rows:
+            validator.validate(row)
+    return run, context.rows
+
+
+def _clear_title_case_memos():
+    """Forget the values and words cased so far, so every run times the casing rather than the memos of the last.
+    """
+    title_case.cache_clear()
+    _title_case_word.cache_clear()
+
+
+@benchmark('title_case')
+def bench_title_case(context):
+    lines = context.text(context.rows)
+
+    def run():
+        _clear_title_case_memos()
+        for line in lines:
+            title_case(line)
+    return run, context.rows
+
+
+@benchmark('title_case_many')
+def bench_title_case_many(context):
+    names = context.text(context.rows // 100 or 1, words_per_line=4)
+    column = [context.random.choice(names) for _ in range(context.rows)]     # high repetition, like a name column
+
+    def run():
+        _clear_title_case_memos()
+        title_case_many(column)
+    return run, context.rows
+
+
+@benchmark('date.from_date')
+def bench_date_from_date(context):
+    start = datetime.date(1990, 1, 1)
+    dates = [start + datetime.timedelta(days=i) for i in range(context.rows)]
+
+    def run():
+        for d in dates:
+            Date.from_date(d)
+    return run, context.rows
+
+
+@benchmark('date.rows')
+def bench_date_rows(context):
+    start = datetime.date(1990, 1, 1)
+    end = start + datetime.timedelta(days=context.rows - 1)
+    return lambda: Date.rows(start, end), context.rows
+
+
+@benchmark('date.init')
+def bench_date_init(context):
+    connection = context.connection()
+    start = datetime.date(1990, 1, 1)
+    end = start + datetime.timedelta(days=context.rows - 1)
+    return lambda: init(connection, start, end), context.rows
+
+
+@benchmark('dict_merge')
+def bench_dict_merge(context):
+    master = context.config(context.rows)
+    override = context.config(context.rows // 10)
+    return lambda: [dict_merge(master, override) for _ in range(100)], context.rows * 100
+
+
+@benchmark('orm.block_flush')
+def bench_block_flush(context):
+    connection = context.connection(flush_block_size=1000)
+    sales = context.sales(context.rows)
+
+    def run():
+        session = connection.session
+        for sale in sales:
+            session.add(Sale(**sale))
+            connection.block_flush()
+        connection.flush_block()
+        session.commit()
+    return run, context.rows
+
+
+@benchmark('bulk_loader')
+def bench_bulk_loader(context):
+    connection = context.connection()
+    sales = context.sales(context.rows)
+
+    def run():
+        BulkLoader(connection, Sale).load(sales)
+        connection.session.commit()
+    return run, context.rows
+
+
+def measure(name, context, repeat):
+    """Run a benchmark: best time of repeat runs, then peak memory of one run under tracemalloc.
+    """
+    best = None
+    for _ in range(repeat):
+        function, rows = BENCHMARKS[name](context)
+        started_at = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - started_at
+        best = seconds if best is None else min(best, seconds)
+        engines.dispose()
+
+    function, rows = BENCHMARKS[name](context)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        engines.dispose()
+
+    return {'rows': rows, 'seconds': best, 'rows_per_second': rows / best if best else None, 'peak_memory': peak}
+
+
+def compare(results, baseline, tolerance):
+    """Ratios of results to baseline, and the names of the benchmarks that regressed.
+    """
+    ratios, regressions = {}, []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get('rows_per_second') or not result['rows_per_second']:
+            continue
+        speed = result['rows_per_second'] / base['rows_per_second']
+        memory = result['peak_memory'] / base['peak_memory'] if base.get('peak_memory') else 1.0
+        ratios[name] = (speed, memory)
+        grown = result['peak_memory'] - base.get('peak_memory', 0) > MEMORY_FLOOR
+        if speed < 1 - tolerance or (memory > 1 + tolerance and grown):
+            regressions.append(name)
+    return ratios, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark datapro hot paths.')
+    parser.add_argument('--rows', type=int, default=20000, help='rows per benchmark (default 20000)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark, the best counts (default 3)')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='benchmarks to run (default all)')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file (default benchmarks/baseline.json)')
+    parser.add_argument('--save', action='store_true', help='save the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed slowdown and memory growth as a fraction of the baseline (default 0.1)')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline = stored['results']
+        if stored.get('rows') != args.rows:
+            print('Baseline was recorded with --rows {0}; comparisons are approximate'.format(stored.get('rows')))
+
+    directory = tempfile.mkdtemp(prefix='datapro-bench-')
+    results = OrderedDict()
+    try:
+        for name in args.only or BENCHMARKS:
+            results[name] = measure(name, Context(tempfile.mkdtemp(dir=directory), args.rows), args.repeat)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    ratios, regressions = compare(results, baseline, args.tolerance)
+    print('{0:<28} {1:>9} {2:>9} {3:>12} {4:>10} {5:>9} {6:>9}'.format(
+        'benchmark', 'rows', 'seconds', 'rows/s', 'peak MiB', 'speed', 'memory'
+    ))
+    for name, result in results.items():
+        speed, memory = ratios.get(name, (None, None))
+        print('{0:<28} {1:>9} {2:>9.3f} {3:>12,.0f} {4:>10.1f} {5:>9} {6:>9}{7}'.format(
+            name,
+            result['rows'],
+            result['seconds'],
+            result['rows_per_second'],
+            result['peak_memory'] / 2.0 ** 20,
+            '{0:.2f}x'.format(speed) if speed is not None else '-',
+            '{0:.2f}x'.format(memory) if memory is not None else '-',
+            '  REGRESSION' if name in regressions else ''
+        ))
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'rows': args.rows,
+                'python': platform.python_version(),
+                'sqlalchemy': sqlalchemy.__version__,
+                'machine': platform.platform(),
+                'results': baseline
+            }, f, indent=2, sort_keys=True)
+        print('Saved baseline to {0}'.format(args.baseline))
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
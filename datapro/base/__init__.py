@@ -9,6 +9,7 @@ Example:
 
 import datetime
 import logging
+from collections.abc import Mapping
 
 from datapro.base.util import dict_merge
 from datapro.base.interface import IFramework
@@ -41,7 +42,98 @@ class BaseConfig(dict):
         Args:
             override: dictionary to be merged into the initial_dict
         """
-        self.update(dict_merge(self, override))
+        if override:
+            dict_merge(self, override, in_place=True)
+
+
+def _thaw(value):
+    if isinstance(value, FrozenConfig):
+        return dict((k, _thaw(v)) for k, v in value.items())
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    if isinstance(value, frozenset):
+        return set(value)
+    return value
+
+
+def _freeze(value):
+    if isinstance(value, FrozenConfig):
+        return value
+    if isinstance(value, Mapping):
+        return FrozenConfig(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+class FrozenConfig(Mapping):
+    """Immutable Configuration
+
+    A recursively frozen (nested mappings become FrozenConfigs, lists become tuples) configuration that can be shared
+    across threads, and pickled to processes, without defensive copies: copying one returns it unchanged.  Merging
+    returns a new FrozenConfig sharing every part the override does not change.
+
+    Args:
+        initial_dict (Optional[dict]): injection of the Python dictionary
+    """
+
+    __slots__ = ('_data', '_hash')
+
+    def __init__(self, initial_dict=None):
+        self._data = dict((k, _freeze(v)) for k, v in (initial_dict or {}).items())
+        self._hash = None
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self._data.items()))
+        return self._hash
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getstate__(self):
+        return self._data
+
+    def __setstate__(self, state):
+        self._data = state
+        self._hash = None
+
+    def __repr__(self):
+        return 'FrozenConfig({0!r})'.format(self._data)
+
+    def merge(self, override=None):
+        """
+        Args:
+            override: dictionary to be merged into the configuration
+
+        Returns:
+            FrozenConfig: the merged configuration
+        """
+        if not override:
+            return self
+        return FrozenConfig(dict_merge(self, override))
+
+    def thaw(self):
+        """
+        Returns:
+            dict: mutable deep copy of the configuration (nested FrozenConfigs become dicts, tuples become lists and
+                frozensets become sets)
+        """
+        return _thaw(self)
 
 
 class BaseJob(IFramework):
@@ -103,8 +195,9 @@ class BaseJob(IFramework):
         logger.info(self.status)
 
     def stop(self):
-        """Stop the ETL job
+        """Stop the ETL job (a job that failed keeps its status)
         """
-        self._status = STATUS_STOP
+        if self._status != STATUS_FAIL:
+            self._status = STATUS_STOP
         self.stopped_at = datetime.datetime.utcnow()
         logger.info(self.status)
@@ -1,25 +1,54 @@
 # -*- coding: utf-8 -*-
 
+import datetime
+import re
+import time
+from bisect import bisect_right
+from collections.abc import Mapping
 from copy import deepcopy
+from functools import lru_cache
 
 import pytz
 
+# Patterns of the numeric strptime directives (identical to those used by the standard library's _strptime)
+_DIRECTIVES = {
+    'Y': r'(?P<Y>\d\d\d\d)',
+    'm': r'(?P<m>1[0-2]|0[1-9]|[1-9])',
+    'd': r'(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])',
+    'H': r'(?P<H>2[0-3]|[0-1]\d|\d)',
+    'M': r'(?P<M>[0-5]\d|\d)',
+    'S': r'(?P<S>6[0-1]|[0-5]\d|\d)'
+}
+_DEFAULTS = (('Y', 1900), ('m', 1), ('d', 1), ('H', 0), ('M', 0), ('S', 0))
+_REGEX_CHARS = re.compile(r"([\\.^$*+?\(\){}\[\]|])")
+_WHITESPACE = re.compile(r'\s+')
+_PARSERS = {}
 
-def dict_merge(master, merge):
+
+def dict_merge(master, merge, in_place=False):
     """Recursively merge dicts
     (originally found at https://www.xormedia.com/recursively-merge-dictionaries-in-python/)
 
+    Every value is copied once: values taken from either input are deep-copied, so the result shares no mutable state
+    with the inputs (immutable values, such as FrozenConfigs, copy to themselves at no cost).
+
     Args:
         master (dict): base dictionary
         merge (dict): dictionary with entries to be merged into the base dictionary
+        in_place (Optional[boolean]): update `master` itself instead of copying it (the values merged in are still
+            copied)
 
     Returns:
         dict: resulting dictionary from `merge` merged into `master`
     """
-    result = deepcopy(master)
-    for k, v in iter(merge.items()):
-        if k in result and isinstance(result[k], dict) and isinstance(merge[k], dict):
-            result[k] = dict_merge(result[k], merge[k])
+    if in_place:
+        result = master
+    else:
+        result = dict((k, deepcopy(v)) for k, v in master.items() if k not in merge)
+    for k, v in merge.items():
+        current = master.get(k)
+        if isinstance(current, Mapping) and isinstance(v, Mapping):
+            result[k] = dict_merge(current, v)
         else:
             result[k] = deepcopy(v)
     return result
@@ -35,4 +64,149 @@ def to_utc(dt, tz, is_dst=False):
     UTC:    4:30am            -> 5:30am            -> 6:30am             -> 7:30am
     If we're guessing that is_dst is off, it means UTC 6am-7am happens twice (which is wrong!), just like Eastern 1am-2am
     """
-    return dt - pytz.timezone(tz).utcoffset(dt, is_dst=is_dst)
\ No newline at end of file
+    zone = timezone(tz)
+    if not isinstance(zone, pytz.tzinfo.DstTzInfo):
+        return dt - zone.utcoffset(dt)  # fixed offset (pytz.utc takes no is_dst)
+    return dt - zone.utcoffset(dt, is_dst=is_dst)
+
+
+@lru_cache(maxsize=None)
+def timezone(tz):
+    """Cached pytz.timezone
+
+    Args:
+        tz (str): timezone name
+
+    Returns:
+        datetime.tzinfo: pytz timezone
+    """
+    return pytz.timezone(tz)
+
+
+@lru_cache(maxsize=None)
+def _transition_table(tz):
+    """Local-time view of a timezone's transitions, for converting naive datetimes in bulk.
+
+    For each transition, ``lower`` and ``upper`` bound the local times that are ambiguous or non-existent around it and
+    ``offsets`` holds the UTC offset in effect from ``upper`` until the next transition.
+
+    Returns:
+        tuple: (lower, upper, offsets) lists, or None if the timezone has no transitions
+    """
+    zone = timezone(tz)
+    if not isinstance(zone, pytz.tzinfo.DstTzInfo):
+        return None
+
+    lower = [datetime.datetime.min]
+    upper = [datetime.datetime.min]
+    offsets = [zone._transition_info[0][0]]
+    for i in range(1, len(zone._utc_transition_times)):
+        before, after = zone._transition_info[i - 1][0], zone._transition_info[i][0]
+        lower.append(zone._utc_transition_times[i] + min(before, after))
+        upper.append(zone._utc_transition_times[i] + max(before, after))
+        offsets.append(after)
+    return lower, upper, offsets
+
+
+def to_utc_many(dts, tz, is_dst=False):
+    """Convert a column of naive datetimes in a timezone to naive UTC datetimes (see `to_utc`).
+
+    The timezone's transitions are looked up by binary search; only datetimes falling in an ambiguous or non-existent
+    hour are handed to pytz, so the `is_dst` semantics are the same as those of `to_utc`.
+
+    Args:
+        dts (iterable): naive datetimes
+        tz (str): timezone name
+        is_dst (Optional[boolean]): daylight saving time assumed for ambiguous or non-existent times
+
+    Returns:
+        list: naive UTC datetimes, in input order
+    """
+    zone = timezone(tz)
+    table = _transition_table(tz)
+    dts = list(dts)
+    if table is None:
+        if not dts:
+            return []
+        offset = zone.utcoffset(dts[0])     # fixed-offset timezone (pytz.utc takes no is_dst)
+        return [dt - offset for dt in dts]
+
+    lower, upper, offsets = table
+    result = []
+    for dt in dts:
+        i = bisect_right(lower, dt) - 1
+        if dt < upper[i]:
+            result.append(dt - zone.utcoffset(dt, is_dst=is_dst))
+        else:
+            result.append(dt - offsets[i])
+    return result
+
+
+class DateParser(object):
+    """Memoizing date/datetime parser for a single strptime format.
+
+    Formats made only of the numeric directives %Y, %m, %d, %H, %M and %S (plus literal text) are compiled into one
+    regular expression built exactly as ``time.strptime`` builds it, so results (and failures) are the same without
+    the cost of the general implementation.  Any other format falls back to ``time.strptime``.  Parsed values are
+    kept in a bounded memo, as feeds tend to repeat the same dates many times.
+
+    Args:
+        format (str): strptime format
+        memo_size (Optional[int]): maximum number of memoized values per result type
+    """
+
+    def __init__(self, format, memo_size=4096):
+        self.format = format
+        self._regex = self._compile(format)
+        self.date = lru_cache(maxsize=memo_size)(self._parse_date)
+        self.datetime = lru_cache(maxsize=memo_size)(self._parse_datetime)
+
+    @staticmethod
+    def _compile(format):
+        """Compile a format into a regular expression, or return None if it needs the general implementation.
+        """
+        pattern = _WHITESPACE.sub(r'\\s+', _REGEX_CHARS.sub(r'\\\1', format))
+        processed = []
+        seen = set()
+        while '%' in pattern:
+            index = pattern.index('%')
+            directive = pattern[index + 1:index + 2]
+            if directive not in _DIRECTIVES or directive in seen:
+                return None
+            seen.add(directive)
+            processed.append(pattern[:index])
+            processed.append(_DIRECTIVES[directive])
+            pattern = pattern[index + 2:]
+        processed.append(pattern)
+        return re.compile(''.join(processed), re.IGNORECASE)
+
+    def _fields(self, value):
+        if self._regex is None:
+            return time.strptime(value, self.format)[:6]
+
+        found = self._regex.match(value)
+        if found is None or found.end() != len(value):
+            raise ValueError('time data {0!r} does not match format {1!r}'.format(value, self.format))
+        groups = found.groupdict()
+        return tuple(int(groups[d]) if d in groups else default for d, default in _DEFAULTS)
+
+    def _parse_date(self, value):
+        return datetime.date(*self._fields(value)[:3])
+
+    def _parse_datetime(self, value):
+        return datetime.datetime(*self._fields(value))
+
+
+def date_parser(format):
+    """Shared DateParser for a strptime format.
+
+    Args:
+        format (str): strptime format
+
+    Returns:
+        DateParser: parser (created on first use)
+    """
+    parser = _PARSERS.get(format)
+    if parser is None:
+        parser = _PARSERS[format] = DateParser(format)
+    return parser
@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+"""Storage backends for DimensionCache.
+
+A backend maps cache keys (tuples of key column values) to dimension ids and implements the small dictionary
+protocol DimensionCache relies on: ``get``, ``__getitem__``, ``__setitem__``, ``__contains__``, ``__len__`` and
+``update``, plus ``memory_usage`` for sizing reports.
+
+Caches can be written to snapshot files which later processes map into memory read-only (see ``write_snapshot`` and
+``read_snapshot``), so that several jobs on the same host share one copy of a dimension.
+"""
+
+import datetime
+import decimal
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+
+_EMPTY = 0      # digest value marking an empty slot in a HashedArrayCache
+
+SNAPSHOT_MAGIC = b'DPDCSNAP'
+SNAPSHOT_VERSION = 2     # version 1 digested the repr of keys as given, see canonical_key
+
+
+def canonical_value(value):
+    """Canonical form of a key value: values that compare equal (and so share a DictCache entry) get the same form.
+
+    NumPy scalars become the Python values they hold, str subclasses become str, booleans and integral numbers
+    become int, and a Decimal becomes a float when the float is exactly equal to it.
+
+    Args:
+        value: key column value
+
+    Returns:
+        the canonical value
+    """
+    if isinstance(value, str):
+        return str(value)
+    if hasattr(value, 'dtype') and hasattr(value, 'item'):     # NumPy scalar
+        value = value.item()
+        if isinstance(value, str):
+            return value
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, decimal.Decimal) and value.is_finite():
+        if value == value.to_integral_value():
+            return int(value)
+        as_float = float(value)
+        return as_float if as_float == value else value
+    return value
+
+
+def canonical_key(key):
+    """Canonical form of a cache key (see canonical_value).
+
+    Args:
+        key (tuple): cache key
+
+    Returns:
+        tuple: the key with every value in canonical form
+    """
+    if isinstance(key, tuple):
+        return tuple([canonical_value(v) for v in key])
+    return canonical_value(key)
+
+
+def key_digest(key):
+    """Stable 64-bit digest of a cache key.
+
+    The digest depends on the ``repr`` of the canonical key, so it is the same in every process (unlike ``hash``) and
+    keys that compare equal share a digest, e.g. ``('A', 1)``, ``('A', 1.0)`` and ``(numpy.str_('A'), numpy.int64(1))``.
+
+    Args:
+        key (tuple): cache key
+
+    Returns:
+        int: signed 64-bit digest (never 0)
+    """
+    encoded = repr(canonical_key(key)).encode('utf-8')
+    digest = int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), 'little', signed=True)
+    return digest or 1
+
+
+def _estimate_size(mapping, sample_size=10000):
+    """Estimate the memory used by a mapping of key tuples to ids, extrapolating from a sample of its entries.
+    """
+    size = sys.getsizeof(mapping)
+    if not mapping:
+        return size
+
+    sampled = 0
+    entries = 0
+    for key, value in mapping.items():
+        entries += sys.getsizeof(key) + sys.getsizeof(value)
+        if isinstance(key, tuple):
+            entries += sum(sys.getsizeof(v) for v in key)
+        sampled += 1
+        if sampled >= sample_size:
+            break
+    return size + int(entries * (float(len(mapping)) / sampled))
+
+
+class DictCache(dict):
+    """Default backend: a plain Python dictionary of key tuples to ids.
+    """
+
+    def memory_usage(self):
+        """Estimate the memory used by the cache, including keys and ids.
+
+        Returns:
+            int: estimated size in bytes (extrapolated from a sample of entries for large caches)
+        """
+        return _estimate_size(self)
+
+
+class LruCache(object):
+    """Size-bounded backend that evicts entries once ``maxsize`` is reached.
+
+    Args:
+        maxsize (int): maximum number of cached entries
+        policy (Optional[str]): 'lru' evicts the least recently used entry, 'fifo' the least recently added one
+            (cheaper, as hits do not reorder entries)
+    """
+
+    POLICIES = ('lru', 'fifo')
+
+    def __init__(self, maxsize, policy='lru'):
+        if policy not in LruCache.POLICIES:
+            raise ValueError('Eviction policy must be one of {0}'.format(', '.join(LruCache.POLICIES)))
+        self._entries = OrderedDict()
+        self._touch = policy == 'lru'
+        self.maxsize = maxsize
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __getitem__(self, key):
+        cache_id = self.get(key)
+        if cache_id is None:
+            raise KeyError(key)
+        return cache_id
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __setitem__(self, key, value):
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+        entries[key] = value
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        cache_id = self._entries.get(key)
+        if cache_id is None:
+            return default
+        if self._touch:
+            self._entries.move_to_end(key)
+        return cache_id
+
+    def items(self):
+        return self._entries.items()
+
+    def update(self, other):
+        if hasattr(other, 'items'):
+            other = other.items()
+        for key, value in other:
+            self[key] = value
+
+    def memory_usage(self):
+        """Estimate the memory used by the cache, including keys and ids.
+
+        Returns:
+            int: estimated size in bytes
+        """
+        return _estimate_size(self._entries)
+
+
+class HashedArrayCache(object):
+    """Memory-compact backend: an open-addressing hash table of 64-bit key digests to ids held in typed arrays.
+
+    Each entry costs 16 bytes (plus free slots kept by the load factor), instead of the key tuple, its values, the id
+    and the dictionary slot of a DictCache.  Keys themselves are not kept, so ``items`` is not available.
+
+    Args:
+        capacity (Optional[int]): initial number of slots (rounded up to a power of two)
+        load_factor (Optional[float]): fraction of slots in use that triggers the table to double in size
+
+    Note:
+        Keys are identified by their 64-bit digest.  Two distinct keys sharing a digest would share an id; the
+        chance of this is roughly n^2 / 2^65 (about 1 in 370,000 for ten million keys).
+    """
+
+    def __init__(self, capacity=1024, load_factor=0.66):
+        self._load_factor = load_factor
+        self._count = 0
+        self._allocate(capacity)
+
+    @classmethod
+    def from_buffers(cls, digests, ids, count, load_factor=0.66):
+        """Wrap existing digest and id buffers (e.g. memoryviews of a mapped snapshot) without copying them.
+
+        Args:
+            digests: sequence of 64-bit digests, its length a power of two
+            ids: sequence of 64-bit ids, the same length as ``digests``
+            count (int): number of slots in use
+            load_factor (Optional[float]): fraction of slots in use that triggers the table to double in size
+
+        Returns:
+            HashedArrayCache: cache over the buffers (read-only if the buffers are)
+        """
+        cache = cls.__new__(cls)
+        cache._load_factor = load_factor
+        cache._count = count
+        cache._mask = len(digests) - 1
+        cache._limit = int(len(digests) * load_factor)
+        cache._digests = digests
+        cache._ids = ids
+        return cache
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        cache_id = self.get(key)
+        if cache_id is None:
+            raise KeyError(key)
+        return cache_id
+
+    def __len__(self):
+        return self._count
+
+    def __setitem__(self, key, value):
+        self._put(key_digest(key), value)
+
+    def _allocate(self, capacity):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self._mask = size - 1
+        self._limit = int(size * self._load_factor)
+        self._digests = array('q', [_EMPTY]) * size
+        self._ids = array('q', [0]) * size
+
+    def _put(self, digest, value):
+        mask = self._mask
+        digests = self._digests
+        i = digest & mask
+        while True:
+            d = digests[i]
+            if d == _EMPTY:
+                break
+            if d == digest:
+                self._ids[i] = value
+                return
+            i = (i + 1) & mask
+
+        if self._count >= self._limit:
+            self._grow()
+            self._put(digest, value)
+            return
+
+        digests[i] = digest
+        self._ids[i] = value
+        self._count += 1
+
+    def _grow(self):
+        digests, ids = self._digests, self._ids
+        self._count = 0
+        self._allocate((self._mask + 1) * 2)
+        for d, v in zip(digests, ids):
+            if d != _EMPTY:
+                self._put(d, v)
+
+    def get(self, key, default=None):
+        """Look up the id for a key.
+
+        Args:
+            key (tuple): cache key
+            default: value returned when the key is not in the cache
+
+        Returns:
+            int: dimension id for the key
+        """
+        digest = key_digest(key)
+        mask = self._mask     # the probe of get_digest, inlined as lookups are on the hot path
+        digests = self._digests
+        i = digest & mask
+        while True:
+            d = digests[i]
+            if d == digest:
+                return self._ids[i]
+            if d == _EMPTY:
+                return default
+            i = (i + 1) & mask
+
+    def get_digest(self, digest, default=None):
+        """Look up the id for a key digest (see key_digest).
+
+        Args:
+            digest (int): 64-bit key digest
+            default: value returned when the digest is not in the cache
+
+        Returns:
+            int: dimension id for the digest
+        """
+        mask = self._mask
+        digests = self._digests
+        i = digest & mask
+        while True:
+            d = digests[i]
+            if d == digest:
+                return self._ids[i]
+            if d == _EMPTY:
+                return default
+            i = (i + 1) & mask
+
+    def digest_items(self):
+        """Iterate over the (digest, id) pairs in the cache.
+        """
+        return ((d, v) for d, v in zip(self._digests, self._ids) if d != _EMPTY)
+
+    def update(self, other):
+        """Add entries from a mapping or an iterable of (key, id) pairs.
+        """
+        if hasattr(other, 'items'):
+            other = other.items()
+        for key, value in other:
+            self._put(key_digest(key), value)
+
+    def memory_usage(self):
+        """Memory used by the cache.
+
+        Returns:
+            int: size in bytes
+        """
+        return sys.getsizeof(self) + 8 * (len(self._digests) + len(self._ids))
+
+
+class LayeredCache(object):
+    """Backend layering a writable cache over a read-only one, e.g. new entries over a mapped snapshot.
+
+    Args:
+        base: read-only backend consulted second
+        overlay: writable backend consulted first and receiving all writes
+    """
+
+    def __init__(self, base, overlay):
+        self.base = base
+        self.overlay = overlay
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        cache_id = self.get(key)
+        if cache_id is None:
+            raise KeyError(key)
+        return cache_id
+
+    def __len__(self):
+        # overlay entries for keys also in the base (e.g. a row updated since the snapshot) are counted once
+        if hasattr(self.overlay, 'items'):
+            shadowed = sum(1 for key, _ in self.overlay.items() if key in self.base)
+        else:
+            shadowed = sum(1 for digest, _ in self.overlay.digest_items() if self.base.get_digest(digest) is not None)
+        return len(self.base) + len(self.overlay) - shadowed
+
+    def __setitem__(self, key, value):
+        self.overlay[key] = value
+
+    def digest_items(self):
+        """Iterate over the (digest, id) pairs in the cache (overlay entries win over base entries).
+        """
+        for item in _digest_items(self.base):
+            yield item
+        for item in _digest_items(self.overlay):
+            yield item
+
+    def get(self, key, default=None):
+        cache_id = self.overlay.get(key)
+        if cache_id is None:
+            cache_id = self.base.get(key)
+        return default if cache_id is None else cache_id
+
+    def update(self, other):
+        self.overlay.update(other)
+
+    def memory_usage(self):
+        """Memory used by the cache (the base is counted in full, even if it is shared with other processes).
+
+        Returns:
+            int: size in bytes
+        """
+        return self.base.memory_usage() + self.overlay.memory_usage()
+
+
+class Snapshot(object):
+    """A dimension cache snapshot mapped read-only into memory.
+
+    Args:
+        cache (HashedArrayCache): cache over the mapped digests and ids
+        header (dict): snapshot header (table, key columns, high-water mark, ...)
+        mapping (mmap.mmap): the memory map backing the cache
+    """
+
+    def __init__(self, cache, header, mapping):
+        self.cache = cache
+        self.header = header
+        self._mapping = mapping
+
+    @property
+    def high_water(self):
+        """High-water mark recorded when the snapshot was written.
+        """
+        return _decode_high_water(self.header['high_water'], self.header['high_water_type'])
+
+
+def _digest_items(cache):
+    if hasattr(cache, 'digest_items'):
+        return cache.digest_items()
+    return ((key_digest(key), value) for key, value in cache.items())
+
+
+def _encode_high_water(value):
+    if value is None:
+        return None, None
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(), 'datetime'
+    if isinstance(value, datetime.date):
+        return value.isoformat(), 'date'
+    return value, type(value).__name__
+
+
+def _decode_high_water(value, value_type):
+    if value_type == 'datetime':
+        return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S')
+    if value_type == 'date':
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    return value
+
+
+def write_snapshot(path, cache, high_water=None, **header):
+    """Write a cache to a snapshot file.
+
+    The file is written next to ``path`` and moved into place, so processes that have the previous snapshot mapped
+    keep a consistent view.
+
+    Args:
+        path (str): snapshot file path
+        cache: backend to write (any backend from this module)
+        high_water (Optional): high-water mark of the rows contained in the cache (int, date or datetime)
+        **header: additional header entries (e.g. table and key columns) checked when the snapshot is read
+
+    Returns:
+        int: number of entries written
+    """
+    if isinstance(cache, HashedArrayCache):
+        table = cache
+    else:
+        table = HashedArrayCache(capacity=int(len(cache) / 0.66) + 1)
+        for digest, value in _digest_items(cache):
+            table._put(digest, value)
+
+    header = dict(header)
+    header['version'] = SNAPSHOT_VERSION
+    header['byteorder'] = sys.byteorder
+    header['slots'] = len(table._digests)
+    header['count'] = len(table)
+    header['high_water'], header['high_water_type'] = _encode_high_water(high_water)
+    encoded = json.dumps(header, sort_keys=True).encode('utf-8')
+    encoded += b' ' * (-len(encoded) % 8)   # keep the arrays 8-byte aligned
+
+    temporary_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack('<Q', len(encoded)))
+        f.write(encoded)
+        f.write(memoryview(table._digests).cast('B'))
+        f.write(memoryview(table._ids).cast('B'))
+    os.replace(temporary_path, path)
+    return len(table)
+
+
+def read_snapshot(path, load_factor=0.66):
+    """Map a snapshot file read-only into memory.
+
+    The digests and ids are used in place (no copy is made), so processes mapping the same file share its pages.
+
+    Args:
+        path (str): snapshot file path
+        load_factor (Optional[float]): load factor of the resulting cache
+
+    Returns:
+        Snapshot: the mapped snapshot
+
+    Raises:
+        ValueError: if the file is not a snapshot this version can read
+    """
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapping[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        mapping.close()
+        raise ValueError('{0} is not a dimension cache snapshot'.format(path))
+    offset = len(SNAPSHOT_MAGIC)
+    header_length = struct.unpack('<Q', mapping[offset:offset + 8])[0]
+    offset += 8
+    header = json.loads(mapping[offset:offset + header_length].decode('utf-8'))
+    offset += header_length
+    if header.get('version') != SNAPSHOT_VERSION or header.get('byteorder') != sys.byteorder:
+        mapping.close()
+        raise ValueError('{0} was written by an incompatible version or platform'.format(path))
+
+    size = header['slots'] * 8
+    view = memoryview(mapping)
+    digests = view[offset:offset + size].cast('q')
+    ids = view[offset + size:offset + 2 * size].cast('q')
+    cache = HashedArrayCache.from_buffers(digests, ids, header['count'], load_factor=load_factor)
+    return Snapshot(cache, header, mapping)
@@ -1,16 +1,176 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import os
+import threading
+import time
 
 from sqlalchemy import create_engine
 from sqlalchemy.engine.url import make_url, URL
 from sqlalchemy.orm import sessionmaker
 
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+except ImportError:     # SQLAlchemy < 1.4, only required by AsyncConnection
+    AsyncSession = create_async_engine = None
+
 from datapro.base.util import dict_merge
 
 logger = logging.getLogger(__name__)
 
 
+class EngineRegistry(object):
+    """Process-wide registry of engines, so connections to the same database share one engine and pool.
+
+    Engines are keyed by the resolved URL and the engine options.  A forked child process never reuses its parent's
+    engines (their pooled connections belong to the parent); it creates its own on first use.
+    """
+
+    def __init__(self, factory=create_engine):
+        self._engines = {}
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._orphans = []      # engines inherited from a parent process, kept referenced so they are never closed
+        self._pid = os.getpid()
+
+    def _after_fork(self):
+        self._orphans.extend(self._engines.values())
+        self._engines = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _pop(self, keys):
+        with self._lock:
+            if keys is None:
+                engines, self._engines = self._engines, {}
+            else:
+                engines = dict((key, self._engines.pop(key)) for key in keys if key in self._engines)
+        return engines
+
+    def keys(self):
+        """
+        Returns:
+            set: keys of the engines in the registry (e.g. to dispose of only the engines created after some point)
+        """
+        with self._lock:
+            return set(self._engines)
+
+    def dispose(self, keys=None):
+        """Dispose of engines (closing their pooled connections) and forget them.
+
+        Args:
+            keys (Optional[iterable]): keys of the engines to dispose of (see keys; default is every engine)
+        """
+        for engine in self._pop(keys).values():
+            logger.debug('Disposing engine {0!r}'.format(engine.url))
+            engine.dispose()
+
+    async def dispose_async(self, keys=None):
+        """Dispose of asyncio engines (see dispose), from within their event loop.
+        """
+        for engine in self._pop(keys).values():
+            logger.debug('Disposing engine {0!r}'.format(engine.url))
+            await engine.dispose()
+
+    def get(self, url, options):
+        """Engine for a URL and engine options, created on first use.
+
+        Args:
+            url (sqlalchemy.engine.url.URL): database URL
+            options (dict): keyword arguments for sqlalchemy.create_engine (e.g. pool_size, max_overflow,
+                pool_pre_ping, pool_recycle)
+
+        Returns:
+            sqlalchemy.engine.Engine: the shared engine
+        """
+        if os.getpid() != self._pid:
+            self._after_fork()
+
+        key = (
+            url.drivername, url.username, url.password, url.host, url.port, url.database,
+            repr(sorted(url.query.items())), repr(sorted(options.items()))
+        )
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                logger.debug('Creating engine {0!r}'.format(url))
+                engine = self._engines[key] = self._factory(url, **options)
+        return engine
+
+    def status(self):
+        """Utilization of every engine's connection pool.
+
+        Returns:
+            list: one dictionary per engine with its URL (password hidden), pool class and, where the pool keeps
+                them, the pool size and the number of connections checked in, checked out and in overflow
+        """
+        report = []
+        for engine in list(self._engines.values()):
+            pool = engine.pool
+            entry = {'url': repr(engine.url), 'pool': type(pool).__name__}
+            for metric in ('size', 'checkedin', 'checkedout', 'overflow'):
+                value = getattr(pool, metric, None)
+                if callable(value):
+                    entry[metric] = value()
+            report.append(entry)
+        return report
+
+
+engines = EngineRegistry()
+async_engines = EngineRegistry(create_async_engine)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=engines._after_fork)
+    os.register_at_fork(after_in_child=async_engines._after_fork)
+
+ASYNC_DRIVERS = {
+    # default asyncio driver of each database, used when the configured driver is not an asyncio one
+    'mysql': 'aiomysql',
+    'postgresql': 'asyncpg',
+    'sqlite': 'aiosqlite'
+}
+
+
+def _resolve(name, config):
+    """Resolve a connection's URL and engine options from the configuration.
+
+    Args:
+        name (str): connection name in the configuration
+        config (Optional[dict]): configuration, merged over Connection._CONFIG
+
+    Returns:
+        tuple: the sqlalchemy.engine.url.URL and the engine options (dict)
+
+    Raises:
+        ConnectionException: if the connection is not configured or its URL cannot be resolved
+    """
+    if config is None:
+        logger.warn('No configuration was passed.')
+        config = {}
+
+    config = dict_merge(Connection._CONFIG, config)
+    try:
+        db_config = dict(config['db'][name])    # own copy, it is modified below
+    except KeyError:
+        raise ConnectionException('Connection name, {0}, not defined in configuration'.format(name))
+
+    engine_options = dict_merge(config.get('engine', {}), db_config.pop('engine', {}))
+
+    # First, try creating the url by passing the configuration to the URL object.
+    try:
+        db_config['database'] = name
+        url = URL(**db_config)
+    except TypeError:
+        # Second, try making the URL by passing a connection string into the make_url function.
+        # NOTE: this is handy for when you are connecting through a DSN
+        try:
+            url = make_url(db_config['connection_string'])
+        except KeyError:
+            raise ConnectionException('Could not resolve configuration.')
+
+    return url, engine_options
+
+
 class Connection(object):
 
     _CONFIG = {
@@ -19,8 +179,14 @@ class Connection(object):
             #     'drivername': 'mysql',
             #     'host': '127.0.0.1',
             #     'password': 'abc123',
-            #     'username': 'root'
+            #     'username': 'root',
+            #     'engine': {'pool_size': 10}   # engine options for this connection only
             # }
+        },
+        'engine': {
+            # options for sqlalchemy.create_engine, e.g. pool_size, max_overflow, pool_pre_ping
+            'convert_unicode': True,
+            'pool_recycle': 14400   # 4-hour recycle
         }
     }
 
@@ -28,48 +194,232 @@ class Connection(object):
 
         # exit(config)
 
-        if config is None:
-            logger.warn('No configuration was passed.')
-            config = {}
+        self.url, engine_options = _resolve(name, config)
+        self.engine = engines.get(self.url, engine_options)
 
-        config.setdefault('db', {})
 
-        try:
-            self._config = dict_merge(Connection._CONFIG, config)['db'][name]
-        except KeyError:
-            raise ConnectionException('Connection name, {0}, not defined in configuration'.format(name))
+class _BlockFlushing(object):
+    """Bookkeeping of the flush blocks of a session, shared by OrmConnection and AsyncOrmConnection.
+    """
 
-        # First, try creating the url by passing the configuration to the URL object.
-        try:
-            self._config['database'] = name
-            self.url = URL(**self._config)
-        except TypeError:
-            # Second, try making the URL by passing a connection string into the make_url function.
-            # NOTE: this is handy for when you are connecting through a DSN
-            try:
-                self.url = make_url(self._config['connection_string'])
-            except KeyError:
-                raise ConnectionException('Could not resolve configuration.')
+    def _init_blocks(self, flush_block_size):
+        self._flush_count = 0
+        self._block_started_at = time.time()
+        self.flush_block_size = flush_block_size
+        self.flush_stats = {'blocks': 0, 'rows': 0, 'flush_seconds': 0.0}     # totals across all blocks
+        self.last_block = None
 
-        self.engine = create_engine(self.url, convert_unicode=True, pool_recycle=14400)  # 4-hour recycle
+    def _resize_block(self):
+        """Size the next blocks from the feedback of the last one (fixed size unless overridden).
+        """
 
+    def _end_block(self, flush_started_at):
+        """Record the statistics of the block just flushed and start the next one.
 
-class OrmConnection(Connection):
+        Args:
+            flush_started_at (float): time the flush of the block started
+
+        Returns:
+            dict: statistics of the block (see OrmConnection.flush_block)
+        """
+        finished_at = time.time()
+        seconds = finished_at - self._block_started_at
+        self.last_block = {
+            'rows': self._flush_count,
+            'seconds': seconds,
+            'rows_per_second': self._flush_count / seconds if seconds else None,
+            'flush_seconds': finished_at - flush_started_at
+        }
+        self.flush_stats['blocks'] += 1
+        self.flush_stats['rows'] += self._flush_count
+        self.flush_stats['flush_seconds'] += self.last_block['flush_seconds']
+        self._resize_block()
+        self.last_block['block_size'] = self.flush_block_size
+        logger.debug('Flushed block: {0}'.format(self.last_block))
 
-    def __init__(self, name, config=None, autocommit=False, flush_block_size=10000, expire_on_commit=False):
-        super(OrmConnection, self).__init__(name, config=config)
         self._flush_count = 0
-        self.flush_block_size = flush_block_size
+        self._block_started_at = finished_at
+        return self.last_block
+
+
+class OrmConnection(_BlockFlushing, Connection):
+    """Connection with an ORM session.
+
+    Args:
+        name (str): connection name in the configuration
+        config (Optional[dict]): configuration
+        autocommit (Optional[boolean]): session autocommit mode
+        flush_block_size (Optional[int]): block_flush calls (rows) after which the session is flushed; the initial
+            size when blocks are sized adaptively
+        expire_on_commit (Optional[boolean]): session expire_on_commit mode
+        flush_interval (Optional[float]): seconds after which block_flush flushes, even if the block is not full
+        max_session_objects (Optional[int]): objects held by the session (identity map plus pending) after which
+            block_flush flushes, even if the block is not full
+        commit_on_flush (Optional[boolean]): commit at every block boundary, so a load is not one giant transaction
+        expunge_on_flush (Optional[boolean]): expunge all objects from the session at every block boundary, so the
+            identity map does not grow without bound
+        target_block_seconds (Optional[float]): size blocks adaptively: after every block, flush_block_size moves
+            halfway to the rows the last block's rate (rows/sec, flush included) would fit in this many seconds
+        min_flush_block_size (Optional[int]): lower bound of an adaptive block size
+        max_flush_block_size (Optional[int]): upper bound of an adaptive block size
+
+    Note:
+        With max_session_objects, a block ended by the session's object count also shrinks flush_block_size to the
+        rows of that block, so later blocks end by size before the session fills up.
+    """
+
+    _SIZE_CHECK_EVERY = 1000    # block_flush calls between checks of the session's object count
+
+    def __init__(self, name, config=None, autocommit=False, flush_block_size=10000, expire_on_commit=False,
+                 flush_interval=None, max_session_objects=None, commit_on_flush=False, expunge_on_flush=False,
+                 target_block_seconds=None, min_flush_block_size=100, max_flush_block_size=1000000):
+        super(OrmConnection, self).__init__(name, config=config)
+        self._init_blocks(flush_block_size)
+        self._session_full = False
+        self.flush_interval = flush_interval
+        self.max_session_objects = max_session_objects
+        self.target_block_seconds = target_block_seconds
+        self.min_flush_block_size = min_flush_block_size
+        self.max_flush_block_size = max_flush_block_size
+        self.commit_on_flush = commit_on_flush
+        self.expunge_on_flush = expunge_on_flush
         self.session = sessionmaker(bind=self.engine, autocommit=autocommit, expire_on_commit=expire_on_commit)()
 
+    def _block_full(self):
+        if self._flush_count >= self.flush_block_size:
+            return True
+        if self.flush_interval is not None and time.time() - self._block_started_at >= self.flush_interval:
+            return True
+        if self.max_session_objects is not None and self._flush_count % self._SIZE_CHECK_EVERY == 0:
+            # session.new builds a set of the pending objects, so it is only counted every _SIZE_CHECK_EVERY calls
+            self._session_full = len(self.session.identity_map) + len(self.session.new) >= self.max_session_objects
+            return self._session_full
+        return False
+
+    def _resize_block(self):
+        """Size the next blocks from the feedback of the last one (see target_block_seconds and max_session_objects).
+        """
+        size = self.flush_block_size
+        rate = self.last_block['rows_per_second']
+        if self.target_block_seconds is not None and rate:
+            size = (size + rate * self.target_block_seconds) / 2.0
+            size = max(self.min_flush_block_size, min(self.max_flush_block_size, size))
+        if self._session_full:
+            size = min(size, max(self.min_flush_block_size, self._flush_count))
+            self._session_full = False
+        self.flush_block_size = int(size)
+
     def block_flush(self):
+        self._flush_count += 1
+        if self._block_full():
+            self.flush_block()
+            return True
+        return False
+
+    def flush_block(self):
+        """Flush (and optionally commit and expunge) the session, ending the current block.
+
+        Returns:
+            dict: statistics of the block: rows, seconds, rows_per_second, flush_seconds (time spent flushing,
+                committing and expunging) and block_size (size of the next block)
+        """
+        flush_started_at = time.time()
+        self.session.flush()
+        if self.commit_on_flush and not self.session.autocommit:
+            self.session.commit()
+        if self.expunge_on_flush:
+            self.session.expunge_all()
+        return self._end_block(flush_started_at)
+
+
+class AsyncConnection(object):
+    """Connection with an asyncio engine, configured like Connection (SQLAlchemy 1.4 or later).
+
+    A URL naming a database without an asyncio driver gets the default one from ASYNC_DRIVERS (e.g. sqlite becomes
+    sqlite+aiosqlite).  Engines are shared through ``async_engines``; dispose of them with
+    ``await async_engines.dispose_async()`` before the event loop closes.
+
+    Args:
+        name (str): connection name in the configuration
+        config (Optional[dict]): configuration
+
+    Raises:
+        ConnectionException: if SQLAlchemy has no asyncio support
+    """
+
+    def __init__(self, name, config=None):
+        if create_async_engine is None:
+            raise ConnectionException('Async connections require SQLAlchemy 1.4 or later')
+
+        url, engine_options = _resolve(name, config)
+        if '+' not in url.drivername and url.drivername in ASYNC_DRIVERS:
+            url = url.set(drivername='{0}+{1}'.format(url.drivername, ASYNC_DRIVERS[url.drivername]))
+        engine_options.pop('convert_unicode', None)     # not an option of asyncio engines
+        self.url = url
+        self.engine = async_engines.get(self.url, engine_options)
+
+    async def execute(self, statement, *multiparams, **params):
+        """Execute a statement in a transaction of its own.
+
+        Returns:
+            list: rows returned by the statement (empty if it returns none)
+        """
+        async with self.engine.begin() as db:
+            result = await db.execute(statement, *multiparams, **params)
+            return result.fetchall() if result.returns_rows else []
+
+    async def stream(self, statement, batch_size=10000):
+        """Stream the rows of a query in batches, with a server-side cursor where the driver has one.
+
+        Args:
+            statement: sqlalchemy selectable
+            batch_size (Optional[int]): rows per batch
+
+        Yields:
+            list: batch of rows
+        """
+        async with self.engine.connect() as db:
+            result = await db.stream(statement)
+            async for rows in result.partitions(batch_size):
+                yield rows
+
+
+class AsyncOrmConnection(_BlockFlushing, AsyncConnection):
+    """Asyncio connection with an ORM session (see OrmConnection).
+
+    Args:
+        name (str): connection name in the configuration
+        config (Optional[dict]): configuration
+        flush_block_size (Optional[int]): block_flush calls (rows) after which the session is flushed
+        expire_on_commit (Optional[boolean]): session expire_on_commit mode
+        commit_on_flush (Optional[boolean]): commit at every block boundary, so a load is not one giant transaction
+    """
+
+    def __init__(self, name, config=None, flush_block_size=10000, expire_on_commit=False, commit_on_flush=False):
+        super(AsyncOrmConnection, self).__init__(name, config=config)
+        self._init_blocks(flush_block_size)
+        self.commit_on_flush = commit_on_flush
+        self.session = AsyncSession(bind=self.engine, expire_on_commit=expire_on_commit)
+
+    async def block_flush(self):
         self._flush_count += 1
         if self._flush_count >= self.flush_block_size:
-            self._flush_count = 0
-            self.session.flush()
+            await self.flush_block()
             return True
         return False
 
+    async def flush_block(self):
+        """Flush (and optionally commit) the session, ending the current block.
+
+        Returns:
+            dict: statistics of the block (see OrmConnection.flush_block)
+        """
+        flush_started_at = time.time()
+        await self.session.flush()
+        if self.commit_on_flush:
+            await self.session.commit()
+        return self._end_block(flush_started_at)
+
 
 class ConnectionException(Exception):
     pass
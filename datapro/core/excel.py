@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""Streaming extraction of Excel (.xls) workbooks through xlrd.
+"""
+
+import datetime
+import logging
+import multiprocessing
+import queue
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import xlrd
+
+try:
+    import numpy
+except ImportError:     # serial dates are then converted one by one
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# Serial numbers are day counts from these dates: in the 1900 system day 61 is 1900-03-01 (days 1 to 60, which
+# include Excel's fictitious 1900-02-29, are ambiguous), in the 1904 system day 1 is 1904-01-02
+_EPOCHS = (datetime.date(1899, 12, 30), datetime.date(1904, 1, 1))
+_FIRST_DAY = (61, 1)
+_DAYS_TOO_LARGE = (2958466, 2958466 - 1462)     # 10000-01-01, see xlrd.xldate
+
+ExcelBatch = namedtuple('ExcelBatch', ('path', 'sheet', 'rows'))
+ExcelBatch.__doc__ = """Batch of rows read from a worksheet.
+
+Attributes:
+    path (str): workbook path
+    sheet (str): worksheet name
+    rows (list): dictionaries keyed by the header row, or lists of cell values without a header
+"""
+
+
+def _serials(values, datemode):
+    """Split serial numbers into whole days and seconds, as xlrd.xldate_as_tuple does.
+
+    Returns:
+        tuple: lists of days and seconds, and of flags telling which values are valid dates
+    """
+    if datemode not in (0, 1):
+        raise xlrd.xldate.XLDateBadDatemode(datemode)
+    first_day, too_large = _FIRST_DAY[datemode], _DAYS_TOO_LARGE[datemode]
+
+    if numpy is not None:
+        x = numpy.array([v if type(v) in (float, int) else numpy.nan for v in values], dtype='float64')
+        with numpy.errstate(invalid='ignore'):
+            valid = x > 0
+            x = numpy.where(valid, x, 0.0)
+            days = numpy.trunc(x)
+            seconds = numpy.round((x - days) * 86400.0)
+            carry = seconds == 86400.0
+            days[carry] += 1
+            seconds[carry] = 0
+            valid &= (days >= first_day) & (days < too_large)
+        days = numpy.where(valid, days, 0).astype('int64')
+        seconds = numpy.where(valid, seconds, 0).astype('int64')
+        return days, seconds, valid
+
+    days, seconds, valid = [], [], []
+    for v in values:
+        d = s = 0
+        ok = type(v) in (float, int) and v > 0
+        if ok:
+            try:
+                d = int(v)
+                s = int(round((v - d) * 86400.0))
+            except (OverflowError, ValueError):
+                ok = False
+            else:
+                if s == 86400:
+                    d, s = d + 1, 0
+                ok = first_day <= d < too_large
+        days.append(d if ok else 0)
+        seconds.append(s if ok else 0)
+        valid.append(ok)
+    return days, seconds, valid
+
+
+def xldates_to_dates(values, datemode):
+    """Convert Excel serial numbers to dates in bulk.
+
+    Gives the same dates as ``datetime.date(*xlrd.xldate_as_tuple(value, datemode)[:3])``, with None for the values
+    that would fail (non-numbers, times without a date, ambiguous, negative or out of range serial numbers).
+
+    Args:
+        values (iterable): serial numbers (e.g. the cell values of a date column)
+        datemode (int): the workbook's datemode (0 for the 1900 system, 1 for the 1904 system)
+
+    Returns:
+        list: datetime.date (or None) for each value
+    """
+    values = list(values)
+    days, seconds, valid = _serials(values, datemode)
+    if numpy is not None:
+        dates = (numpy.datetime64(_EPOCHS[datemode], 'D') + days.astype('timedelta64[D]')).tolist()
+        return [d if ok else None for d, ok in zip(dates, valid.tolist())]
+
+    epoch = _EPOCHS[datemode].toordinal()
+    return [datetime.date.fromordinal(epoch + d) if ok else None for d, ok in zip(days, valid)]
+
+
+def xldates_to_datetimes(values, datemode):
+    """Convert Excel serial numbers to datetimes in bulk (see xldates_to_dates).
+
+    Gives the same datetimes as ``datetime.datetime(*xlrd.xldate_as_tuple(value, datemode)[:6])``, with None for
+    the values that would fail.
+
+    Returns:
+        list: datetime.datetime (or None) for each value
+    """
+    values = list(values)
+    days, seconds, valid = _serials(values, datemode)
+    if numpy is not None:
+        epoch = numpy.datetime64(_EPOCHS[datemode], 's')
+        datetimes = (epoch + (days * 86400 + seconds).astype('timedelta64[s]')).tolist()
+        return [d if ok else None for d, ok in zip(datetimes, valid.tolist())]
+
+    epoch = datetime.datetime.combine(_EPOCHS[datemode], datetime.time())
+    return [
+        epoch + datetime.timedelta(days=d, seconds=s) if ok else None
+        for d, s, ok in zip(days, seconds, valid)
+    ]
+
+
+def _column_indexes(columns, keys, sheet, strict):
+    indexes = set()
+    for column in columns:
+        if isinstance(column, int):
+            indexes.add(column)
+        elif keys is not None and column in keys:
+            indexes.add(keys.index(column))
+        elif strict:
+            raise ExcelException('Column {0!r} is not in the header row of worksheet {1}'.format(column, sheet.name))
+        else:
+            logger.debug('Column {0!r} is not in the header row of worksheet {1}'.format(column, sheet.name))
+    return indexes
+
+
+def _sheet_batches(sheet, datemode, header, skip_rows, dates, datetimes, detect_dates, batch_size, strict):
+    start = skip_rows
+    keys = None
+    if header and sheet.nrows > start:
+        keys = [str(v) for v in sheet.row_values(start)]
+        start += 1
+
+    date_indexes = _column_indexes(dates, keys, sheet, strict)
+    datetime_indexes = _column_indexes(datetimes, keys, sheet, strict)
+    explicit = date_indexes | datetime_indexes
+
+    for first in range(start, sheet.nrows, batch_size):
+        rows = [sheet.row_values(r) for r in range(first, min(first + batch_size, sheet.nrows))]
+
+        for indexes, convert in ((date_indexes, xldates_to_dates), (datetime_indexes, xldates_to_datetimes)):
+            for c in indexes:
+                column = convert([row[c] if c < len(row) else None for row in rows], datemode)
+                failed = []
+                for r, row, value in zip(range(first, first + len(rows)), rows, column):
+                    if c >= len(row):
+                        continue
+                    if value is not None or row[c] == '':
+                        row[c] = value
+                    else:
+                        failed.append(r + 1)    # the cell keeps its value
+                if failed:
+                    logger.warn('Worksheet {0}, column {1}: {2} values are not {3}, kept as read (rows {4}{5})'.format(
+                        sheet.name,
+                        keys[c] if keys is not None and c < len(keys) else c,
+                        len(failed),
+                        'dates' if convert is xldates_to_dates else 'datetimes',
+                        ', '.join(str(r) for r in failed[:10]),
+                        ', ...' if len(failed) > 10 else ''
+                    ))
+
+        if detect_dates:
+            # every other cell xlrd typed as a date, converted to a datetime in one call per batch
+            cells = [
+                (row, c)
+                for row, r in zip(rows, range(first, first + len(rows)))
+                for c, ctype in enumerate(sheet.row_types(r))
+                if ctype == xlrd.XL_CELL_DATE and c not in explicit
+            ]
+            if cells:
+                converted = xldates_to_datetimes([row[c] for row, c in cells], datemode)
+                for (row, c), value in zip(cells, converted):
+                    row[c] = value
+
+        if keys is not None:
+            rows = [dict(zip(keys, row)) for row in rows]
+        yield rows
+
+
+def read_workbook(path, sheets=None, header=True, skip_rows=0, dates=(), datetimes=(), detect_dates=True,
+                  batch_size=10000, strict=False):
+    """Stream the rows of a workbook in batches, one worksheet at a time.
+
+    The workbook is opened on demand, so only the worksheet being read is loaded, and it is unloaded once read.
+
+    Args:
+        path (str): workbook path
+        sheets (Optional[iterable]): names or indexes of the worksheets to read (default is every worksheet)
+        header (Optional[boolean]): the first row (after skip_rows) holds column names, used as the keys of the rows
+        skip_rows (Optional[int]): rows to skip at the top of every worksheet
+        dates (Optional[iterable]): names or indexes of columns holding dates (serial numbers converted in bulk);
+            cells that are not dates keep the value read, and are logged with their row numbers
+        datetimes (Optional[iterable]): names or indexes of columns holding datetimes
+        detect_dates (Optional[boolean]): convert the other cells formatted as dates to datetimes
+        batch_size (Optional[int]): rows per batch
+        strict (Optional[boolean]): raise if a worksheet lacks a column named in dates or datetimes, rather than
+            reading the worksheet without converting that column
+
+    Yields:
+        ExcelBatch: batch of rows
+
+    Raises:
+        ExcelException: if strict and a worksheet lacks a named date column
+    """
+    book = xlrd.open_workbook(path, on_demand=True)
+    try:
+        for name in (book.sheet_names() if sheets is None else sheets):
+            sheet = book.sheet_by_index(name) if isinstance(name, int) else book.sheet_by_name(name)
+            try:
+                for rows in _sheet_batches(sheet, book.datemode, header, skip_rows, dates, datetimes, detect_dates,
+                                           batch_size, strict):
+                    yield ExcelBatch(path, sheet.name, rows)
+            finally:
+                book.unload_sheet(sheet.name)
+            logger.debug('Read worksheet {0} of {1}'.format(sheet.name, path))
+    finally:
+        book.release_resources()
+
+
+_batches = None     # queue a worker process puts its batches on, set by _init_worker
+
+
+def _init_worker(batches):
+    global _batches
+    _batches = batches
+
+
+def _read_into_queue(index, path, options):
+    try:
+        for batch in read_workbook(path, **options):
+            _batches.put((index, batch))
+    finally:
+        _batches.put((index, None))
+
+
+def read_workbooks(paths, workers=None, maxsize=16, **options):
+    """Stream the rows of several workbooks in batches, reading the workbooks in a pool of processes.
+
+    Batches of different workbooks are interleaved, in the order they are read; the batches of one workbook keep
+    their order.  Workers wait while ``maxsize`` batches are queued (backpressure).
+
+    Args:
+        paths (iterable): workbook paths
+        workers (Optional[int]): worker processes (default is one per CPU); 0 reads the workbooks in this process
+        maxsize (Optional[int]): batches queued before the workers wait
+        **options: read_workbook options (sheets, header, skip_rows, dates, datetimes, detect_dates, batch_size,
+            strict)
+
+    Yields:
+        ExcelBatch: batch of rows
+
+    Raises:
+        the exception of a workbook that could not be read, once its earlier batches have been yielded
+    """
+    paths = list(paths)
+    if workers == 0:
+        for path in paths:
+            for batch in read_workbook(path, **options):
+                yield batch
+        return
+
+    batches = multiprocessing.get_context().Queue(maxsize)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(batches,)) as pool:
+        futures = [pool.submit(_read_into_queue, i, path, options) for i, path in enumerate(paths)]
+        try:
+            remaining = len(futures)
+            while remaining:
+                try:
+                    index, batch = batches.get(timeout=1)
+                except queue.Empty:
+                    for future in futures:  # a worker that died never reports its workbook as done
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+                    continue
+                if batch is None:
+                    futures[index].result()     # raises if the workbook could not be read
+                    remaining -= 1
+                else:
+                    yield batch
+        finally:
+            # stop early (e.g. the consumer closed the generator): drop pending workbooks, unblock running workers
+            for future in futures:
+                future.cancel()
+            while not all(future.done() for future in futures):
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+
+class ExcelException(Exception):
+    pass
@@ -1,18 +1,435 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
+import datetime
+import io
 import logging
+import os
+import pstats
+import re
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-from datapro import BaseJob
+from datapro import BaseJob, STATUS_FAIL, STATUS_RUN, STATUS_STOP
+from datapro.core.cache import key_digest
+from datapro.core.db import async_engines, engines, OrmConnection
+from datapro.core.metrics import Metrics
+from datapro.core.pipeline import Pipeline
+from datapro.core.validation import FailureCollector
 
 
 logger = logging.getLogger(__name__)
 
+# Outcome of one partition: status is STATUS_STOP (done) or STATUS_FAIL, counts is the dictionary returned by the
+# work function, error is the formatted traceback of the last failed attempt
+PartitionResult = namedtuple('PartitionResult', ('partition', 'status', 'counts', 'attempts', 'seconds', 'error'))
+
+
+def file_partitions(paths):
+    """One partition per file.
+
+    Args:
+        paths (iterable): file paths
+
+    Returns:
+        list: the file paths, largest first (so long partitions do not start last)
+    """
+    return sorted(paths, key=lambda path: os.path.getsize(path) if os.path.exists(path) else 0, reverse=True)
+
+
+def date_partitions(start_date, end_date, days=1):
+    """Partition a date range into consecutive ranges.
+
+    Args:
+        start_date (datetime.date): first date
+        end_date (datetime.date): last date (inclusive)
+        days (Optional[int]): days per partition
+
+    Returns:
+        list: (first date, last date) tuples, both inclusive
+    """
+    partitions = []
+    step = datetime.timedelta(days=days)
+    while start_date <= end_date:
+        partitions.append((start_date, min(start_date + step - datetime.timedelta(days=1), end_date)))
+        start_date += step
+    return partitions
+
+
+def hash_partitions(count):
+    """Partition a key space into hash buckets (see in_partition).
+
+    Args:
+        count (int): number of partitions
+
+    Returns:
+        list: (bucket, count) tuples
+    """
+    return [(bucket, count) for bucket in range(count)]
+
+
+def in_partition(key, partition):
+    """Whether a key belongs to a hash partition.
+
+    Args:
+        key (tuple): key (e.g. the natural key of a record)
+        partition (tuple): (bucket, count) tuple from hash_partitions
+
+    Returns:
+        bool: True if the key hashes to the partition's bucket (the same in every process)
+    """
+    bucket, count = partition
+    return key_digest(key) % count == bucket
+
+
+_worker_connections = {}    # connections of the current worker process, opened by _init_worker
+
+
+def _init_worker(connection_class, connections):
+    _worker_connections.clear()
+    for name, kwargs in connections.items():
+        _worker_connections[name] = connection_class(name, **kwargs)
+
+
+def _run_partition(work, partition, retries):
+    started_at = time.time()
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            counts = work(partition, _worker_connections)
+            return PartitionResult(partition, STATUS_STOP, dict(counts or {}), attempts, time.time() - started_at, None)
+        except Exception:
+            error = traceback.format_exc()
+            for connection in _worker_connections.values():
+                if hasattr(connection, 'session'):
+                    connection.session.rollback()
+            if attempts > retries:
+                return PartitionResult(partition, STATUS_FAIL, {}, attempts, time.time() - started_at, error)
+            logger.warn('Partition {0!r} failed (attempt {1}), retrying:\n{2}'.format(partition, attempts, error))
+
 
 class EtlJob(BaseJob):
 
+    dispose_engines_on_stop = False     # dispose of every engine of the process (shared with other jobs) on stop
+    metrics_sample_rate = 1             # time one in this many entries of every metrics section
+    profile_dir = '.'                   # directory the profile (.prof file) is written to when the job stops
+    profile_lines = 25                  # functions listed in the profile summary logged when the job stops
+
+    def __init__(self, identifier, debug=False, profile=False):
+        super(EtlJob, self).__init__(identifier, debug=debug, profile=profile)
+        self.failures = FailureCollector()  # shared by the job's validators, summarised when the job stops
+        self.metrics = Metrics(sample_rate=self.metrics_sample_rate)
+        self.metrics.gauge('failures', lambda: sum(self.failures.totals.values()))
+        self.profile_path = None
+
+    @property
+    def report(self):
+        """Structured report of the job: status, timing and metrics (see Metrics.report).
+
+        Returns:
+            dict: identifier, status, started_at, stopped_at, up_time (seconds), profile (path of the .prof file)
+                and metrics
+        """
+        return {
+            'identifier': self.identifier,
+            'status': self._status,
+            'started_at': self.started_at,
+            'stopped_at': self.stopped_at,
+            'up_time': self.up_time.total_seconds(),
+            'profile': self.profile_path,
+            'metrics': self.metrics.report()
+        }
+
     def start(self):
         super(EtlJob, self).start()
 
+    def run_pipeline(self, source, *stages):
+        """Stream a source through stages (see datapro.core.pipeline) until it is exhausted.
+
+        Args:
+            source (iterable): rows (or batches of rows) fed to the first stage
+            *stages: stages, in order
+
+        Returns:
+            int: number of items out of the last stage
+        """
+        self._status = STATUS_RUN
+        count = Pipeline(self.metrics.counted('rows_in', source), stages).run()
+        self.metrics.count('rows_out', count)
+        logger.info('Pipeline of {0} stages done: {1} items out'.format(len(stages), count))
+        return count
+
     def stop(self):
+        if self.profiler is not None:
+            self._dump_profile()
+        self.failures.emit()
+        for pool in engines.status():
+            logger.info('Connection pool: {0}'.format(pool))
+        if self.dispose_engines_on_stop:
+            engines.dispose()
         super(EtlJob, self).stop()
-        # if profiler exists then lets do something about it
+        logger.info('Job report: {0}'.format(self.report))
+
+    def _dump_profile(self):
+        self.profiler.disable()
+        self.profile_path = os.path.join(self.profile_dir, '{0}-{1:%Y%m%dT%H%M%S}.prof'.format(
+            re.sub(r'[^\w.-]', '_', str(self.identifier)),
+            self.started_at or datetime.datetime.utcnow()
+        ))
+        self.profiler.dump_stats(self.profile_path)
+
+        summary = io.StringIO()
+        pstats.Stats(self.profiler, stream=summary).sort_stats('cumulative').print_stats(self.profile_lines)
+        logger.info('Profile written to {0}:\n{1}'.format(self.profile_path, summary.getvalue()))
+
+
+class PartitionedJob(EtlJob):
+    """ETL job running a work function over partitions of its input in a pool of processes.
+
+    Every worker process opens its own connections when it starts; the work function is called with a partition
+    and a dictionary of those connections (keyed by name), and returns a dictionary of counts (e.g. rows inserted),
+    which are summed over the partitions.  A partition raising an exception is retried, then marked STATUS_FAIL
+    (and the job fails once it stops).
+
+    Args:
+        identifier (str): job identifier
+        work (callable): module-level function (so it can be pickled) taking a partition and the worker's
+            connections, committing its own work
+        partitions (iterable): picklable partitions (e.g. from file_partitions, date_partitions or hash_partitions)
+        connections (Optional[dict]): per-worker connections, keyed by name, with the keyword arguments of
+            connection_class (e.g. {'warehouse': {'config': config}})
+        connection_class (Optional[type]): class of the per-worker connections
+        workers (Optional[int]): worker processes (default is one per CPU); 0 runs the partitions in this process
+        retries (Optional[int]): attempts at a failed partition after the first
+        debug (Optional[bool]): see BaseJob; also runs the partitions in this process
+        profile (Optional[bool]): see BaseJob
+
+    Example:
+        def load_file(path, connections):
+            ...
+            return {'rows': n}
+
+        with PartitionedJob('load', load_file, file_partitions(paths), {'warehouse': {'config': config}}) as job:
+            job.run()
+    """
+
+    def __init__(self, identifier, work, partitions, connections=None, connection_class=OrmConnection,
+                 workers=None, retries=1, debug=False, profile=False):
+        super(PartitionedJob, self).__init__(identifier, debug=debug, profile=profile)
+        self.work = work
+        self.partitions = list(partitions)
+        self.connections = connections or {}
+        self.connection_class = connection_class
+        self.workers = 0 if debug else workers if workers is not None else os.cpu_count()
+        self.retries = retries
+        self.results = []
+        self.counts = {}
+
+    @property
+    def failed(self):
+        """
+        Returns:
+            list: results of the failed partitions
+        """
+        return [r for r in self.results if r.status == STATUS_FAIL]
+
+    @property
+    def status(self):
+        return '[Job: {0}, Up Time: {1}, Status: {2}, Partitions: {3}/{4} ({5} failed), Counts: {6}]'.format(
+            self.identifier,
+            self.up_time,
+            self._status,
+            len(self.results),
+            len(self.partitions),
+            len(self.failed),
+            self.counts
+        )
+
+    def _collect(self, result):
+        self.results.append(result)
+        for name, count in result.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + count
+            self.metrics.count(name, count)
+        self.metrics.section('partition').record(result.seconds)
+        if result.status == STATUS_FAIL:
+            logger.error('Partition {0!r} failed after {1} attempt(s):\n{2}'.format(
+                result.partition, result.attempts, result.error
+            ))
+        else:
+            logger.debug('Partition {0!r} done in {1:.1f}s: {2}'.format(
+                result.partition, result.seconds, result.counts
+            ))
+
+    def _pool(self, workers):
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(self.connection_class, self.connections))
+
+    def _finish(self, run, future, positions, final=False):
+        """Collect the result of a partition run in a process pool.
+
+        Returns:
+            tuple: the run, charged an attempt, if the pool broke before it finished (None otherwise)
+        """
+        position, partition, lost = run
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            if not final:
+                return position, partition, lost + 1
+            result = PartitionResult(partition, STATUS_FAIL, {}, 1, 0.0, traceback.format_exc())
+        result = result._replace(attempts=result.attempts + lost)
+        positions[id(result)] = position
+        self._collect(result)
+        return None
+
+    def run(self):
+        """Run the work function over every partition.
+
+        A worker process dying (e.g. killed for using too much memory) breaks the whole pool, losing every partition
+        not finished yet.  Those are resubmitted to a new pool, each charged an attempt; the last attempt of a
+        partition lost that way runs in a pool of its own, so a dying worker only ever fails its own partition.
+
+        Returns:
+            list: one PartitionResult per partition, in partition order
+        """
+        self._status = STATUS_RUN
+        if not self.workers:
+            _init_worker(self.connection_class, self.connections)
+            for partition in self.partitions:
+                self._collect(_run_partition(self.work, partition, self.retries))
+            return self.results
+
+        # engines inherited by forked workers are never used (or closed) there, see EngineRegistry
+        positions = {}
+        runs = [(position, partition, 0) for position, partition in enumerate(self.partitions)]
+        while runs:
+            # the first attempt and the attempts before the last share a pool
+            shared = [run for run in runs if run[2] < max(self.retries, 1)]
+            alone = [run for run in runs if run[2] >= max(self.retries, 1)]
+            runs = []
+
+            if shared:
+                with self._pool(self.workers) as pool:
+                    futures = [pool.submit(_run_partition, self.work, p, max(self.retries - lost, 0))
+                               for _, p, lost in shared]
+                    for run, future in zip(shared, futures):
+                        run = self._finish(run, future, positions)
+                        if run is not None:
+                            runs.append(run)
+
+            for first in range(0, len(alone), self.workers):
+                batch = alone[first:first + self.workers]
+                pools = [self._pool(1) for _ in batch]
+                try:
+                    futures = [pool.submit(_run_partition, self.work, p, 0) for pool, (_, p, _) in zip(pools, batch)]
+                    for run, future in zip(batch, futures):
+                        self._finish(run, future, positions, final=True)
+                finally:
+                    for pool in pools:
+                        pool.shutdown()
+
+            if runs:
+                logger.warn('A worker process died, resubmitting {0} partition(s)'.format(len(runs)))
+
+        self.results.sort(key=lambda result: positions[id(result)])
+        return self.results
+
+    def stop(self):
+        # failed before stopping, so the job report logged on stop shows it
+        if self.failed:
+            self._status = STATUS_FAIL
+        super(PartitionedJob, self).stop()
+        if self.failed:
+            logger.error(self.status)
+
+
+class AsyncEtlJob(EtlJob):
+    """ETL job running asyncio extracts and loads concurrently, so their database round trips overlap.
+
+    Example:
+        async def main(job):
+            sources = [AsyncConnection(name, config) for name in ('crm', 'billing')]
+            target = AsyncConnection('warehouse', config)
+
+            async def load(rows):
+                await target.execute(Customer.__table__.insert(), [dict(r) for r in rows])
+
+            return await job.transfer([s.stream(select([customers])) for s in sources], load)
+
+        with AsyncEtlJob('customers') as job:
+            job.run(main(job))
+    """
+
+    def run(self, coroutine):
+        """Run a coroutine on a new event loop, disposing of the asyncio engines created on it before it closes.
+
+        Returns:
+            the result of the coroutine
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self._run(coroutine))
+        finally:
+            loop.close()
+
+    async def _run(self, coroutine):
+        self._status = STATUS_RUN
+        existing = async_engines.keys()
+        try:
+            return await coroutine
+        finally:
+            # engines created on this loop cannot be used once it is closed; engines of other loops are left alone
+            await async_engines.dispose_async(async_engines.keys() - existing)
+
+    async def transfer(self, extracts, load, maxsize=10):
+        """Run extracts concurrently, feeding their batches to a load through a bounded queue.
+
+        Extracts wait while the queue is full (backpressure), and the load handles one batch at a time, in arrival
+        order.  If an extract or the load fails, the other extracts are cancelled and the exception is raised.
+
+        Args:
+            extracts (iterable): async iterables of batches (e.g. AsyncConnection.stream)
+            load (callable): coroutine function called with each batch
+            maxsize (Optional[int]): batches queued before the extracts wait for the load
+
+        Returns:
+            dict: counts of batches and rows loaded
+        """
+        batches = asyncio.Queue(maxsize)
+
+        async def extract(source):
+            try:
+                async for chunk in source:
+                    await batches.put((chunk, None))
+            except Exception as e:
+                await batches.put((None, e))
+            else:
+                await batches.put((None, None))
+
+        counts = {'batches': 0, 'rows': 0}
+        producers = [asyncio.ensure_future(extract(source)) for source in extracts]
+        try:
+            remaining = len(producers)
+            while remaining:
+                chunk, error = await batches.get()
+                if error is not None:
+                    raise error
+                if chunk is None:
+                    remaining -= 1
+                    continue
+                await load(chunk)
+                counts['batches'] += 1
+                counts['rows'] += len(chunk)
+        finally:
+            for producer in producers:
+                producer.cancel()
+            await asyncio.gather(*producers, return_exceptions=True)
+
+        logger.info('Transferred {0} rows in {1} batches from {2} extracts'.format(
+            counts['rows'], counts['batches'], len(producers)
+        ))
+        return counts
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""Bulk loading and upserting of Model tables through SQLAlchemy Core, bypassing the ORM unit of work.
+"""
+
+import io
+import logging
+import time
+from collections import OrderedDict
+
+from sqlalchemy import Integer, and_, bindparam, or_, select, tuple_
+
+from datapro.core.cache import canonical_value
+
+try:
+    from sqlalchemy.dialects.postgresql import insert as _postgresql_insert
+    from sqlalchemy.dialects.mysql import insert as _mysql_insert
+except ImportError:     # SQLAlchemy < 1.2
+    _postgresql_insert = _mysql_insert = None
+try:
+    from sqlalchemy.dialects.sqlite import insert as _sqlite_insert
+except ImportError:     # SQLAlchemy < 1.4
+    _sqlite_insert = None
+
+logger = logging.getLogger(__name__)
+
+ROW_VALUE_DIALECTS = ('mysql', 'oracle', 'postgresql', 'sqlite')     # dialects supporting (k1, k2) IN (...)
+
+
+def key_filter(columns, keys, dialect_name=None):
+    """Build a filter expression matching any of the given key tuples.
+
+    Args:
+        columns (list): sqlalchemy columns making up the key (ordered to match the key tuples)
+        keys (iterable): key tuples to match
+        dialect_name (Optional[str]): name of the database dialect; composite keys are matched with a row value
+            IN list where the dialect supports it, and with OR-ed equality tests otherwise
+
+    Returns:
+        sqlalchemy.sql.elements.ClauseElement: filter expression
+    """
+    if len(columns) == 1:
+        return columns[0].in_([k[0] for k in keys])
+    if dialect_name in ROW_VALUE_DIALECTS:
+        return tuple_(*columns).in_(list(keys))
+    return or_(*[and_(*[c == v for c, v in zip(columns, k)]) for k in keys])
+
+
+def _python_type(column):
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    return python_type if python_type in (int, float, str) else None
+
+
+def _case_insensitive(column):
+    collation = getattr(column.type, 'collation', None) or ''
+    return collation.upper() == 'NOCASE' or collation.lower().endswith('_ci')
+
+
+def _normalize_value(value, python_type, fold):
+    """Canonical form of a key value, converted to the Python type of its column when the database would convert it
+    (a number for a string column, or a numeric string for a number column), and lower-cased for a column compared
+    case-insensitively.
+    """
+    value = canonical_value(value)
+    if python_type is not None and value is not None and not isinstance(value, python_type):
+        if python_type is str and isinstance(value, (int, float)):
+            value = str(value)
+        elif python_type in (int, float) and isinstance(value, str):
+            try:
+                value = canonical_value(python_type(value))
+            except ValueError:
+                pass
+    if fold and isinstance(value, str):
+        value = value.lower()
+    return value
+
+
+def key_normalizer(columns):
+    """Build a function giving key tuples the form of the key values read back from the database, so keys given by
+    the caller and keys selected from the table can be matched whatever the types of the values given (e.g. a NumPy
+    integer, or a numeric string for an integer column) and the collation of the columns (``NOCASE`` or ``*_ci``).
+
+    Args:
+        columns (list): sqlalchemy columns making up the key (ordered to match the key tuples)
+
+    Returns:
+        callable: function of a key tuple returning its normalized form
+    """
+    types = [(_python_type(c), _case_insensitive(c)) for c in columns]
+
+    def normalize(key):
+        return tuple([_normalize_value(v, t, fold) for v, (t, fold) in zip(key, types)])
+    return normalize
+
+
+def _copy_value(value):
+    """Render a value in PostgreSQL's COPY text format.
+    """
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class BulkLoader(object):
+    """Buffers rows for a Model's table and writes them in fixed-size chunks with Core inserts.
+
+    Rows are written with executemany, or with the driver's fast path: ``COPY ... FROM STDIN`` for PostgreSQL
+    (psycopg2) and multi-row ``INSERT ... VALUES`` for MySQL.  The table's schema and name come from the model's
+    ``__table__`` (i.e. ``__table_args__`` and ``__tablename__``).
+
+    Args:
+        connection (datapro.core.db.Connection): database connection; for an OrmConnection the session's transaction
+            is used (rows are committed with the session), otherwise every chunk is committed on its own
+        model (sqlalchemy.ext.declarative.api.DeclarativeMeta): sqlalchemy data model
+        columns (Optional[iterable]): column names, in the order of tuple rows (default is every column of the table
+            but a server-generated primary key, such as the id of an IdMixin model)
+        chunk_size (Optional[int]): rows buffered before a chunk is written
+        method (Optional[str]): 'auto' (pick the fastest method for the dialect), 'copy', 'executemany' or 'values'
+
+    Note:
+        Dictionary rows are written to the columns named by their keys, which must be the same for every row of a
+        chunk (columns left out get their defaults).
+    """
+
+    METHODS = ('auto', 'copy', 'executemany', 'values')
+
+    _VALUES_ROWS = 1000     # rows per multi-row VALUES statement
+
+    def __init__(self, connection, model, columns=None, chunk_size=10000, method='auto'):
+        if method not in self.METHODS:
+            raise ValueError('Load method must be one of {0}'.format(', '.join(self.METHODS)))
+
+        self._connection = connection
+        self._model = model
+        self._table = model.__table__
+        self._columns = list(columns) if columns is not None else self._default_columns()
+        self._buffer = []
+        self.chunk_size = chunk_size
+        self.method = self._resolve_method(method)
+        self.stats = {'rows': 0, 'chunks': 0, 'seconds': 0.0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+    def _default_columns(self):
+        """Columns of tuple rows by default: every column but a primary key the database generates.
+        """
+        primary_key = list(self._table.primary_key)
+        generated = None
+        if len(primary_key) == 1:
+            column = primary_key[0]
+            if column.autoincrement in (True, 'auto') and column.default is None and isinstance(column.type, Integer):
+                generated = column
+        return [c.name for c in self._table.columns if c is not generated]
+
+    def _resolve_method(self, method):
+        if method != 'auto':
+            return method
+        dialect = self._connection.engine.dialect
+        if dialect.name == 'postgresql' and dialect.driver == 'psycopg2':
+            return 'copy'
+        if dialect.name == 'mysql':
+            return 'values'
+        return 'executemany'
+
+    def add(self, row):
+        """Buffer a row, writing a chunk when the buffer is full.
+
+        Args:
+            row: dictionary of column-value pairs, or a tuple in column order
+        """
+        self._buffer.append(row)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def load(self, rows):
+        """Write an iterable of rows.
+
+        Args:
+            rows (iterable): dictionaries of column-value pairs, or tuples in column order
+
+        Returns:
+            dict: load statistics (rows, chunks, seconds, rows_per_second)
+        """
+        for row in rows:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.chunk_size:
+                self.flush()
+        self.flush()
+        return self.report()
+
+    def flush(self):
+        """Write the buffered rows.
+
+        Returns:
+            int: number of rows written
+        """
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+
+        started_at = time.time()
+        if hasattr(self._connection, 'session'):
+            self._write(self._connection.session.connection(), rows)
+        else:
+            with self._connection.engine.begin() as db:
+                self._write(db, rows)
+
+        self.stats['rows'] += len(rows)
+        self.stats['chunks'] += 1
+        self.stats['seconds'] += time.time() - started_at
+        return len(rows)
+
+    def report(self):
+        """
+        Returns:
+            dict: load statistics (rows, chunks, seconds, rows_per_second)
+        """
+        report = dict(self.stats)
+        report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else None
+        logger.info('Loaded {0} rows into {1} ({2})'.format(report['rows'], self._table.fullname, self.method))
+        return report
+
+    def _chunk_columns(self, rows):
+        """Columns written for a chunk: the keys of its dictionary rows, or the tuple columns.
+
+        Raises:
+            BulkLoadException: if the rows of the chunk do not all have the same columns
+        """
+        first = rows[0]
+        columns = list(first) if isinstance(first, dict) else self._columns
+        expected = set(columns)
+        tuple_columns = set(self._columns)
+        for row in rows:
+            found = row.keys() if isinstance(row, dict) else tuple_columns
+            if found != expected:
+                raise BulkLoadException('Rows of a chunk for {0} must have the same columns ({1}), found {2!r}'.format(
+                    self._table.fullname,
+                    ', '.join(columns),
+                    row
+                ))
+        return columns
+
+    def _write(self, db, rows):
+        columns = self._chunk_columns(rows)
+        if self.method == 'copy':
+            self._copy(db, columns, [self._as_tuple(r, columns) for r in rows])
+            return
+
+        rows = [self._as_dict(r) for r in rows]
+        if self.method == 'values':
+            for i in range(0, len(rows), self._VALUES_ROWS):
+                db.execute(self._table.insert().values(rows[i:i + self._VALUES_ROWS]))
+        else:
+            db.execute(self._table.insert(), rows)
+
+    def _as_dict(self, row):
+        return row if isinstance(row, dict) else dict(zip(self._columns, row))
+
+    def _as_tuple(self, row, columns):
+        return tuple([row[c] for c in columns]) if isinstance(row, dict) else row
+
+    def _copy(self, db, columns, rows):
+        preparer = db.dialect.identifier_preparer
+        statement = 'COPY {0} ({1}) FROM STDIN'.format(
+            preparer.format_table(self._table),
+            ', '.join(preparer.quote(c) for c in columns)
+        )
+        data = io.StringIO()
+        for row in rows:
+            data.write('\t'.join(_copy_value(v) for v in row))
+            data.write('\n')
+        data.seek(0)
+
+        cursor = db.connection.cursor()
+        try:
+            cursor.copy_expert(statement, data)
+        finally:
+            cursor.close()
+
+
+class BulkUpserter(BulkLoader):
+    """Buffers rows for a Model's table and inserts or updates them by natural key, a chunk at a time.
+
+    PostgreSQL uses ``INSERT ... ON CONFLICT DO UPDATE`` and MySQL ``INSERT ... ON DUPLICATE KEY UPDATE`` (both need a
+    unique constraint on the key columns), as does SQLite where the installed SQLAlchemy supports it.  Other databases
+    (and SQLite with older SQLAlchemy) re-select the keys of each chunk, then update the existing rows with one
+    executemany UPDATE and insert the rest with one executemany INSERT.
+
+    Args:
+        connection (datapro.core.db.Connection): database connection (see BulkLoader)
+        model (sqlalchemy.ext.declarative.api.DeclarativeMeta): sqlalchemy data model
+        key_columns (iterable): natural key columns matching rows to existing records, as in DimensionCache
+        update_columns (Optional[iterable]): columns updated on existing records, which every row must have (default
+            is every column of the row that is neither a key nor a primary key column; none means existing records are
+            left alone)
+        columns (Optional[iterable]): column names, in the order of tuple rows (see BulkLoader)
+        chunk_size (Optional[int]): rows buffered before a chunk is written
+        method (Optional[str]): 'auto' (pick the method for the dialect), 'on_conflict', 'on_duplicate_key' or
+            'select'
+
+    Note:
+        Keys are matched as the database compares them (see key_normalizer), and within a chunk the last row for a
+        key wins.
+    """
+
+    METHODS = ('auto', 'on_conflict', 'on_duplicate_key', 'select')
+
+    _SELECT_PARAMETERS = 900    # upper bound of bound parameters per key re-select
+
+    def __init__(self, connection, model, key_columns, update_columns=None, columns=None, chunk_size=10000,
+                 method='auto'):
+        self.key_columns = tuple(key_columns)
+        self.update_columns = tuple(update_columns) if update_columns is not None else None
+        super(BulkUpserter, self).__init__(connection, model, columns=columns, chunk_size=chunk_size, method=method)
+        self.stats.update(insert=0, update=0)   # only counted by the select method
+        self._normalize_key = key_normalizer([self._table.c[kc] for kc in self.key_columns])
+
+    def _resolve_method(self, method):
+        if method != 'auto':
+            return method
+        dialect = self._connection.engine.dialect
+        if dialect.name == 'postgresql' or (dialect.name == 'sqlite' and _sqlite_insert is not None):
+            return 'on_conflict'
+        if dialect.name == 'mysql':
+            return 'on_duplicate_key'
+        return 'select'
+
+    def _updates(self, row):
+        if self.update_columns is not None:
+            return self.update_columns
+        primary_key = set(c.name for c in self._table.primary_key)
+        return tuple(c for c in row if c not in self.key_columns and c not in primary_key)
+
+    def _write(self, db, rows):
+        self._chunk_columns(rows)
+        latest = OrderedDict()
+        for row in rows:
+            row = self._as_dict(row)
+            latest[self._normalize_key(tuple(row[kc] for kc in self.key_columns))] = row
+        rows = list(latest.values())
+        update_columns = self._updates(rows[0])
+        missing = [c for c in update_columns if c not in rows[0]]
+        if missing:
+            raise BulkLoadException('Update columns {0} are missing from the rows'.format(missing))
+
+        if self.method == 'on_conflict':
+            insert = _postgresql_insert if db.dialect.name == 'postgresql' else _sqlite_insert
+            for i in range(0, len(rows), self._VALUES_ROWS):
+                statement = insert(self._table).values(rows[i:i + self._VALUES_ROWS])
+                if update_columns:
+                    statement = statement.on_conflict_do_update(
+                        index_elements=list(self.key_columns),
+                        set_=dict((c, statement.excluded[c]) for c in update_columns)
+                    )
+                else:
+                    statement = statement.on_conflict_do_nothing(index_elements=list(self.key_columns))
+                db.execute(statement)
+        elif self.method == 'on_duplicate_key':
+            for i in range(0, len(rows), self._VALUES_ROWS):
+                statement = _mysql_insert(self._table).values(rows[i:i + self._VALUES_ROWS])
+                # updating a key column to itself turns a duplicate into a no-op when there is nothing to update
+                updates = update_columns or self.key_columns[:1]
+                db.execute(statement.on_duplicate_key_update(dict((c, statement.inserted[c]) for c in updates)))
+        else:
+            self._write_select(db, latest, update_columns)
+
+    def _write_select(self, db, latest, update_columns):
+        key_columns = [self._table.c[kc] for kc in self.key_columns]
+        keys = list(latest)
+        chunk_size = max(1, self._SELECT_PARAMETERS // len(key_columns))
+        existing = {}   # normalized key of each existing row, to the key as stored
+        for i in range(0, len(keys), chunk_size):
+            statement = select(key_columns).where(key_filter(key_columns, keys[i:i + chunk_size], db.dialect.name))
+            for r in db.execute(statement):
+                key = self._normalize_key(tuple(r))
+                if key not in latest:
+                    raise BulkLoadException('Key {0!r} read back from {1} matches none of the rows'.format(
+                        tuple(r), self._table.name
+                    ))
+                existing[key] = tuple(r)
+
+        inserts = [row for key, row in latest.items() if key not in existing]
+        if inserts:
+            db.execute(self._table.insert(), inserts)
+        self.stats['insert'] += len(inserts)
+
+        if existing and update_columns:
+            statement = self._table.update().where(
+                and_(*[c == bindparam('_key_' + c.name) for c in key_columns])
+            ).values(dict((c, bindparam('_value_' + c)) for c in update_columns))
+            parameters = []
+            for key, stored in existing.items():
+                row = latest[key]
+                parameter = dict(('_key_' + c.name, v) for c, v in zip(key_columns, stored))
+                parameter.update(('_value_' + c, row[c]) for c in update_columns)
+                parameters.append(parameter)
+            db.execute(statement, parameters)
+            self.stats['update'] += len(parameters)
+
+
+class BulkLoadException(Exception):
+    pass
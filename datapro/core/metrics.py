@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""Timings, counters and gauges of a job, summarised in one structured report.
+"""
+
+import functools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+WATCHED = ('counts', 'cache_counts', 'flush_stats', 'stats', 'totals')  # attributes read by Metrics.watch
+
+
+class Section(object):
+    """Timer of a named section of code, entered as a context manager (see Metrics.section).
+
+    With a sample rate above 1, only one in ``sample_rate`` entries is timed; calls are always counted and the
+    total time is extrapolated from the timed entries.
+    """
+
+    __slots__ = ('calls', 'timed', 'seconds', 'max', 'sample_rate', '_started')
+
+    def __init__(self, sample_rate=1):
+        self.calls = 0
+        self.timed = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.sample_rate = sample_rate
+        self._started = []
+
+    def __enter__(self):
+        self.calls += 1
+        self._started.append(time.perf_counter() if self.calls % self.sample_rate == 0 else None)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        started_at = self._started.pop()
+        if started_at is not None:
+            self._add(time.perf_counter() - started_at)
+
+    def record(self, seconds):
+        """Add a call timed elsewhere.
+        """
+        self.calls += 1
+        self._add(seconds)
+
+    def _add(self, seconds):
+        self.timed += 1
+        self.seconds += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def report(self):
+        """
+        Returns:
+            dict: calls, seconds (extrapolated when sampled), mean and max seconds per call
+        """
+        mean = self.seconds / self.timed if self.timed else 0.0
+        return {
+            'calls': self.calls,
+            'seconds': mean * self.calls if self.calls > self.timed else self.seconds,
+            'mean': mean,
+            'max': self.max
+        }
+
+
+class Metrics(object):
+    """Per-job instrumentation: timed sections, counters and gauges, reported together by ``report``.
+
+    Gauges are read when the report is built, so watching an object (e.g. a DimensionCache's counts or an
+    OrmConnection's flush_stats) costs nothing on the hot path.
+
+    Args:
+        sample_rate (Optional[int]): time one in sample_rate entries of every section (sampling mode, for sections
+            entered per row); calls and counters stay exact
+
+    Example:
+        with metrics.section('transform'):
+            ...
+
+        @metrics.timed('parse')
+        def parse(line):
+            ...
+
+        metrics.watch('customers', customer_cache)
+    """
+
+    def __init__(self, sample_rate=1):
+        self.sample_rate = sample_rate
+        self.counters = {}
+        self.sections = {}
+        self._gauges = {}
+
+    def count(self, name, n=1):
+        """Add to a counter.
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def counted(self, name, rows):
+        """Count the items of an iterable as they are consumed.
+
+        Yields:
+            the items of rows
+        """
+        counters = self.counters
+        counters.setdefault(name, 0)
+        for row in rows:
+            counters[name] += 1
+            yield row
+
+    def section(self, name):
+        """Timer of a named section (created on first use), to be entered as a context manager.
+
+        Returns:
+            Section: the section's timer
+        """
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(self.sample_rate)
+        return section
+
+    def timed(self, name=None):
+        """Decorator timing every call of a function as a section (named after the function by default).
+        """
+        def decorate(function):
+            section = self.section(name or function.__name__)
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with section:
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def gauge(self, name, function):
+        """Register a value read when the report is built.
+
+        Args:
+            name (str): gauge name
+            function (callable): returns the value (e.g. a number or a dictionary of counts)
+        """
+        self._gauges[name] = function
+
+    def watch(self, name, obj):
+        """Register the statistics of an object as gauges: whichever of its WATCHED attributes it has, e.g. the
+        counts and cache_counts of a DimensionCache, the flush_stats of an OrmConnection, the stats of a BulkLoader
+        or the totals of a FailureCollector.
+
+        Args:
+            name (str): gauge name prefix
+            obj: object to watch
+        """
+        attributes = [a for a in WATCHED if hasattr(obj, a)]
+        if not attributes:
+            raise ValueError('{0!r} has none of the attributes {1}'.format(obj, ', '.join(WATCHED)))
+        for attribute in attributes:
+            self.gauge('{0}.{1}'.format(name, attribute), functools.partial(getattr, obj, attribute))
+
+    def report(self):
+        """
+        Returns:
+            dict: counters, sections (see Section.report) and the current value of every gauge
+        """
+        gauges = {}
+        for name, function in self._gauges.items():
+            try:
+                value = function()
+            except Exception as e:
+                logger.warn('Could not read gauge {0}: {1}'.format(name, e))
+                continue
+            if isinstance(value, dict):     # tuple keys (e.g. FailureCollector.totals) are joined into strings
+                value = dict((': '.join(str(k) for k in key) if isinstance(key, tuple) else key, v)
+                             for key, v in value.items())
+            gauges[name] = value
+        return {
+            'counters': dict(self.counters),
+            'sections': dict((name, section.report()) for name, section in self.sections.items()),
+            'gauges': gauges
+        }
@@ -4,6 +4,8 @@ from sqlalchemy import Column, INTEGER
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
 from sqlalchemy.orm import reconstructor
 
+from datapro.core.load import BulkLoader, BulkUpserter
+
 
 class IdMixin(object):
 
@@ -53,6 +55,36 @@ class Model(object):
         else:
             return cls(**{k: d[k] for k in set(subset).intersection(d)})
 
+    @classmethod
+    def bulk_load(cls, connection, rows, **kwargs):
+        """Write rows to the model's table with Core bulk inserts, bypassing the ORM (see BulkLoader).
+
+        Args:
+            connection (datapro.core.db.Connection): database connection
+            rows (iterable): dictionaries of column-value pairs, or tuples in column order
+            **kwargs: BulkLoader options (columns, chunk_size, method)
+
+        Returns:
+            dict: load statistics (rows, chunks, seconds, rows_per_second)
+        """
+        return BulkLoader(connection, cls, **kwargs).load(rows)
+
+    @classmethod
+    def bulk_upsert(cls, connection, rows, key_columns, update_columns=None, **kwargs):
+        """Insert or update rows of the model's table by natural key with set-based statements (see BulkUpserter).
+
+        Args:
+            connection (datapro.core.db.Connection): database connection
+            rows (iterable): dictionaries of column-value pairs, or tuples in column order
+            key_columns (iterable): natural key columns matching rows to existing records
+            update_columns (Optional[iterable]): columns updated on existing records
+            **kwargs: BulkUpserter options (columns, chunk_size, method)
+
+        Returns:
+            dict: load statistics (rows, chunks, seconds, rows_per_second, and insert/update counts where known)
+        """
+        return BulkUpserter(connection, cls, key_columns, update_columns=update_columns, **kwargs).load(rows)
+
     @staticmethod
     def table_name_properties(table_name_mask):
         return [t.strip('{').strip('}') for t in table_name_mask.split('}_{')]
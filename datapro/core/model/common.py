@@ -9,6 +9,12 @@ from sqlalchemy.types import *
 
 from datapro import IdMixin, Model
 
+# Month and day names, formatted once in the current locale (index 0 of the month tables is unused)
+_MONTH_SHORT = [''] + [datetime.date(2000, m, 1).__format__('%b') for m in range(1, 13)]
+_MONTH_LONG = [''] + [datetime.date(2000, m, 1).__format__('%B') for m in range(1, 13)]
+_DAY_SHORT = [''] + [datetime.date(2000, 1, 2 + d).__format__('%a') for d in range(1, 8)]     # ISO day 1 is Monday
+_DAY_LONG = [''] + [datetime.date(2000, 1, 2 + d).__format__('%A') for d in range(1, 8)]
+
 
 class Date(Model, IdMixin):
     __schema__ = 'common'
@@ -83,5 +89,78 @@ class Date(Model, IdMixin):
             isLastDayOfMonth=is_last_day_of_month
         )
 
+    @classmethod
+    def rows(cls, start_date, end_date):
+        """Column values of every date in a range, computed month by month, for bulk inserts.
+
+        Produces the same values as from_date, but names come from tables formatted once and month-level values
+        (half, quarter, labels, day of year offsets) are computed once per month rather than once per day.
+
+        Args:
+            start_date (datetime.date): first date of the range
+            end_date (datetime.date): last date of the range (inclusive)
+
+        Returns:
+            list: dictionaries of column values, one per date, in date order
+        """
+        rows = []
+        year, month = start_date.year, start_date.month
+        while (year, month) <= (end_date.year, end_date.month):
+            half = int(ceil(float(month) / 6.0))
+            quarter = int(ceil(float(month) / 3.0))
+            days_in_month = calendar.monthrange(year, month)[1]
+            first = datetime.date(year, month, 1)
+            leap = calendar.isleap(year)
+            day_of_year_offset = (first - datetime.date(year, 1, 1)).days
+            day_of_quarter_offset = (first - datetime.date(year, (3 * (quarter - 1)) + 1, 1)).days
+            month_short, month_long = _MONTH_SHORT[month], _MONTH_LONG[month]
+            year_text = str(year)
+            month_values = {
+                'year': year,
+                'half': half,
+                'quarter': quarter,
+                'month': month,
+                'yearAndHalf': 'H' + str(half) + ' ' + year_text,
+                'yearAndQuarter': 'Q' + str(quarter) + ' ' + year_text,
+                'monthNameShort': month_short,
+                'monthNameLong': month_long,
+                'yearAndMonthNameShort': month_short + ' ' + year_text,
+                'yearAndMonthNameLong': month_long + ' ' + year_text
+            }
+
+            first_day = start_date.day if (year, month) == (start_date.year, start_date.month) else 1
+            last_day = end_date.day if (year, month) == (end_date.year, end_date.month) else days_in_month
+            for day in range(first_day, last_day + 1):
+                d = datetime.date(year, month, day)
+                iso = d.isocalendar()
+                day_of_year = day_of_year_offset + day
+                day_of_year_no_leap = day_of_year
+                if leap:
+                    if day_of_year == 60:
+                        day_of_year_no_leap = 0
+                    elif day_of_year > 60:
+                        day_of_year_no_leap -= 1
+                row = dict(month_values)
+                row.update(
+                    date=d,
+                    full=_DAY_LONG[iso[2]] + ', ' + month_long + ' ' + str(day) + ', ' + year_text,
+                    dayOfYear=day_of_year,
+                    dayOfYearNoLeap=day_of_year_no_leap,
+                    dayOfQuarter=day_of_quarter_offset + day,
+                    yearOfWeekYear=iso[0],     # ISO calendar year
+                    weekOfWeekYear=iso[1],     # ISO calendar week number
+                    dayOfMonth=day,
+                    dayOfWeek=iso[2],          # ISO calendar day of week
+                    yearAndWeek='W' + str(iso[1]) + ' ' + str(iso[0]),
+                    dayOfWeekNameShort=_DAY_SHORT[iso[2]],
+                    dayOfWeekNameLong=_DAY_LONG[iso[2]],
+                    weekend='Weekend' if iso[2] >= 6 else 'Weekday',
+                    isLastDayOfMonth=day == days_in_month
+                )
+                rows.append(row)
+
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return rows
+
 
 __all__ = (Date, )
@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import logging
 
 from sqlalchemy import func
 
 from datapro.core.model.common import Date
 from datapro.core.db import OrmConnection
 
+logger = logging.getLogger(__name__)
 
-def init(connection):
+DATE_START = datetime.date(1999, 12, 27)
+DATE_END = datetime.date(2019, 12, 29)
+INSERT_BLOCK_SIZE = 10000   # rows per executemany when loading dimension tables
+
+
+def init(connection, start_date=DATE_START, end_date=DATE_END):
 
     # Dimension Tables
     Date.__table__.create(connection.engine, checkfirst=True)
@@ -16,13 +23,36 @@ def init(connection):
     connection.session.commit()
 
     if connection.session.query(func.count(Date.id)).scalar() == 0:
-        start_date = datetime.date(1999, 12, 27)
-        end_date = datetime.date(2019, 12, 29)
-        for this_date in (start_date + datetime.timedelta(n) for n in range((end_date - start_date).days + 1)):
-            connection.session.add(Date.from_date(this_date))
+        extend_dates(connection, start_date, end_date)
         connection.session.commit()
 
 
+def extend_dates(connection, start_date, end_date):
+    """Insert the dates of a range that are missing from the Date dimension.
+
+    Column values for the whole range are generated at once and written with bulk (executemany) inserts.
+
+    Args:
+        connection (datapro.core.db.OrmConnection): database connection
+        start_date (datetime.date): first date of the range
+        end_date (datetime.date): last date of the range (inclusive)
+
+    Returns:
+        int: number of dates inserted
+
+    Note:
+        Connection is not committed.
+    """
+    session = connection.session
+    existing = set(d for d, in session.query(Date.date).filter(Date.date.between(start_date, end_date)))
+    rows = [r for r in Date.rows(start_date, end_date) if r['date'] not in existing]
+    for i in range(0, len(rows), INSERT_BLOCK_SIZE):
+        session.execute(Date.__table__.insert(), rows[i:i + INSERT_BLOCK_SIZE])
+
+    logger.info('Inserted {0} dates from {1} to {2}'.format(len(rows), start_date, end_date))
+    return len(rows)
+
+
 if __name__ == '__main__':
 
     connection = OrmConnection('admin')
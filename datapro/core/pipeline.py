@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""Streaming pipelines of extract, transform and load stages.
+
+A stage is a callable taking an iterable of rows and returning an iterable of rows, usually a generator, so rows
+stream from one stage to the next without being materialised in between.  ``threaded`` runs a stage in a thread
+behind a bounded queue (for I/O-bound extracts and loads), and ``batch``/``unbatch`` switch between per-row and
+per-chunk stages.
+
+Example:
+    Pipeline(read_rows(path)).pipe(
+        validate(row_validator, collector=job.failures),
+        batch(1000),
+        resolve_ids(customers, 'customer_id', fields={'code': 'customer_code'}),
+        threaded(load(BulkLoader(Connection('warehouse', config), Sale)), maxsize=4),
+    ).run()
+"""
+
+import itertools
+import logging
+import queue
+import threading
+
+from datapro.core.validation import FailureCollector, RowValidator
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()    # end of a threaded stage's output
+
+
+class _Raised(object):
+    """Exception raised in a threaded stage, handed over to the consuming thread.
+    """
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class Pipeline(object):
+    """Chain of stages pulling rows from a source.
+
+    Args:
+        source (iterable): rows (or batches of rows) fed to the first stage
+        stages (Optional[iterable]): stages, in order
+    """
+
+    def __init__(self, source, stages=()):
+        self.source = source
+        self.stages = list(stages)
+        self.count = 0  # items out of the last stage
+
+    def __iter__(self):
+        rows = iter(self.source)
+        for stage in self.stages:
+            rows = stage(rows)
+        for row in rows:
+            self.count += 1
+            yield row
+
+    def pipe(self, *stages):
+        """Append stages to the pipeline.
+
+        Returns:
+            Pipeline: the pipeline, so calls can be chained
+        """
+        self.stages.extend(stages)
+        return self
+
+    def run(self):
+        """Pull every row through the pipeline, discarding the output of the last stage.
+
+        Returns:
+            int: number of items out of the last stage
+        """
+        for _ in self:
+            pass
+        return self.count
+
+
+def _put(items, item, stopped):
+    """Put an item on a bounded queue, waiting for room unless the consumer has stopped.
+    """
+    while not stopped.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce(rows, items, stopped):
+    """Thread target: iterate rows onto a queue, ending with _DONE (or the exception raised).
+    """
+    try:
+        for item in rows:
+            if not _put(items, item, stopped):
+                return
+    except BaseException as e:
+        _put(items, _Raised(e), stopped)
+    else:
+        _put(items, _DONE, stopped)
+
+
+def _check(item):
+    if isinstance(item, _Raised):
+        raise item.exception
+    return item
+
+
+def prefetch(rows, maxsize=1000):
+    """Iterate in a background thread, at most ``maxsize`` items ahead of the consumer (e.g. for an I/O-bound
+    extract).
+
+    The thread blocks once the queue is full (backpressure), so a fast producer never runs away from a slow
+    consumer.  An exception in the thread is raised in the consumer; closing the consumer stops the thread.
+
+    Args:
+        rows (iterable): items to iterate (their iterator is only ever used by the background thread)
+        maxsize (Optional[int]): queue bound
+
+    Yields:
+        the items of rows
+    """
+    items = queue.Queue(maxsize)
+    stopped = threading.Event()
+    thread = threading.Thread(target=_produce, args=(rows, items, stopped), name='datapro-prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = _check(items.get())
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def threaded(stage, maxsize=1000):
+    """Run a stage in its own thread (e.g. an I/O-bound load), between two bounded queues.
+
+    The stages before it keep running in the calling thread, which feeds the stage's input queue and yields from its
+    output queue; both are bounded, so neither side runs more than ``maxsize`` items ahead (backpressure).  Queue
+    operations cost a few microseconds each, so put a ``batch`` before threaded stages handling many small rows.
+
+    Args:
+        stage (callable): stage to run in a thread; it must not share a database connection (or session) with the
+            other stages
+        maxsize (Optional[int]): queue bound
+
+    Returns:
+        callable: stage
+    """
+    def run(rows):
+        inbox = queue.Queue(maxsize)
+        outbox = queue.Queue(maxsize)
+        stopped = threading.Event()
+
+        def inputs():
+            while not stopped.is_set():
+                try:
+                    item = inbox.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    return
+                yield item
+
+        def outputs():  # calls the stage in the thread
+            for item in stage(inputs()):
+                yield item
+
+        thread = threading.Thread(target=_produce, args=(outputs(), outbox, stopped), name='datapro-stage', daemon=True)
+        thread.start()
+        try:
+            for row in itertools.chain(rows, (_DONE,)):
+                while True:
+                    try:
+                        inbox.put_nowait(row)
+                        break
+                    except queue.Full:
+                        pass
+                    # wait for the stage's output rather than for room in its input: blocking on a full input while
+                    # the stage blocks on a full output would stall both sides until a timeout, on every row
+                    try:
+                        item = _check(outbox.get(timeout=0.01))
+                    except queue.Empty:
+                        continue
+                    if item is _DONE:
+                        return
+                    yield item
+                while not outbox.empty():
+                    item = _check(outbox.get())
+                    if item is _DONE:
+                        return
+                    yield item
+            while True:
+                item = _check(outbox.get())
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            stopped.set()
+            thread.join()
+    return run
+
+
+def batch(size):
+    """Group rows into lists of (at most) ``size`` rows, for per-chunk stages.
+
+    Returns:
+        callable: stage
+    """
+    def run(rows):
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, size))
+            if not chunk:
+                return
+            yield chunk
+    return run
+
+
+def unbatch():
+    """Flatten batches back into rows, for per-row stages.
+
+    Returns:
+        callable: stage
+    """
+    def run(batches):
+        for chunk in batches:
+            for row in chunk:
+                yield row
+    return run
+
+
+def map_rows(function):
+    """Apply a function to every row (or batch).
+
+    Returns:
+        callable: stage
+    """
+    def run(rows):
+        for row in rows:
+            yield function(row)
+    return run
+
+
+def filter_rows(predicate):
+    """Keep the rows (or batches) for which a predicate is true.
+
+    Returns:
+        callable: stage
+    """
+    def run(rows):
+        for row in rows:
+            if predicate(row):
+                yield row
+    return run
+
+
+def validate(validator, schema=None, collector=None, drop_invalid=True):
+    """Validate and convert rows.
+
+    Args:
+        validator (Union[RowValidator, Validator]): a RowValidator, or a Validator called per field as declared by
+            schema (the Validator's own collector or message template reports failures)
+        schema (Optional[iterable]): for a Validator, (field, options) pairs as for RowValidator, the type naming the
+            Validator method
+        collector (Optional[FailureCollector]): for a RowValidator, aggregates failures by field and message class
+            (default is a collector of the stage's own, summarised when the input is exhausted)
+        drop_invalid (Optional[boolean]): drop rows that failed validation rather than passing them on (with None in
+            the fields that failed)
+
+    Returns:
+        callable: stage yielding validated rows; the row number (from 1) is the context of failures
+    """
+    if isinstance(validator, RowValidator):
+        def run(rows):
+            failures = collector if collector is not None else FailureCollector(max_records=0)
+            try:
+                for number, row in enumerate(rows, 1):
+                    values, errors = validator.validate(row)
+                    if errors:
+                        for key, message, args in errors:
+                            failures.add(key, message, args, context=number)
+                        failures.tick()
+                    if not errors or not drop_invalid:
+                        yield values
+            finally:
+                if collector is None:
+                    failures.emit()
+        return run
+
+    if schema is None:
+        raise ValueError('A schema is required to validate rows with a Validator')
+    if isinstance(schema, dict):
+        schema = schema.items()
+    fields = []
+    for key, options in schema:
+        options = dict(options)
+        fields.append((key, getattr(validator, options.pop('type')), options))
+
+    def run(rows):
+        for number, row in enumerate(rows, 1):
+            validator.reset(context=number)
+            for key, method, options in fields:
+                method(key, row.get(key), **options)
+            if validator.valid or not drop_invalid:
+                yield validator.properties
+    return run
+
+
+def resolve_ids(cache, column, fields=None, batch_size=1000, merge=True):
+    """Resolve dimension ids for rows through a DimensionCache, in batches.
+
+    Accepts rows or batches (lists) of rows, and yields the same shape with the id set in ``column``.
+
+    Args:
+        cache (datapro.core.tool.DimensionCache): dimension cache
+        column (str): field the dimension id is written to
+        fields (Optional[dict]): dimension column to row field, for the dimension columns written for new records
+            (key columns are read from fields named like them unless mapped here)
+        batch_size (Optional[int]): rows per merge_many/lookup_many call when rows arrive one at a time
+        merge (Optional[boolean]): insert unknown dimension records (merge_many) from the key columns and the columns
+            mapped by fields, the other fields of the rows being left out; otherwise only look ids up, leaving None
+            for unknown keys
+
+    Returns:
+        callable: stage
+    """
+    fields = dict(fields or {})
+    key_fields = [fields.get(kc, kc) for kc in cache.key_columns]
+    projection = list(zip(cache.key_columns, key_fields)) + [(c, f) for c, f in fields.items()
+                                                             if c not in cache.key_columns]
+
+    def resolve(chunk):
+        if merge:
+            ids = cache.merge_many([dict((c, row[f]) for c, f in projection) for row in chunk])
+        else:
+            ids = cache.lookup_many([tuple([row[f] for f in key_fields]) for row in chunk])
+        for row, dimension_id in zip(chunk, ids):
+            row[column] = dimension_id
+
+    def run(rows):
+        pending = []
+        for item in rows:
+            if isinstance(item, list):
+                resolve(item)
+                yield item
+                continue
+            pending.append(item)
+            if len(pending) >= batch_size:
+                resolve(pending)
+                for row in pending:
+                    yield row
+                pending = []
+        if pending:
+            resolve(pending)
+            for row in pending:
+                yield row
+    return run
+
+
+def load(loader):
+    """Write rows (or batches of rows) with a BulkLoader (or BulkUpserter), passing them on; the loader is flushed
+    when the input is exhausted.
+
+    Args:
+        loader (datapro.core.load.BulkLoader): loader
+
+    Returns:
+        callable: stage
+    """
+    def run(rows):
+        for item in rows:
+            if isinstance(item, list):
+                for row in item:
+                    loader.add(row)
+            else:
+                loader.add(item)
+            yield item
+        loader.flush()
+    return run
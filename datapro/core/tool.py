@@ -1,7 +1,24 @@
 # -*- coding: utf-8 -*-
 
+import datetime
 import logging
+import os
 import re
+import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+
+from sqlalchemy import and_, select
+
+from datapro.core.cache import DictCache, LayeredCache, LruCache, read_snapshot, write_snapshot
+from datapro.core.load import key_filter, key_normalizer
+from datapro.core.model.common import Date
+
+try:
+    import numpy
+except ImportError:     # only used by DateResolver.resolve_many for datetime64 columns
+    numpy = None
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +38,54 @@ UC_INITIALS = re.compile(r"^(?:[A-Z]{1}\.{1}|[A-Z]{1}\.{1}[A-Z]{1})+$")
 MAC_MC = re.compile(r"^(?![Mm]ach.*|[Mm]acro.*)([Mm]a?c)(\w+)")
 
 
+LINES = re.compile('[\r\n]+')
+WORDS = re.compile('[\t ]')
+
+TITLE_CASE_MEMO_SIZE = 65536    # distinct words and distinct values remembered by title_case
+
+_UNKNOWN = object()     # DateResolver: date never looked up in the database
+
+
+def _upper(m):
+    return m.group(0).upper()
+
+
+def _capitalize(m):
+    return m.group(0).capitalize()
+
+
+def _capitalize_second(m):
+    return '%s%s' % (m.group(1), m.group(2).capitalize())
+
+
+@lru_cache(maxsize=TITLE_CASE_MEMO_SIZE)
+def _title_case_word(word, all_caps):
+    """Title case a single word (the per-word step of title_case, memoised per word and all-caps flag).
+    """
+    if all_caps:
+        if UC_INITIALS.match(word):
+            return word
+        word = word.lower()
+
+    if APOS_SECOND.match(word):
+        word = word.replace(word[0], word[0].upper())
+        return word.replace(word[2], word[2].upper())
+    if INLINE_PERIOD.search(word) or UC_ELSEWHERE.match(word):
+        return word
+    if SMALL_WORDS.match(word):
+        return word.lower()
+
+    match = MAC_MC.match(word)
+    if match:
+        return "%s%s" % (match.group(1).capitalize(), match.group(2).capitalize())
+
+    if "/" in word and not "//" in word:
+        return "/".join([CAPFIRST.sub(_upper, item) for item in word.split('/')])
+
+    return "-".join([CAPFIRST.sub(_upper, item) for item in word.split('-')])
+
+
+@lru_cache(maxsize=TITLE_CASE_MEMO_SIZE)
 def title_case(text):
     """
     title_case is a filter function that changes all words in text to Title Caps,
@@ -33,71 +98,76 @@ def title_case(text):
     Python version by Stuart Colville http://muffinresearch.co.uk
     License: http://www.opensource.org/licenses/mit-license.php
 
+    Results are memoised per value and per word (up to TITLE_CASE_MEMO_SIZE of each), so repeated values cost one
+    cache lookup.
+
     :param text: string of text to be title cased
     :return: title cased string
     """
 
-    lines = re.split('[\r\n]+', text)
     processed = []
-    for line in lines:
-        all_caps = ALL_CAPS.match(line)
-        words = re.split('[\t ]', line)
-        tc_line = []
-        for word in words:
-            if all_caps:
-                if UC_INITIALS.match(word):
-                    tc_line.append(word)
-                    continue
-                else:
-                    word = word.lower()
-
-            if APOS_SECOND.match(word):
-                word = word.replace(word[0], word[0].upper())
-                word = word.replace(word[2], word[2].upper())
-                tc_line.append(word)
-                continue
-            if INLINE_PERIOD.search(word) or UC_ELSEWHERE.match(word):
-                tc_line.append(word)
-                continue
-            if SMALL_WORDS.match(word):
-                tc_line.append(word.lower())
-                continue
+    for line in LINES.split(text):
+        all_caps = ALL_CAPS.match(line) is not None
+        result = " ".join([_title_case_word(word, all_caps) for word in WORDS.split(line)])
+        result = SMALL_FIRST.sub(_capitalize_second, result)
+        result = SMALL_LAST.sub(_capitalize, result)
+        result = SUBPHRASE.sub(_capitalize_second, result)
+        processed.append(result)
 
-            match = MAC_MC.match(word)
-            if match:
-                tc_line.append("%s%s" % (match.group(1).capitalize(),
-                                         match.group(2).capitalize()))
-                continue
+    return '\n'.join(processed)
 
-            if "/" in word and not "//" in word:
-                slashed = []
-                for item in word.split('/'):
-                    slashed.append(CAPFIRST.sub(lambda m: m.group(0).upper(), item))
-                tc_line.append("/".join(slashed))
-                continue
 
-            hyphenated = []
-            for item in word.split('-'):
-                hyphenated.append(CAPFIRST.sub(lambda m: m.group(0).upper(), item))
-            tc_line.append("-".join(hyphenated))
+def title_case_many(values):
+    """Title case a column of values, casing each distinct value once.
 
-        result = " ".join(tc_line)
+    Args:
+        values (iterable): strings (None is passed through)
 
-        result = SMALL_FIRST.sub(lambda m: '%s%s' % (
-            m.group(1),
-            m.group(2).capitalize()
-        ), result)
+    Returns:
+        list: title cased values, in input order
+    """
+    cased = {None: None}
+    result = []
+    append = result.append
+    for value in values:
+        try:
+            append(cased[value])
+        except KeyError:
+            append(cased.setdefault(value, title_case(value)))
+    return result
 
-        result = SMALL_LAST.sub(lambda m: m.group(0).capitalize(), result)
 
-        result = SUBPHRASE.sub(lambda m: '%s%s' % (
-            m.group(1),
-            m.group(2).capitalize()
-        ), result)
+class DeferredId(object):
+    """Handle for the id of a dimension record that has been staged, but not yet written, by a batched DimensionCache.
 
-        processed.append(result)
+    Args:
+        cache (DimensionCache): cache the record was merged through
+        key (tuple): cache key of the staged record
+    """
 
-    return '\n'.join(processed)
+    __slots__ = ('_cache', 'key')
+
+    def __init__(self, cache, key):
+        self._cache = cache
+        self.key = key
+
+    def __int__(self):
+        return self.value
+
+    __index__ = __int__
+
+    def __repr__(self):
+        return '<DeferredId key={0!r} resolved={1}>'.format(self.key, self.resolved)
+
+    @property
+    def resolved(self):
+        """bool: indicates if the staged record has been written and its id is known"""
+        return self.key not in self._cache._pending
+
+    @property
+    def value(self):
+        """int: dimension id for the staged record (the pending batch is flushed first if necessary)"""
+        return self._cache.lookup(self.key)
 
 
 class DimensionCache(object):
@@ -108,24 +178,182 @@ class DimensionCache(object):
         model (sqlalchemy.ext.declarative.api.DeclarativeMeta): sqlalchemy data model
         key_columns (iterable): key columns to use for caching (iterable should be ordered for consistency)
         cache_object (Optional[boolean]): indicates if cache should be initialized (default is True)
-        where_clause (Optional[sqlalchemy.sql.elements.BinaryExpression]): sqlalchemy expression for filter
+        where_clause (Optional[sqlalchemy.sql.elements.BinaryExpression]): sqlalchemy expression for filter, applied
+            when warming the cache and to every lazy lookup and id re-select (e.g. the current rows of a slowly
+            changing dimension)
+        batch_size (Optional[int]): number of new records to stage before they are written in bulk (default is 0,
+            which writes every new record immediately)
+        cache_backend (Optional[callable]): factory for the key-to-id storage, e.g.
+            datapro.core.cache.HashedArrayCache for very large dimensions (default is DictCache)
+        snapshot_path (Optional[str]): snapshot file to start from, when it exists (see save_snapshot); only rows
+            beyond its high-water mark are then read from the database (not in lazy mode)
+        high_water_column (Optional[str]): ever-increasing column (e.g. id or an updated-at timestamp) used to find
+            rows newer than a snapshot (default is id); rows where it is null are cached, but not found as newer
+        lazy (Optional[boolean]): look up keys missing from the cache in the database instead of assuming they are
+            new; misses are fetched in batches by lookup_many, merge_many and batched merges, and a single lookup or
+            merge fetches the keys announced through prefetch along with its own (default is False)
+        max_size (Optional[int]): bound the number of cached entries (lazy mode only)
+        eviction (Optional[str]): eviction policy of a bounded cache, 'lru' or 'fifo' (default is 'lru')
     """
 
-    def __init__(self, connection, model, key_columns, init_cache=True, where_clause=None):
-        self._cache = {}
+    _SELECT_PARAMETERS = 900    # upper bound of bound parameters per key re-select
+    _VALUES_ROWS = 1000         # upper bound of rows per multi-row VALUES insert
+    _WARM_PARTITION = 10000     # rows fetched per round trip while warming the cache
+    _WARM_PROGRESS = 10         # seconds between progress messages while warming the cache
+
+    def __init__(self, connection, model, key_columns, init_cache=True, where_clause=None, batch_size=0,
+                 cache_backend=DictCache, snapshot_path=None, high_water_column='id', lazy=False, max_size=None,
+                 eviction='lru'):
+        if snapshot_path is not None and lazy:
+            raise DimensionCacheException('A lazy cache is not warmed, so it cannot start from a snapshot')
+        if max_size is not None:
+            if not lazy:
+                raise DimensionCacheException('A bounded cache must be lazy, or evicted keys would be inserted again')
+            self._cache = LruCache(max_size, policy=eviction)
+        else:
+            self._cache = cache_backend()
         self._connection = connection
         self._key_columns = tuple(key_columns)
         self._model = model
+        self._columns = [c.name for c in self._model.__table__.columns]
+        self._key_normalizer = key_normalizer([getattr(self._model, kc) for kc in self._key_columns])
+        self._pending = OrderedDict()   # staged records (and their id handles) waiting to be written
+        self._wanted = OrderedDict()    # keys announced by prefetch, fetched with the next lazy miss
+        self._flushed = {}              # ids of the last batch written, which a bounded cache may already evict
+        self._where_clause = where_clause
+        self._high_water_column = high_water_column
+        self._hits = 0
+        self._misses = 0
+        self.batch_size = batch_size
+        self.lazy = lazy
         self.counts = {'exist': 0, 'insert': 0}     # keeps track of cache hits and new inserts
+        self.high_water = None                      # highest high_water_column value read by warm
+        self.snapshot = None
+
+        if init_cache and not lazy:
+            if snapshot_path is not None and os.path.exists(snapshot_path):
+                self.load_snapshot(snapshot_path)
+                if self.high_water is not None:
+                    newer = getattr(self._model, self._high_water_column) > self.high_water
+                    where_clause = newer if where_clause is None else and_(where_clause, newer)
+            self.warm(where_clause)
+
+    @property
+    def key_columns(self):
+        """tuple: columns making up the cache key, in key order"""
+        return self._key_columns
+
+    @property
+    def cache_counts(self):
+        """dict: cache hits, misses and evictions (counts keeps track of existing and inserted records)"""
+        return {'hit': self._hits, 'miss': self._misses, 'evict': getattr(self._cache, 'evictions', 0)}
+
+    def _normalize_key(self, key):
+        """Form of a key matching the key values read back from the database (see datapro.core.load.key_normalizer).
+        """
+        return self._key_normalizer(key)
+
+    def _key_index(self, keys):
+        """
+        Returns:
+            OrderedDict: the keys given for each normalized key
+        """
+        index = OrderedDict()
+        for key in keys:
+            index.setdefault(self._normalize_key(key), []).append(key)
+        return index
+
+    def _fetch(self, keys):
+        """Look up keys missing from the cache in the database (lazy mode) and cache the ids found.
+
+        Keys announced through prefetch are looked up in the same queries.
+
+        Args:
+            keys (list): cache keys
+
+        Returns:
+            dict: dimension id for each of the given keys found in the database
+        """
+        if self._wanted:
+            requested = set(keys)
+            keys = list(keys) + [key for key in self._wanted if key not in requested]
+            self._wanted.clear()
+        else:
+            requested = None
+        found = self._select_ids(keys)
+        self._cache.update(found)
+        if requested is not None:
+            found = dict((key, cache_id) for key, cache_id in found.items() if key in requested)
+        return found
 
-        if init_cache:
-            logger.info('Caching {0}'.format(model.__tablename__))
-            projection = [self._model.id] + [getattr(self._model, kc) for kc in self._key_columns]
-            dimension_query = self._connection.session.query(*projection)
-            if where_clause is not None:
-                dimension_query = dimension_query.filter(where_clause)
-            for d in dimension_query:
-                self._cache[tuple(v for v in d[1:])] = d[0]
+    def prefetch(self, keys):
+        """Announce keys about to be looked up or merged one at a time (lazy mode).
+
+        Nothing is queried: the announced keys missing from the cache are looked up in the database together with
+        the next miss, so a run of single lookups costs one round trip per batch of keys instead of one per key.
+
+        Args:
+            keys (iterable): cache keys
+        """
+        if not self.lazy:
+            return
+        get = self._cache.get
+        for key in keys:
+            if get(key) is None and key not in self._pending:
+                self._wanted[key] = None
+
+    def warm(self, where_clause=None, partition_size=None):
+        """Fill the cache by streaming ids and keys of the dimension from the database.
+
+        Rows are read through a server-side cursor (where the driver supports one) in partitions and added to the
+        cache as they arrive, so the full result is never buffered.
+
+        Args:
+            where_clause (Optional[sqlalchemy.sql.elements.BinaryExpression]): sqlalchemy expression for filter
+            partition_size (Optional[int]): rows fetched per round trip
+
+        Returns:
+            int: number of rows cached
+        """
+        table_name = self._model.__tablename__
+        partition_size = partition_size or self._WARM_PARTITION
+        logger.info('Caching {0}'.format(table_name))
+
+        stop = 1 + len(self._key_columns)
+        projection = [self._model.id] + [getattr(self._model, kc) for kc in self._key_columns]
+        high_water_index = 0
+        if self._high_water_column != 'id':
+            projection.append(getattr(self._model, self._high_water_column))
+            high_water_index = stop
+        statement = select(projection)
+        if where_clause is not None:
+            statement = statement.where(where_clause)
+
+        session = self._connection.session
+        if session.autoflush:
+            session.flush()     # pending records should be visible, as they would be to an ORM query
+        connection = session.connection().execution_options(stream_results=True)
+        result = connection.execute(statement)
+        started_at = reported_at = time.time()
+        total = 0
+        try:
+            while True:
+                rows = result.fetchmany(partition_size)
+                if not rows:
+                    break
+                self._cache.update((tuple(r[1:stop]), r[0]) for r in rows)
+                marks = [r[high_water_index] for r in rows if r[high_water_index] is not None]
+                if marks and (self.high_water is None or max(marks) > self.high_water):
+                    self.high_water = max(marks)
+                total += len(rows)
+                if time.time() - reported_at >= self._WARM_PROGRESS:
+                    reported_at = time.time()
+                    logger.info('Cached {0} rows of {1} so far'.format(total, table_name))
+        finally:
+            result.close()
+
+        logger.info('Cached {0} rows of {1} in {2:.1f}s'.format(total, table_name, time.time() - started_at))
+        return total
 
     def lookup(self, key):
         """Accessor method for performing a cache lookup
@@ -135,8 +363,96 @@ class DimensionCache(object):
 
         Returns:
             int: dimension id for the given key in the cache
+
+        Note:
+            If the key belongs to a staged record, the pending batch is flushed so that an id can be returned.  In lazy
+            mode, a key missing from the cache is looked up in the database.
+        """
+        cache_id = self._cache.get(key)
+        if cache_id is not None:
+            self._hits += 1
+            return cache_id
+
+        self._misses += 1
+        if key in self._pending:
+            self.flush()
+            cache_id = self._flushed.get(key)
+        elif self.lazy:
+            cache_id = self._fetch([key]).get(key)
+        return cache_id
+
+    def load_snapshot(self, path):
+        """Start the cache from a snapshot file written by save_snapshot.
+
+        The snapshot is mapped read-only and shared with other processes using the same file; ids cached afterwards
+        are kept in memory on top of it.
+
+        Args:
+            path (str): snapshot file path
+
+        Raises:
+            DimensionCacheException: if the snapshot was written for another table, key or high-water column
+        """
+        snapshot = read_snapshot(path)
+        expected = (self._model.__tablename__, list(self._key_columns), self._high_water_column)
+        found = (snapshot.header.get('table'), snapshot.header.get('key_columns'),
+                 snapshot.header.get('high_water_column'))
+        if found != expected:
+            raise DimensionCacheException('Snapshot {0} does not match {1!r} (found {2!r})'.format(
+                path,
+                expected,
+                found
+            ))
+
+        self._cache = LayeredCache(snapshot.cache, self._cache)
+        self.high_water = snapshot.high_water
+        self.snapshot = snapshot
+        logger.info('Loaded {0} rows of {1} from snapshot {2} (high water {3})'.format(
+            len(snapshot.cache),
+            self._model.__tablename__,
+            path,
+            self.high_water
+        ))
+
+    def save_snapshot(self, path):
+        """Write the cache and its high-water mark to a snapshot file.
+
+        Args:
+            path (str): snapshot file path
+
+        Returns:
+            int: number of entries written
+
+        Note:
+            Staged records are flushed first.  Only save a snapshot once the records it contains are committed, and
+            keep the where_clause the same for every cache using the snapshot.  The high-water mark is the one read
+            when the cache was warmed: rows written since (by this cache or by concurrent writers, whose ids may be
+            lower than this cache's) are read again from the database when the snapshot is loaded.
         """
-        return self._cache.get(key)
+        self.flush()
+        count = write_snapshot(
+            path,
+            self._cache,
+            high_water=self.high_water,
+            table=self._model.__tablename__,
+            key_columns=list(self._key_columns),
+            high_water_column=self._high_water_column
+        )
+        logger.info('Saved {0} rows of {1} to snapshot {2}'.format(count, self._model.__tablename__, path))
+        return count
+
+    def memory_usage(self):
+        """Report the memory used by the cache, to help size workers.
+
+        Returns:
+            dict: table name, backend name, number of cached entries and estimated size in bytes
+        """
+        return {
+            'table': self._model.__tablename__,
+            'backend': type(self._cache).__name__,
+            'entries': len(self._cache),
+            'bytes': self._cache.memory_usage()
+        }
 
     def merge(self, record):
         """Merge a record to the database.
@@ -146,19 +462,350 @@ class DimensionCache(object):
 
         Returns:
             int: dimension id for the record generated/returned
+            DeferredId: handle for the dimension id when the record is staged by a batched cache
 
         Note:
             Connection is only flushed.  Persistence of record will have to be performed outside class scope.
         """
         key = tuple([record[kc] for kc in self._key_columns])
-        cache_id = self.lookup(key)
+        cache_id = self._cache.get(key)
         if cache_id is None:
-            d = self._model.from_dict(record, subset=[c.name for c in self._model.__table__.columns])
+            self._misses += 1
+            if self.lazy and not self.batch_size:
+                cache_id = self._fetch([key]).get(key)
+        else:
+            self._hits += 1
+
+        if cache_id is not None:
+            self.counts['exist'] += 1
+        elif self.batch_size:
+            staged = self._pending.get(key)
+            if staged is None:
+                cache_id = DeferredId(self, key)
+                self._pending[key] = (record, cache_id)
+                self.counts['insert'] += 1
+                if len(self._pending) >= self.batch_size:
+                    self.flush()
+            else:
+                cache_id = staged[1]
+                self.counts['exist'] += 1
+        else:
+            d = self._model.from_dict(record, subset=self._columns)
             self._connection.session.add(d)
             self._connection.session.flush()
             cache_id = self._cache[key] = d.id
             self.counts['insert'] += 1
-        else:
-            self.counts['exist'] += 1
 
         return cache_id
+
+    def lookup_many(self, keys):
+        """Accessor method for performing cache lookups for a batch of keys
+
+        Args:
+            keys (iterable): cache keys
+
+        Returns:
+            list: dimension id (or None) for each key, in input order
+        """
+        keys = list(keys)
+        self.flush()
+        get = self._cache.get
+        ids = dict((key, get(key)) for key in set(keys))
+        misses = [key for key, cache_id in ids.items() if cache_id is None]
+        self._hits += len(ids) - len(misses)
+        self._misses += len(misses)
+        if misses and self.lazy:
+            ids.update(self._fetch(misses))
+        return [ids[key] for key in keys]
+
+    def merge_many(self, records):
+        """Merge a batch of records to the database.
+
+        Keys are de-duplicated within the batch, the cache is hit once per distinct key and all misses are written
+        together in bulk.
+
+        Args:
+            records: list of dictionaries containing column-value pairs, or a columnar batch (dictionary of column
+                to sequence of values, e.g. NumPy arrays)
+
+        Returns:
+            list: dimension id for each record, in input order
+
+        Note:
+            Connection is only flushed.  Persistence of records will have to be performed outside class scope.
+        """
+        if isinstance(records, dict):
+            # NumPy arrays become lists of Python values, which the driver can bind and the cache keys compare to
+            records = dict((c, v.tolist() if hasattr(v, 'tolist') else v) for c, v in records.items())
+            keys = list(zip(*[records[kc] for kc in self._key_columns]))
+            columns = list(records.items())
+
+            def record_at(i):
+                return dict((c, v[i]) for c, v in columns)
+        else:
+            records = list(records)
+            keys = [tuple([r[kc] for kc in self._key_columns]) for r in records]
+            record_at = records.__getitem__
+
+        if not keys:
+            return []
+
+        self.flush()
+        first = dict(zip(reversed(keys), range(len(keys) - 1, -1, -1)))     # first position of each distinct key
+        get = self._cache.get
+        ids = {}
+        misses = []
+        for key in first:
+            cache_id = ids[key] = get(key)
+            if cache_id is None:
+                misses.append(key)
+        self._hits += len(first) - len(misses)
+        self._misses += len(misses)
+
+        if misses and self.lazy:
+            found = self._fetch(misses)
+            ids.update(found)
+            misses = [key for key in misses if key not in found]
+
+        if misses:
+            misses.sort(key=first.get)  # write new records in input order
+            inserted = self._insert([record_at(first[key]) for key in misses], misses)
+            self._cache.update(inserted)
+            ids.update(inserted)
+
+        self.counts['insert'] += len(misses)
+        self.counts['exist'] += len(keys) - len(misses)
+        return [ids[key] for key in keys]
+
+    def flush(self):
+        """Write all staged records in bulk and resolve their ids.
+
+        Returns:
+            int: number of records written
+
+        Note:
+            Connection is only flushed.  Persistence of records will have to be performed outside class scope.
+        """
+        if not self._pending:
+            return 0
+
+        keys = list(self._pending)
+        found = {}
+        if self.lazy:
+            # staged keys may already be in the database; those were counted as inserts when they were staged
+            found = self._fetch(keys)
+            self.counts['insert'] -= len(found)
+            self.counts['exist'] += len(found)
+            keys = [key for key in keys if key not in found]
+
+        inserted = self._insert([self._pending[key][0] for key in keys], keys) if keys else {}
+        self._cache.update(inserted)
+        self._flushed = found
+        self._flushed.update(inserted)
+        self._pending.clear()
+        logger.debug('Wrote {0} new records to {1}'.format(len(keys), self._model.__tablename__))
+        return len(keys)
+
+    def _insert(self, records, keys):
+        """Insert new dimension records in bulk.
+
+        Args:
+            records (list): dictionaries containing column-value pairs
+            keys (list): cache keys of the records (in the same order)
+
+        Returns:
+            dict: dimension id for each cache key
+        """
+        session = self._connection.session
+        rows = [dict((c, r[c]) for c in self._columns if c in r) for r in records]
+        key_columns = [getattr(self._model, kc) for kc in self._key_columns]
+
+        if self._connection.engine.dialect.name == 'postgresql' and all(r.keys() == rows[0].keys() for r in rows):
+            # multi-row VALUES with RETURNING resolves the ids in the same round trip
+            table = self._model.__table__
+            index = self._key_index(keys)
+            ids = {}
+            for i in range(0, len(rows), self._VALUES_ROWS):
+                statement = table.insert().values(rows[i:i + self._VALUES_ROWS]).returning(table.c.id, *key_columns)
+                for r in session.execute(statement):
+                    for key in index.get(self._normalize_key(r[1:]), ()):
+                        ids[key] = r[0]
+        else:
+            session.bulk_insert_mappings(self._model, rows)
+            ids = self._select_ids(keys)
+
+        missing = [key for key in keys if key not in ids]
+        if missing:
+            raise DimensionCacheException('Could not resolve ids for {0} new records in {1} (e.g. {2!r})'.format(
+                len(missing),
+                self._model.__tablename__,
+                missing[0]
+            ))
+        return ids
+
+    def _select_ids(self, keys):
+        """Re-select dimension ids for the given keys (only rows matching the cache's where_clause).
+
+        Keys are bound and matched in normalized form (see _normalize_key), so the ids are found whatever the types
+        of the key values given.
+
+        Args:
+            keys (list): cache keys
+
+        Returns:
+            dict: dimension id for each cache key found in the database
+        """
+        key_columns = [getattr(self._model, kc) for kc in self._key_columns]
+        chunk_size = max(1, self._SELECT_PARAMETERS // len(key_columns))
+        index = self._key_index(keys)
+        normalized = list(index)
+        ids = {}
+        for i in range(0, len(normalized), chunk_size):
+            query = self._connection.session.query(self._model.id, *key_columns).filter(
+                key_filter(key_columns, normalized[i:i + chunk_size], self._connection.engine.dialect.name)
+            )
+            if self._where_clause is not None:
+                query = query.filter(self._where_clause)
+            for d in query:
+                for key in index.get(self._normalize_key(d[1:]), ()):
+                    ids[key] = d[0]
+        return ids
+
+
+class DateResolver(object):
+    """Resolves dates to Date dimension ids without a generic key cache.
+
+    The Date dimension is a dense calendar, so ids are kept in an array indexed by day (ordinal) from the first date
+    in the table; when ids also follow the calendar without gaps (as after init), resolving is plain arithmetic.  Dates
+    missing from the array (gaps, or outside the loaded range) fall back to a database lookup.
+
+    Args:
+        connection (datapro.core.db.OrmConnection): database connection
+        model (Optional[sqlalchemy.ext.declarative.api.DeclarativeMeta]): Date dimension model (default is
+            datapro.core.model.common.Date)
+    """
+
+    _EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+    def __init__(self, connection, model=Date):
+        self._connection = connection
+        self._model = model
+        self._fallback = {}     # dates looked up in the database since the resolver was built (None if missing)
+        self._offset = None     # id - ordinal, when ids follow the calendar
+        self._ids = array('q')
+        self._first = 0
+
+        rows = self._connection.session.query(model.date, model.id).order_by(model.date).all()
+        if rows:
+            self._first = rows[0][0].toordinal()
+            span = rows[-1][0].toordinal() - self._first + 1
+            offset = rows[0][1] - self._first
+            if len(rows) == span and all(i - d.toordinal() == offset for d, i in rows):
+                self._offset = offset
+            self._ids = array('q', [0]) * span
+            for d, i in rows:
+                self._ids[d.toordinal() - self._first] = i
+        logger.info('Resolving {0} dates of {1} ({2})'.format(
+            len(rows),
+            model.__tablename__,
+            'by offset' if self._offset is not None else 'by ordinal array'
+        ))
+
+    def _lookup(self, dates):
+        """Fall back to the database for dates missing from the array.
+
+        Dates not in the dimension are remembered as misses, so they are never looked up again.
+
+        Returns:
+            dict: id of each date found
+        """
+        dates = list(dates)
+        found = {}
+        for i in range(0, len(dates), DimensionCache._SELECT_PARAMETERS):
+            query = self._connection.session.query(self._model.date, self._model.id).filter(
+                self._model.date.in_(dates[i:i + DimensionCache._SELECT_PARAMETERS])
+            )
+            found.update(query)
+        self._fallback.update((d, None) for d in dates)
+        self._fallback.update(found)
+        return found
+
+    def resolve(self, d):
+        """Resolve a date to its id.
+
+        Args:
+            d (datetime.date): date (the date part of a datetime is used)
+
+        Returns:
+            int: Date dimension id, or None if the date is not in the dimension
+        """
+        if d is None:
+            return None
+        if isinstance(d, datetime.datetime):
+            d = d.date()
+        i = d.toordinal() - self._first
+        if 0 <= i < len(self._ids):
+            if self._offset is not None:
+                return i + self._first + self._offset
+            cache_id = self._ids[i]
+            if cache_id:
+                return cache_id
+        if d not in self._fallback:
+            self._lookup([d])
+        return self._fallback.get(d)
+
+    def resolve_many(self, dates):
+        """Resolve a column of dates to ids.
+
+        Args:
+            dates: sequence of dates, or a NumPy datetime64 array
+
+        Returns:
+            list: Date dimension id (or None) for each date, in input order (a NumPy int64 array, with 0 for dates
+                not in the dimension, for datetime64 input)
+        """
+        if numpy is not None and isinstance(dates, numpy.ndarray) and dates.dtype.kind == 'M':
+            return self._resolve_datetime64(dates)
+
+        size = len(self._ids)
+        first = self._first
+        ids = self._ids
+        result = []
+        missing = set()
+        for d in dates:
+            if d is None:
+                result.append(None)
+                continue
+            if isinstance(d, datetime.datetime):
+                d = d.date()
+            i = d.toordinal() - first
+            cache_id = ids[i] if 0 <= i < size else 0
+            if not cache_id:
+                cache_id = self._fallback.get(d, _UNKNOWN)
+                if cache_id is _UNKNOWN:
+                    missing.add(d)
+                    cache_id = d
+            result.append(cache_id)
+
+        if missing:
+            found = self._lookup(missing)
+            result = [found.get(r) if isinstance(r, datetime.date) else r for r in result]
+        return result
+
+    def _resolve_datetime64(self, dates):
+        ordinals = dates.astype('datetime64[D]').astype(numpy.int64) + self._EPOCH_ORDINAL - self._first
+        ids = numpy.frombuffer(self._ids, dtype=numpy.int64) if len(self._ids) else numpy.zeros(0, numpy.int64)
+        inside = (ordinals >= 0) & (ordinals < len(ids)) & ~numpy.isnat(dates)
+        result = numpy.zeros(len(dates), dtype=numpy.int64)
+        result[inside] = ids[ordinals[inside]]
+        gaps = numpy.flatnonzero((result == 0) & ~numpy.isnat(dates))
+        if len(gaps):
+            gap_dates = [datetime.date.fromordinal(int(o) + self._first) for o in ordinals[gaps]]
+            known = dict(self._fallback)
+            known.update(self._lookup(set(gap_dates) - set(known)))
+            result[gaps] = [known.get(d) or 0 for d in gap_dates]
+        return result
+
+
+class DimensionCacheException(Exception):
+    pass
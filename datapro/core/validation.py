@@ -3,19 +3,156 @@
 import datetime
 import logging
 import time
+from collections import namedtuple
 from decimal import Decimal, ROUND_HALF_UP
 
 import xlrd
 
-from datapro.base.util import to_utc
+try:
+    import numpy
+except ImportError:     # only required by ColumnValidator
+    numpy = None
+
+from datapro.base.util import date_parser, to_utc
 
 logger = logging.getLogger(__name__)
 
+MESSAGE_NULL = 'Nulls are not allowed'
+MESSAGE_BLANK = 'Blank strings are not allowed'
+MESSAGE_NULL_AS_BLANK = 'Interpreted null as blank, but blank strings are not allowed'
+MESSAGE_DATE = '"{0}" could not be converted to a date'
+MESSAGE_DATETIME = '"{0}" could not be converted to a date and time'
+MESSAGE_DECIMAL = '"{0}" could not be converted to a number'
+MESSAGE_INT = '"{0}" could not be converted to an integer'
+MESSAGE_LOOKUP = '"{0}" is not in mapping'
+MESSAGE_MAX_LENGTH = '"{0}" is {1} characters long, but the maximum allowed length is {2}'
+
+_QUANTIZERS = {}
+
+
+def quantizer(precision):
+    """Decimal quantizer for a number of decimal places (built once per precision).
+
+    Args:
+        precision (int): number of decimal places
+
+    Returns:
+        decimal.Decimal: exponent to quantize to
+    """
+    q = _QUANTIZERS.get(precision)
+    if q is None:
+        q = _QUANTIZERS[precision] = Decimal('1.{places}'.format(places='0'*precision))
+    return q
+
+
+Failure = namedtuple('Failure', ('key', 'message', 'args', 'context'))
+Failure.__doc__ = """A validation failure recorded by a FailureCollector.
+
+Attributes:
+    key (str): field that failed
+    message (str): message class, i.e. the unformatted message (one of the MESSAGE_* constants)
+    args (tuple): values the message is formatted with (the failing value first)
+    context: caller-supplied context of the row (e.g. a source row number), see Validator.reset
+"""
+
+
+class FailureCollector(object):
+    """Aggregates validation failures instead of logging each one.
+
+    Failures are counted per field and message class, with a bounded sample of failing values, and summarised in one
+    log line per class by ``emit``, which ``tick`` calls every ``interval`` seconds.  Individual failures are also kept
+    (up to ``max_records``) so they can be written to a reject table in bulk; see ``drain``.
+
+    Args:
+        interval (Optional[int]): seconds between summaries emitted by tick (default is 60)
+        sample_size (Optional[int]): distinct failing values kept per field and message class for the summary
+        max_records (Optional[int]): individual failures kept until drained; further failures are only counted
+    """
+
+    def __init__(self, interval=60, sample_size=5, max_records=100000):
+        self.interval = interval
+        self.sample_size = sample_size
+        self.max_records = max_records
+        self._counts = {}
+        self._samples = {}
+        self._records = []
+        self._emitted_at = time.time()
+        self.dropped = 0    # failures not kept as records since the last drain
+        self.totals = {}    # failures per (field, message class) since the collector was created
+
+    def add(self, key, message, args=(), context=None, count=1):
+        """Record a failure.
+
+        Args:
+            key (str): field that failed
+            message (str): unformatted message
+            args (tuple): values the message is formatted with (the failing value first)
+            context: caller-supplied context of the row
+            count (Optional[int]): number of failures this entry stands for (e.g. for a whole column)
+        """
+        k = (key, message)
+        self._counts[k] = self._counts.get(k, 0) + count
+        self.totals[k] = self.totals.get(k, 0) + count
+        samples = self._samples.setdefault(k, [])
+        if len(samples) < self.sample_size and args not in samples:
+            samples.append(args)
+        if len(self._records) < self.max_records:
+            self._records.append(Failure(key, message, args, context))
+        else:
+            self.dropped += 1
+
+    def drain(self):
+        """Hand over the individual failures recorded so far (e.g. to write them to a reject table).
+
+        Returns:
+            list: Failure records, oldest first
+        """
+        records, self._records = self._records, []
+        self.dropped = 0
+        return records
+
+    def emit(self):
+        """Log a summary of the failures counted since the last summary.
+
+        Returns:
+            int: number of failures summarised
+        """
+        total = 0
+        for (key, message), count in sorted(self._counts.items(), key=lambda i: (str(i[0][0]), i[0][1])):
+            samples = self._samples[key, message]
+            if samples and samples[0]:
+                logger.warn('{0}: {1} failures, e.g. {2} (sample values: {3})'.format(
+                    key,
+                    count,
+                    message.format(*samples[0]),
+                    ', '.join(repr(args[0]) for args in samples)
+                ))
+            else:
+                logger.warn('{0}: {1} failures: {2}'.format(key, count, message))
+            total += count
+        self._counts = {}
+        self._samples = {}
+        self._emitted_at = time.time()
+        return total
+
+    def tick(self):
+        """Emit a summary if the interval has elapsed since the last one.
+        """
+        if self._counts and time.time() - self._emitted_at >= self.interval:
+            self.emit()
+
 
 class Validator(object):
+    """Validates and converts the fields of a record, one call per field.
 
-    def __init__(self):
+    Args:
+        collector (Optional[FailureCollector]): aggregates failures instead of logging each one
+    """
+
+    def __init__(self, collector=None):
         self._message_template = None
+        self.collector = collector
+        self.context = None
         self.properties = None
         self.valid = None
 
@@ -26,56 +163,63 @@ class Validator(object):
             if nulls_ok:
                 self.properties[key] = value
             else:
-                self._fail(key, 'Nulls are not allowed', message_template)
+                self._fail(key, MESSAGE_NULL, message_template)
             return False
         elif isinstance(value, str) and value == '':
             if blank_is_null:
                 if nulls_ok:
                     self.properties[key] = None
                 else:
-                    self._fail(key, 'Blank strings are not allowed', message_template)
+                    self._fail(key, MESSAGE_BLANK, message_template)
                 return False
         return True
 
-    def _fail(self, key, message, message_template):
+    def _fail(self, key, message, message_template, *args):
         self.valid = False
+        if self.collector is not None:
+            self.collector.add(key, message, args, self.context)
+            return
+
         if not message_template:
             message_template = self._message_template
 
-        logger.warn(message_template.format(key=key, message=message))
+        logger.warn(message_template.format(key=key, message=message.format(*args) if args else message))
 
-    def reset(self, mesage_template=None):
+    def reset(self, mesage_template=None, context=None):
         if mesage_template:
             self._message_template = mesage_template
+        self.context = context
         self.properties = {}
         self.valid = True
+        if self.collector is not None:
+            self.collector.tick()
 
     def date(self, key, value, format, nulls_ok=False, message_template=None):
         if self._check_null(key, value, True, nulls_ok, message_template):
             if isinstance(format, str):
                 try:
-                    self.properties[key] = datetime.date(*(time.strptime(value, format)[:3]))
+                    self.properties[key] = date_parser(format).date(value)
                 except:
-                    self._fail(key, '"{0}" could not be converted to a date'.format(value), message_template)
+                    self._fail(key, MESSAGE_DATE, message_template, value)
             else:
                 try:
                     self.properties[key] = datetime.date(*(xlrd.xldate_as_tuple(value, format)[:3]))
                 except:
-                    self._fail(key, '"{0}" could not be converted to a date'.format(value), message_template)
+                    self._fail(key, MESSAGE_DATE, message_template, value)
 
     def datetime(self, key, value, format, tz=None, nulls_ok=False, message_template=None):
         if self._check_null(key, value, True, nulls_ok, message_template):
             if isinstance(format, str):
                 try:
-                    dt = datetime.datetime(*(time.strptime(value, format)[:6]))
+                    dt = date_parser(format).datetime(value)
                 except:
-                    self._fail(key, '"{0}" could not be converted to a date and time'.format(value), message_template)
+                    self._fail(key, MESSAGE_DATETIME, message_template, value)
                     return
             else:
                 try:
                     dt = datetime.datetime(*(xlrd.xldate_as_tuple(value, format)[:6]))
                 except:
-                    self._fail(key, '"{0}" could not be converted to a date and time'.format(value), message_template)
+                    self._fail(key, MESSAGE_DATETIME, message_template, value)
                     return
 
             if tz is not None:
@@ -84,31 +228,30 @@ class Validator(object):
 
     def decimal(self, key, value, precision, nulls_ok=False, message_template=None):
         if self._check_null(key, value, True, nulls_ok, message_template):
-            qp = '1.{places}'.format(places='0'*precision)
             try:
-                self.properties[key] = Decimal(value).quantize(Decimal(qp), rounding=ROUND_HALF_UP)
+                self.properties[key] = Decimal(value).quantize(quantizer(precision), rounding=ROUND_HALF_UP)
             except:
-                self._fail(key, '"{0}" could not be converted to a number'.format(value), message_template)
+                self._fail(key, MESSAGE_DECIMAL, message_template, value)
 
     def int(self, key, value, nulls_ok=False, message_template=None):
         if self._check_null(key, value, True, nulls_ok, message_template):
             try:
                 self.properties[key] = int(value)
             except:
-                self._fail(key, '"{0}" could not be converted to an integer'.format(value), message_template)
+                self._fail(key, MESSAGE_INT, message_template, value)
 
     def lookup(self, key, value, dictionary, miss_ok=False, nulls_ok=False, message_template=None):
         if self._check_null(key, value, False, nulls_ok, message_template):
             if isinstance(value, str):
                 if value == '':
-                    self._fail(key, 'Blank strings are not allowed', message_template)
+                    self._fail(key, MESSAGE_BLANK, message_template)
 
             if value in dictionary:
                 self.properties[key] = dictionary[value]
             elif miss_ok:
                 self.properties[key] = None
             else:
-                self._fail(key, '"{0}" is not in mapping'.format(value), message_template)
+                self._fail(key, MESSAGE_LOOKUP, message_template, value)
 
     def string(self, key, value, blanks_ok=False, convert_nulls_to_blank=False, max_length=0, nulls_ok=False, message_template=None):
 
@@ -117,21 +260,440 @@ class Validator(object):
                 if blanks_ok:
                     self.properties[key] = ''
                 else:
-                    self._fail(key, 'Interpreted null as blank, but blank strings are not allowed', message_template)
+                    self._fail(key, MESSAGE_NULL_AS_BLANK, message_template)
             elif not nulls_ok:
-                self._fail(key, 'Nulls are not allowed', message_template)
+                self._fail(key, MESSAGE_NULL, message_template)
         elif value == '' and not blanks_ok:
-            self._fail(key, 'Blank strings are not allowed', message_template)
+            self._fail(key, MESSAGE_BLANK, message_template)
         else:
             if 0 < max_length < len(str(value)):
-                self._fail(
-                    key,
-                    '"{0}" is {1} characters long, but the maximum allowed length is {2}'.format(
-                        value,
-                        len(str(value)),
-                        max_length
-                    ),
-                    message_template
-                )
+                self._fail(key, MESSAGE_MAX_LENGTH, message_template, value, len(str(value)), max_length)
             else:
                 self.properties[key] = str(value)
+
+
+def _check_null(key, value, blank_is_null, nulls_ok, errors):
+    """Schema counterpart of Validator._check_null: returns True if the value still needs to be converted.
+    """
+    if value is None:
+        if not nulls_ok:
+            errors.append((key, MESSAGE_NULL, ()))
+        return False
+    elif isinstance(value, str) and value == '':
+        if blank_is_null:
+            if not nulls_ok:
+                errors.append((key, MESSAGE_BLANK, ()))
+            return False
+    return True
+
+
+def _compile_date(key, format, nulls_ok=False):
+    if isinstance(format, str):
+        parse = date_parser(format).date
+    else:
+        def parse(value):
+            return datetime.date(*(xlrd.xldate_as_tuple(value, format)[:3]))
+
+    def convert(value, errors):
+        if _check_null(key, value, True, nulls_ok, errors):
+            try:
+                return parse(value)
+            except:
+                errors.append((key, MESSAGE_DATE, (value, )))
+    return convert
+
+
+def _compile_datetime(key, format, tz=None, nulls_ok=False):
+    if isinstance(format, str):
+        parse = date_parser(format).datetime
+    else:
+        def parse(value):
+            return datetime.datetime(*(xlrd.xldate_as_tuple(value, format)[:6]))
+
+    def convert(value, errors):
+        if _check_null(key, value, True, nulls_ok, errors):
+            try:
+                dt = parse(value)
+            except:
+                errors.append((key, MESSAGE_DATETIME, (value, )))
+                return None
+            return dt if tz is None else to_utc(dt, tz)
+    return convert
+
+
+def _compile_decimal(key, precision, nulls_ok=False):
+    exponent = quantizer(precision)
+
+    def convert(value, errors):
+        if _check_null(key, value, True, nulls_ok, errors):
+            try:
+                return Decimal(value).quantize(exponent, rounding=ROUND_HALF_UP)
+            except:
+                errors.append((key, MESSAGE_DECIMAL, (value, )))
+    return convert
+
+
+def _compile_int(key, nulls_ok=False):
+    def convert(value, errors):
+        if _check_null(key, value, True, nulls_ok, errors):
+            try:
+                return int(value)
+            except:
+                errors.append((key, MESSAGE_INT, (value, )))
+    return convert
+
+
+def _compile_lookup(key, dictionary, miss_ok=False, nulls_ok=False):
+    def convert(value, errors):
+        if _check_null(key, value, False, nulls_ok, errors):
+            if isinstance(value, str) and value == '':
+                errors.append((key, MESSAGE_BLANK, ()))
+            if value in dictionary:
+                return dictionary[value]
+            elif not miss_ok:
+                errors.append((key, MESSAGE_LOOKUP, (value, )))
+    return convert
+
+
+def _compile_string(key, blanks_ok=False, convert_nulls_to_blank=False, max_length=0, nulls_ok=False):
+    def convert(value, errors):
+        if value is None:
+            if convert_nulls_to_blank:
+                if blanks_ok:
+                    return ''
+                errors.append((key, MESSAGE_NULL_AS_BLANK, ()))
+            elif not nulls_ok:
+                errors.append((key, MESSAGE_NULL, ()))
+        elif value == '' and not blanks_ok:
+            errors.append((key, MESSAGE_BLANK, ()))
+        else:
+            value = str(value)
+            if 0 < max_length < len(value):
+                errors.append((key, MESSAGE_MAX_LENGTH, (value, len(value), max_length)))
+            else:
+                return value
+    return convert
+
+
+class RowValidator(object):
+    """Row validator compiled from a schema declared once, as the faster counterpart of calling Validator per field.
+
+    The schema maps each field to the type and options of the matching Validator method, e.g.::
+
+        RowValidator([
+            ('amount', {'type': 'decimal', 'precision': 2, 'nulls_ok': True}),
+            ('booked', {'type': 'date', 'format': '%Y-%m-%d'}),
+            ('name', {'type': 'string', 'max_length': 50})
+        ])
+
+    Quantizers, parsers and option checks are prepared when the schema is compiled rather than once per value.
+
+    Args:
+        schema (iterable): (field, options) pairs, or a dictionary of field to options, in output order
+        as_tuple (Optional[boolean]): return validated rows as tuples in schema order instead of dictionaries
+
+    Raises:
+        ValueError: if a field declares an unknown type
+    """
+
+    COMPILERS = {
+        'date': _compile_date,
+        'datetime': _compile_datetime,
+        'decimal': _compile_decimal,
+        'int': _compile_int,
+        'lookup': _compile_lookup,
+        'string': _compile_string
+    }
+
+    def __init__(self, schema, as_tuple=False):
+        if isinstance(schema, dict):
+            schema = schema.items()
+
+        self._fields = []
+        for key, options in schema:
+            options = dict(options)
+            kind = options.pop('type')
+            try:
+                compiler = RowValidator.COMPILERS[kind]
+            except KeyError:
+                raise ValueError('Field {0} has an unknown type, {1}'.format(key, kind))
+            self._fields.append((key, compiler(key, **options)))
+
+        self.as_tuple = as_tuple
+        self.keys = tuple(key for key, _ in self._fields)
+
+    def validate(self, row):
+        """Validate and convert a row.
+
+        Args:
+            row (dict): raw values by field (missing fields are treated as nulls)
+
+        Returns:
+            tuple: the validated row (dictionary or tuple; fields that failed are None) and a list of
+                (field, message, args) errors, the message unformatted (one of the MESSAGE_* constants, formatted with
+                args) so failures can be aggregated by message class (see FailureCollector.add)
+        """
+        errors = []
+        get = row.get
+        values = [convert(get(key), errors) for key, convert in self._fields]
+        if self.as_tuple:
+            return tuple(values), errors
+        return dict(zip(self.keys, values)), errors
+
+
+ColumnResult = namedtuple('ColumnResult', ('values', 'nulls', 'errors'))
+ColumnResult.__doc__ = """Result of validating a column.
+
+Attributes:
+    values (numpy.ndarray): converted values (rows that are null or failed hold a fill value)
+    nulls (numpy.ndarray): boolean mask of null rows
+    errors (numpy.ndarray): indexes of the rows that failed validation
+"""
+
+
+class ColumnValidator(object):
+    """Validates whole columns (lists or NumPy arrays) at once, as the batch counterpart of Validator.
+
+    Numeric columns, and integers written as plain digits in string columns, are converted with NumPy; other columns
+    are converted once per distinct value, which suits extracted data with repeated values.  NaN counts as null, as
+    it stands for a missing value in NumPy columns.  Each column logs at most one aggregated warning.
+
+    Args:
+        message_template (Optional[str]): template for warnings, formatted with key and message
+        collector (Optional[FailureCollector]): aggregates failures instead of logging them
+
+    Note:
+        Requires NumPy.
+    """
+
+    def __init__(self, message_template='{key}: {message}', collector=None):
+        if numpy is None:
+            raise ImportError('ColumnValidator requires numpy')
+        self._message_template = message_template
+        self.collector = collector
+
+    @staticmethod
+    def _column(values):
+        if isinstance(values, numpy.ndarray):
+            return values
+        column = numpy.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+
+    @staticmethod
+    def _nulls(column, blank_is_null):
+        kind = column.dtype.kind
+        if kind == 'f':
+            return numpy.isnan(column)
+        if kind != 'O':
+            if blank_is_null and kind == 'U':
+                return column == ''
+            return numpy.zeros(len(column), dtype=bool)
+        blank = '' if blank_is_null else None
+        return numpy.array([v is None or v == blank or (isinstance(v, float) and v != v) for v in column.tolist()],
+                           dtype=bool)
+
+    @staticmethod
+    def _blanks(column):
+        kind = column.dtype.kind
+        if kind == 'U':
+            return column == ''
+        if kind != 'O':
+            return numpy.zeros(len(column), dtype=bool)
+        return numpy.array([isinstance(v, str) and v == '' for v in column.tolist()], dtype=bool)
+
+    @staticmethod
+    def _plain_integers(text):
+        """Mask of the strings of a string ('U') column made only of ASCII digits, short enough to fit in an int64.
+        """
+        if not len(text) or text.dtype.itemsize == 0:
+            return numpy.zeros(len(text), dtype=bool)
+        codes = numpy.ascontiguousarray(text).view(numpy.uint32).reshape(len(text), -1)
+        digits = (codes >= 48) & (codes <= 57)
+        lengths = numpy.char.str_len(text)
+        return (digits.sum(axis=1) == lengths) & (lengths > 0) & (lengths <= 18)
+
+    def _report(self, key, total, failures, message_template):
+        """Log one warning summarising the failures of a column.
+
+        Args:
+            failures (list): (message, args, count) entries; args hold the first failing value, if any
+        """
+        if not failures:
+            return
+
+        if self.collector is not None:
+            for message, args, count in failures:
+                self.collector.add(key, message, args, count=count)
+            return
+
+        message = '{0} of {1} rows failed: {2}'.format(
+            sum(count for _, _, count in failures),
+            total,
+            '; '.join('{0} x {1}'.format(count, message.format(*args)) for message, args, count in failures)
+        )
+        logger.warn((message_template or self._message_template).format(key=key, message=message))
+
+    def _convert(self, key, values, convert, message, blank_is_null, nulls_ok, message_template, dtype=object,
+                 fill=None, total=None):
+        """Convert a column once per distinct non-null value.
+
+        Args:
+            total (Optional[int]): rows reported as validated (default is the length of the column)
+        """
+        column = self._column(values)
+        nulls = self._nulls(column, blank_is_null)
+        rows = column.tolist()
+        converted = {}
+        failed = []
+        for v in set(v for v, null in zip(rows, nulls.tolist()) if not null):
+            try:
+                converted[v] = convert(v)
+            except:
+                failed.append(v)
+
+        try:
+            result = numpy.array([converted.get(v, fill) for v in rows], dtype=dtype)
+        except OverflowError:
+            result = numpy.array([converted.get(v, fill) for v in rows], dtype=object)
+
+        errors = numpy.zeros(len(rows), dtype=bool)
+        failures = []
+        if failed:
+            failed = set(failed)
+            errors |= numpy.array([v in failed for v in rows], dtype=bool) & ~nulls
+            failures.append((message, (next(iter(failed)), ), int(errors.sum())))
+        if not nulls_ok and nulls.any():
+            # as with Validator, blank strings taken for nulls fail as blanks
+            blanks = self._blanks(column) & nulls if blank_is_null else numpy.zeros(len(rows), dtype=bool)
+            errors |= nulls
+            if (nulls & ~blanks).any():
+                failures.append((MESSAGE_NULL, (), int((nulls & ~blanks).sum())))
+            if blanks.any():
+                failures.append((MESSAGE_BLANK, (), int(blanks.sum())))
+
+        self._report(key, len(rows) if total is None else total, failures, message_template)
+        return ColumnResult(result, nulls, numpy.flatnonzero(errors))
+
+    def date(self, key, values, format, nulls_ok=False, message_template=None):
+        if isinstance(format, str):
+            convert = date_parser(format).date
+        else:
+            def convert(value):
+                return datetime.date(*(xlrd.xldate_as_tuple(value, format)[:3]))
+        return self._convert(key, values, convert, MESSAGE_DATE, True, nulls_ok, message_template)
+
+    def decimal(self, key, values, precision, nulls_ok=False, message_template=None):
+        exponent = quantizer(precision)
+
+        def convert(value):
+            return Decimal(value).quantize(exponent, rounding=ROUND_HALF_UP)
+        return self._convert(key, values, convert, MESSAGE_DECIMAL, True, nulls_ok, message_template)
+
+    def int(self, key, values, nulls_ok=False, message_template=None):
+        column = self._column(values)
+        kind = column.dtype.kind
+        if kind in 'biu':
+            return ColumnResult(column.astype(numpy.int64), numpy.zeros(len(column), dtype=bool),
+                                numpy.array([], dtype=numpy.intp))
+        if kind == 'f':
+            nulls = numpy.isnan(column)
+            valid = numpy.isfinite(column) & (numpy.abs(column) < 2.0 ** 63)
+            failed = ~valid & ~nulls
+            failures = []
+            if failed.any():
+                failures.append((MESSAGE_INT, (column[numpy.flatnonzero(failed)[0]], ), int(failed.sum())))
+            if not nulls_ok and nulls.any():
+                failed |= nulls
+                failures.append((MESSAGE_NULL, (), int(nulls.sum())))
+            self._report(key, len(column), failures, message_template)
+            return ColumnResult(numpy.where(valid, column, 0).astype(numpy.int64), nulls, numpy.flatnonzero(failed))
+
+        # plain digit strings are parsed by NumPy, the others (signs, spaces, nulls, failures) one by one
+        text = column if kind == 'U' else column.astype(str)
+        plain = self._plain_integers(text)
+        if not plain.any():
+            return self._convert(key, column, int, MESSAGE_INT, True, nulls_ok, message_template, numpy.int64, 0)
+        result = numpy.zeros(len(column), dtype=numpy.int64)
+        result[plain] = text[plain].astype(numpy.int64)
+        nulls = numpy.zeros(len(column), dtype=bool)
+        errors = numpy.array([], dtype=numpy.intp)
+        others = numpy.flatnonzero(~plain)
+        if len(others):
+            rest = self._convert(key, column[others], int, MESSAGE_INT, True, nulls_ok, message_template, numpy.int64,
+                                 0, total=len(column))
+            if rest.values.dtype != result.dtype:
+                result = result.astype(object)  # integers beyond int64, as _convert returns them
+            result[others] = rest.values
+            nulls[others] = rest.nulls
+            errors = others[rest.errors]
+        return ColumnResult(result, nulls, errors)
+
+    def lookup(self, key, values, dictionary, miss_ok=False, nulls_ok=False, message_template=None):
+        column = self._column(values)
+        nulls = self._nulls(column, False)
+        rows = column.tolist()
+        mapped = {}
+        missed = []
+        for v in set(v for v, null in zip(rows, nulls.tolist()) if not null):
+            if v in dictionary:
+                mapped[v] = dictionary[v]
+            elif not miss_ok:
+                missed.append(v)
+
+        result = numpy.empty(len(rows), dtype=object)
+        result[:] = [mapped.get(v) for v in rows]
+        errors = numpy.zeros(len(rows), dtype=bool)
+        failures = []
+        blanks = numpy.array([isinstance(v, str) and v == '' for v in rows], dtype=bool)
+        if blanks.any():
+            errors |= blanks
+            failures.append((MESSAGE_BLANK, (), int(blanks.sum())))
+        if missed:
+            missed = set(missed)
+            misses = numpy.array([v in missed for v in rows], dtype=bool) & ~nulls
+            errors |= misses
+            failures.append((MESSAGE_LOOKUP, (next(iter(missed)), ), int(misses.sum())))
+        if not nulls_ok and nulls.any():
+            errors |= nulls
+            failures.append((MESSAGE_NULL, (), int(nulls.sum())))
+
+        self._report(key, len(rows), failures, message_template)
+        return ColumnResult(result, nulls, numpy.flatnonzero(errors))
+
+    def string(self, key, values, blanks_ok=False, convert_nulls_to_blank=False, max_length=0, nulls_ok=False,
+               message_template=None):
+        column = self._column(values)
+        nulls = self._nulls(column, False)
+        text = column.astype(str)
+        failures = []
+        errors = numpy.zeros(len(column), dtype=bool)
+
+        if nulls.any():
+            text[nulls] = ''
+            if convert_nulls_to_blank:
+                if blanks_ok:
+                    nulls = numpy.zeros(len(column), dtype=bool)
+                else:
+                    errors |= nulls
+                    failures.append((MESSAGE_NULL_AS_BLANK, (), int(nulls.sum())))
+            elif not nulls_ok:
+                errors |= nulls
+                failures.append((MESSAGE_NULL, (), int(nulls.sum())))
+
+        if not blanks_ok:
+            blanks = (text == '') & ~nulls & ~errors
+            if blanks.any():
+                errors |= blanks
+                failures.append((MESSAGE_BLANK, (), int(blanks.sum())))
+
+        if max_length > 0:
+            lengths = numpy.char.str_len(text)
+            too_long = (lengths > max_length) & ~errors
+            if too_long.any():
+                errors |= too_long
+                first = numpy.flatnonzero(too_long)[0]
+                failures.append((MESSAGE_MAX_LENGTH, (text[first], lengths[first], max_length), int(too_long.sum())))
+
+        self._report(key, len(column), failures, message_template)
+        return ColumnResult(text, nulls, numpy.flatnonzero(errors))
@@ -87,7 +87,9 @@ setup(
     # for example:
     # $ pip install -e .[dev,test]
     extras_require={
+        'async': ['SQLAlchemy>=1.4', 'aiosqlite'],
         'dev': ['check-manifest'],
+        'numpy': ['numpy'],
         'test': ['coverage'],
     },
 
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Models and SQLite connections shared by the tests.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import Column, DATETIME, INTEGER, VARCHAR, event
+
+from datapro import IdMixin, Model
+from datapro.core.db import Connection, OrmConnection
+
+
+class Customer(Model, IdMixin):
+    __schema__ = None
+    __table_name__ = 'TestCustomer'
+    __table_name_mask__ = '{__table_type__}_{__table_name__}'
+    __table_type__ = 'DIM'
+
+    code = Column(VARCHAR(20), nullable=False)
+    region = Column(INTEGER, nullable=False)
+    current = Column(INTEGER, nullable=False, default=1)
+    name = Column(VARCHAR(50))
+    updated_at = Column(DATETIME)
+
+
+class Sale(Model, IdMixin):
+    __schema__ = None
+    __table_name__ = 'TestSale'
+    __table_name_mask__ = '{__table_type__}_{__table_name__}'
+    __table_type__ = 'FACT'
+
+    customer_id = Column(INTEGER)
+    amount = Column(INTEGER)
+    note = Column(VARCHAR(50))
+
+
+def sqlite_config(path):
+    """Configuration of a connection named after the database file (so every test gets its own engine).
+    """
+    return path, {'db': {path: {'connection_string': 'sqlite:///' + path}}}
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Test case with a SQLite database file, holding the test models, in a temporary directory.
+
+    SQLite databases named after schemas (e.g. common) are attached to every connection.
+    """
+
+    models = (Customer, Sale)
+    schemas = ()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'test.db')
+        self.name, self.config = sqlite_config(self.path)
+        self.connection = self.orm_connection()
+        Model.metadata.create_all(self.connection.engine, tables=[m.__table__ for m in self.models])
+
+    def _attach_schemas(self, engine):
+        schemas = [(s, os.path.join(self.directory, s + '.db')) for s in self.schemas]
+        if schemas and not getattr(engine, '_test_schemas', False):
+            @event.listens_for(engine, 'connect')
+            def attach(dbapi_connection, connection_record):
+                for schema, path in schemas:
+                    dbapi_connection.execute("ATTACH DATABASE '{0}' AS {1}".format(path, schema))
+            engine._test_schemas = True
+
+    def orm_connection(self, **kwargs):
+        connection = OrmConnection(self.name, self.config, **kwargs)
+        self._attach_schemas(connection.engine)
+        self.addCleanup(connection.session.close)
+        return connection
+
+    def core_connection(self):
+        connection = Connection(self.name, self.config)
+        self._attach_schemas(connection.engine)
+        return connection
+
+    def count(self, model, where=''):
+        return self.connection.session.execute(
+            'SELECT count(*) FROM "{0}" {1}'.format(model.__tablename__, where)
+        ).scalar()
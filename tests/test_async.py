@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from sqlalchemy import select
+
+from datapro.core.db import AsyncConnection, AsyncOrmConnection, async_engines, create_async_engine
+from datapro.core.job import AsyncEtlJob
+from tests.support import Customer, DatabaseTestCase, Sale
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+
+@unittest.skipIf(create_async_engine is None or aiosqlite is None, 'requires SQLAlchemy 1.4 or later and aiosqlite')
+class AsyncEtlJobTest(DatabaseTestCase):
+
+    def test_block_flush(self):
+        async def load(job):
+            connection = AsyncOrmConnection(self.name, self.config, flush_block_size=2, commit_on_flush=True)
+            try:
+                for amount in range(5):
+                    connection.session.add(Sale(amount=amount))
+                    await connection.block_flush()
+                await connection.flush_block()
+            finally:
+                await connection.session.close()
+            return connection
+
+        with AsyncEtlJob('job') as job:
+            connection = job.run(load(job))
+        self.assertEqual(connection.flush_stats['blocks'], 3)
+        self.assertEqual(connection.flush_stats['rows'], 5)
+        self.assertEqual((connection.last_block['rows'], connection.last_block['block_size']), (1, 2))
+        self.assertEqual(self.count(Sale), 5)
+        self.assertEqual(async_engines.keys(), set())
+
+    def test_transfer(self):
+        session = self.connection.session
+        session.add_all([Sale(amount=i, note='n{0}'.format(i)) for i in range(10)])
+        session.commit()
+
+        async def main(job):
+            source = AsyncConnection(self.name, self.config)
+            target = AsyncConnection(self.name, self.config)
+
+            async def load(rows):
+                await target.execute(Customer.__table__.insert(), [{'code': r.note, 'region': r.amount} for r in rows])
+
+            return await job.transfer([source.stream(select([Sale.__table__]), batch_size=4)], load)
+
+        with AsyncEtlJob('job') as job:
+            counts = job.run(main(job))
+        self.assertEqual(counts, {'batches': 3, 'rows': 10})
+        self.assertEqual(self.count(Customer), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import pickle
+import random
+import time
+import unittest
+
+from datapro.base import BaseConfig, FrozenConfig
+from datapro.base.util import DateParser, date_parser, dict_merge, to_utc, to_utc_many
+
+
+class DictMergeTest(unittest.TestCase):
+
+    def test_merge(self):
+        master = {'a': 1, 'db': {'x': {'host': 'h', 'port': 1}}, 'engine': {'pool_size': 5}}
+        merged = dict_merge(master, {'db': {'x': {'port': 2}, 'y': {}}, 'b': [1]})
+        self.assertEqual(merged, {
+            'a': 1,
+            'b': [1],
+            'db': {'x': {'host': 'h', 'port': 2}, 'y': {}},
+            'engine': {'pool_size': 5}
+        })
+        self.assertEqual(master['db']['x']['port'], 1)
+
+    def test_result_shares_nothing_mutable(self):
+        master = {'db': {'x': {'host': 'h'}}, 'engine': {'pool_size': 5}}
+        override = {'db': {'y': {'hosts': ['a']}}}
+        merged = dict_merge(master, override)
+        merged['engine']['pool_size'] = 10
+        merged['db']['x']['host'] = 'changed'
+        merged['db']['y']['hosts'].append('b')
+        self.assertEqual(master, {'db': {'x': {'host': 'h'}}, 'engine': {'pool_size': 5}})
+        self.assertEqual(override, {'db': {'y': {'hosts': ['a']}}})
+
+    def test_base_config_copies_initial_dict(self):
+        initial = {'db': {'x': {'host': 'h'}}}
+        config = BaseConfig(initial)
+        config['db']['x']['host'] = 'changed'
+        config.merge({'db': {'y': {'host': 'i'}}})
+        self.assertEqual(initial, {'db': {'x': {'host': 'h'}}})
+        self.assertEqual(config, {'db': {'x': {'host': 'changed'}, 'y': {'host': 'i'}}})
+
+    def test_frozen_values_are_shared(self):
+        frozen = FrozenConfig({'x': {'host': 'h'}})
+        merged = dict_merge({'db': frozen}, {'engine': {}})
+        self.assertIs(merged['db'], frozen)
+
+
+class FrozenConfigTest(unittest.TestCase):
+
+    def test_thaw(self):
+        config = FrozenConfig({'a': {'b': [1, {'c': 2}], 'd': {3}}})
+        self.assertIsInstance(config['a']['b'], tuple)
+        thawed = config.thaw()
+        self.assertEqual(thawed, {'a': {'b': [1, {'c': 2}], 'd': {3}}})
+        self.assertIs(type(thawed['a']['b'][1]), dict)
+        thawed['a']['b'][1]['c'] = 4
+        self.assertEqual(config['a']['b'][1]['c'], 2)
+
+    def test_merge_shares_unchanged_parts(self):
+        config = FrozenConfig({'db': {'x': {'host': 'h'}}, 'engine': {'pool_size': 5}})
+        merged = config.merge({'db': {'y': {'host': 'i'}}})
+        self.assertIs(merged['engine'], config['engine'])
+        self.assertIs(merged['db']['x'], config['db']['x'])
+        self.assertEqual(merged['db']['y'], FrozenConfig({'host': 'i'}))
+        self.assertNotIn('y', config['db'])
+
+    def test_hash_and_pickle(self):
+        config = FrozenConfig({'db': {'x': {'hosts': ['a', 'b']}}})
+        self.assertEqual(pickle.loads(pickle.dumps(config)), config)
+        self.assertEqual(hash(pickle.loads(pickle.dumps(config))), hash(config))
+
+
+def _outcome(parse, value):
+    """Value parsed, or the type of the exception raised.
+    """
+    try:
+        return parse(value)
+    except Exception as e:
+        return type(e)
+
+
+class DateParserTest(unittest.TestCase):
+
+    FORMATS = ('%Y-%m-%d', '%Y%m%d', '%d/%m/%Y %H:%M:%S', '%m.%d.%Y %H:%M', '%Y-%m-%dT%H:%M:%S', '%H%M%S %Y',
+               '(%d) [%m] %Y')
+
+    def values(self, format):
+        """Values formatted from random fields (some out of range), then mutated.
+        """
+        rng = random.Random(format)
+        values = []
+        for _ in range(3000):
+            fields = {
+                'Y': str(rng.choice([1900, 1999, 2000, 2020, 2024, 9999, rng.randint(1000, 9999)])),
+                'm': rng.choice(['01', '1', '09', '12', '13', '00', ' 3', str(rng.randint(1, 12))]),
+                'd': rng.choice(['01', '1', ' 5', '29', '30', '31', '32', '00', str(rng.randint(1, 31))]),
+                'H': rng.choice(['00', '0', '9', '23', '24', str(rng.randint(0, 23))]),
+                'M': rng.choice(['00', '7', '59', '60', str(rng.randint(0, 59))]),
+                'S': rng.choice(['00', '5', '59', '60', '61', '62', str(rng.randint(0, 59))])
+            }
+            value = format
+            for directive, field in fields.items():
+                value = value.replace('%' + directive, field)
+            mutation = rng.randint(0, 9)
+            if mutation == 0:
+                value = value.replace(' ', rng.choice(['  ', '\t', ' \n ']))
+            elif mutation == 1:
+                value += rng.choice(['x', ' ', '0', 'Z'])           # unconverted data
+            elif mutation == 2:
+                value = ' ' + value
+            elif mutation == 3 and value:
+                i = rng.randrange(len(value))
+                value = value[:i] + value[i + 1:]
+            elif mutation == 4:
+                value = value.replace('-', '/')
+            values.append(value)
+        return values
+
+    def test_same_as_strptime(self):
+        for format in self.FORMATS:
+            parser = DateParser(format)
+            self.assertIsNotNone(parser._regex, format)
+
+            def strptime_date(value):
+                return datetime.date(*time.strptime(value, format)[:3])
+
+            def strptime_datetime(value):
+                return datetime.datetime(*time.strptime(value, format)[:6])
+
+            outcomes = set()
+            for value in self.values(format):
+                expected = _outcome(strptime_datetime, value)
+                self.assertEqual(_outcome(parser.datetime, value), expected, (format, value))
+                self.assertEqual(_outcome(parser.date, value), _outcome(strptime_date, value), (format, value))
+                outcomes.add(expected is ValueError)
+            self.assertEqual(outcomes, {True, False}, format)
+
+    def test_fallback(self):
+        for format in ('%d %b %Y', '%Y-%m-%d %I:%M %p', '%Y-%m-%d %Y', '%y%m%d'):
+            parser = DateParser(format)
+            self.assertIsNone(parser._regex, format)
+            for value in ('05 Mar 2020', '2020-03-05 01:30 PM', '2020-03-05 2020', '200305', '2020-13-01', ''):
+                self.assertEqual(
+                    _outcome(parser.datetime, value),
+                    _outcome(lambda v: datetime.datetime(*time.strptime(v, format)[:6]), value),
+                    (format, value)
+                )
+
+    def test_shared_parser(self):
+        self.assertIs(date_parser('%Y-%m-%d'), date_parser('%Y-%m-%d'))
+
+
+class ToUtcManyTest(unittest.TestCase):
+
+    ZONES = ('America/New_York', 'Europe/London', 'Australia/Sydney', 'America/Sao_Paulo', 'Asia/Kolkata', 'UTC',
+             'Etc/GMT+5')
+
+    @staticmethod
+    def times(start, days, step=datetime.timedelta(minutes=30)):
+        end = start + datetime.timedelta(days=days)
+        while start < end:
+            yield start
+            start += step
+
+    def test_same_as_to_utc(self):
+        dts = []
+        for year in (1918, 1970, 2007, 2020, 2037):     # older, current and future rules
+            for month in (3, 4, 9, 10, 11):
+                dts.extend(self.times(datetime.datetime(year, month, 1), 8))
+        dts.extend([datetime.datetime(1900, 1, 1), datetime.datetime(2100, 6, 30, 12, 0, 0, 500)])
+        for tz in self.ZONES:
+            for is_dst in (False, True):
+                self.assertEqual(to_utc_many(dts, tz, is_dst=is_dst), [to_utc(dt, tz, is_dst=is_dst) for dt in dts],
+                                 (tz, is_dst))
+
+    def test_ambiguous_and_non_existent_hours(self):
+        ambiguous = datetime.datetime(2020, 11, 1, 1, 30)  # America/New_York falls back at 2:00
+        missing = datetime.datetime(2020, 3, 8, 2, 30)     # and springs forward at 2:00
+        self.assertEqual(to_utc_many([ambiguous, missing], 'America/New_York', is_dst=True),
+                         [datetime.datetime(2020, 11, 1, 5, 30), datetime.datetime(2020, 3, 8, 6, 30)])
+        self.assertEqual(to_utc_many([ambiguous, missing], 'America/New_York', is_dst=False),
+                         [datetime.datetime(2020, 11, 1, 6, 30), datetime.datetime(2020, 3, 8, 7, 30)])
+
+    def test_empty(self):
+        self.assertEqual(to_utc_many([], 'UTC'), [])
+        self.assertEqual(to_utc_many(iter([]), 'America/New_York'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
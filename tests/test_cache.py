@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import decimal
+import os
+import unittest
+
+from datapro.core.cache import DictCache, HashedArrayCache, LayeredCache, LruCache, canonical_key, key_digest, \
+    read_snapshot, write_snapshot
+from datapro.core.tool import DimensionCache
+from tests.support import Customer, DatabaseTestCase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class KeyDigestTest(unittest.TestCase):
+
+    def test_equal_keys_share_a_digest(self):
+        self.assertEqual(key_digest(('A', 1)), key_digest(('A', 1.0)))
+        self.assertEqual(key_digest(('A', 1)), key_digest(('A', True)))
+        self.assertEqual(key_digest(('A', 1)), key_digest(('A', decimal.Decimal('1.00'))))
+        self.assertEqual(key_digest(('A', 0.5)), key_digest(('A', decimal.Decimal('0.5'))))
+
+    def test_unequal_keys_do_not_share_a_digest(self):
+        self.assertNotEqual(key_digest(('A', 1)), key_digest(('A', '1')))
+        self.assertNotEqual(key_digest(('A', 0.1)), key_digest(('A', decimal.Decimal('0.1'))))
+        self.assertNotEqual(key_digest(('A', 1)), key_digest(('A', 1.5)))
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_numpy_scalars(self):
+        self.assertEqual(canonical_key((numpy.str_('D'), numpy.int64(3))), ('D', 3))
+        self.assertEqual(key_digest((numpy.str_('D'), numpy.int64(3))), key_digest(('D', 3)))
+        self.assertEqual(key_digest((numpy.float64(2.5), )), key_digest((2.5, )))
+
+
+class BackendContractTest(unittest.TestCase):
+    """Every backend finds a key under any value that compares equal to it, as a DictCache does.
+    """
+
+    def check_backend(self, cache, fill=True):
+        if fill:
+            cache.update([(('A', 1), 10), (('B', 2.5), 20)])
+        equal_keys = [(('A', 1), 10), (('A', 1.0), 10), (('A', decimal.Decimal(1)), 10), (('B', 2.5), 20)]
+        if numpy is not None:
+            equal_keys += [((numpy.str_('A'), numpy.int64(1)), 10), ((numpy.str_('B'), numpy.float64(2.5)), 20)]
+        for key, cache_id in equal_keys:
+            self.assertEqual(cache.get(key), cache_id, key)
+        self.assertIsNone(cache.get(('A', '1')))
+
+    def test_dict_cache(self):
+        self.check_backend(DictCache())
+
+    def test_lru_cache(self):
+        self.check_backend(LruCache(10))
+
+    def test_hashed_array_cache(self):
+        self.check_backend(HashedArrayCache())
+
+    def test_snapshot(self):
+        cache = HashedArrayCache()
+        cache.update([(('A', 1), 10), (('B', 2.5), 20)])
+        path = os.path.join(os.path.dirname(__file__), 'snapshot.{0}.tmp'.format(os.getpid()))
+        self.addCleanup(os.remove, path)
+        write_snapshot(path, cache, high_water=20)
+        self.check_backend(read_snapshot(path).cache, fill=False)
+
+
+class LruCacheTest(unittest.TestCase):
+
+    def fill(self, policy):
+        cache = LruCache(3, policy=policy)
+        cache.update([(('A', ), 1), (('B', ), 2), (('C', ), 3)])
+        self.assertEqual(cache.get(('A', )), 1)     # a hit: most recently used, but still the first added
+        cache[('B', )] = 2                          # set again: moved to the end under either policy
+        cache[('D', )] = 4
+        return cache
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = self.fill('lru')
+        self.assertEqual(list(k for k, _ in cache.items()), [('A', ), ('B', ), ('D', )])
+        cache[('E', )] = 5
+        self.assertEqual(list(k for k, _ in cache.items()), [('B', ), ('D', ), ('E', )])
+        self.assertEqual((len(cache), cache.evictions), (3, 2))
+
+    def test_fifo_evicts_least_recently_added(self):
+        cache = self.fill('fifo')
+        self.assertEqual(list(k for k, _ in cache.items()), [('C', ), ('B', ), ('D', )])
+        self.assertEqual(cache.get(('C', )), 3)
+        cache[('E', )] = 5
+        self.assertEqual(list(k for k, _ in cache.items()), [('B', ), ('D', ), ('E', )])
+        self.assertEqual((len(cache), cache.evictions), (3, 2))
+
+    def test_evicted_keys_missing(self):
+        cache = LruCache(2)
+        cache.update((('K', i), i) for i in range(5))
+        self.assertNotIn(('K', 0), cache)
+        self.assertIsNone(cache.get(('K', 0)))
+        with self.assertRaises(KeyError):
+            cache[('K', 2)]
+        self.assertEqual(cache[('K', 4)], 4)
+        self.assertEqual(cache.evictions, 3)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            LruCache(10, policy='random')
+
+
+class LayeredCacheTest(unittest.TestCase):
+
+    def check_len(self, overlay):
+        base = HashedArrayCache()
+        base.update([(('A', 1), 10), (('B', 2), 20)])
+        cache = LayeredCache(base, overlay)
+        self.assertEqual(len(cache), 2)
+        cache[('B', 2.0)] = 21      # shadows a base entry
+        cache[('C', 3)] = 30
+        self.assertEqual(len(cache), 3)
+        self.assertEqual([cache.get(key) for key in (('A', 1), ('B', 2), ('C', 3))], [10, 21, 30])
+        self.assertEqual(len(dict(cache.digest_items())), len(cache))
+
+    def test_len_counts_shadowed_keys_once(self):
+        self.check_len(DictCache())
+        self.check_len(LruCache(10))
+        self.check_len(HashedArrayCache())
+
+
+class HashedDimensionCacheTest(DatabaseTestCase):
+
+    def test_merge_many_with_equal_keys(self):
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'], cache_backend=HashedArrayCache)
+        first = cache.merge_many([{'code': 'A', 'region': 1}])
+        again = cache.merge_many([{'code': 'A', 'region': 1.0}])
+        self.assertEqual(first, again)
+        self.assertEqual(cache.lookup(('A', 1.0)), first[0])
+        self.assertEqual(self.count(Customer), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
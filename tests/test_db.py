@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest import mock
+
+from tests.support import Customer, DatabaseTestCase
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class BlockFlushTest(DatabaseTestCase):
+
+    def load(self, connection, rows, clock=None, seconds_per_row=0.0):
+        blocks = []
+        for i in range(rows):
+            connection.session.add(Customer(code=str(i), region=1))
+            if clock is not None:
+                clock.now += seconds_per_row
+            if connection.block_flush():
+                blocks.append(connection.last_block)
+        return blocks
+
+    def test_fixed_block_size(self):
+        connection = self.orm_connection(flush_block_size=10)
+        blocks = self.load(connection, 25)
+        self.assertEqual([b['rows'] for b in blocks], [10, 10])
+        self.assertEqual(connection.flush_stats['rows'], 20)
+        self.assertEqual(len(connection.session.new), 5)
+
+    def test_adaptive_block_size(self):
+        clock = Clock()
+        with mock.patch('datapro.core.db.time', clock):
+            connection = self.orm_connection(flush_block_size=1000, target_block_seconds=1.0, min_flush_block_size=10)
+            blocks = self.load(connection, 3000, clock, seconds_per_row=0.01)     # 100 rows/sec
+        sizes = [b['block_size'] for b in blocks]
+        self.assertEqual(sizes[:3], [550, 325, 212])
+        self.assertTrue(all(100 <= size <= 105 for size in sizes[-3:]), sizes)
+
+    def test_block_size_bounds(self):
+        clock = Clock()
+        with mock.patch('datapro.core.db.time', clock):
+            connection = self.orm_connection(flush_block_size=100, target_block_seconds=10.0, max_flush_block_size=150,
+                                             min_flush_block_size=10)
+            blocks = self.load(connection, 600, clock, seconds_per_row=0.001)
+        self.assertEqual(blocks[-1]['block_size'], 150)
+
+    def test_session_object_count(self):
+        connection = self.orm_connection(flush_block_size=100000, max_session_objects=1500, min_flush_block_size=10)
+        connection._SIZE_CHECK_EVERY = 500
+        blocks = self.load(connection, 4000)
+        # the first block ends on the object count, which then bounds the block size
+        self.assertEqual([(b['rows'], b['block_size']) for b in blocks], [(1500, 1500), (1500, 1500)])
+        self.assertEqual(len(connection.session.new), 1000)
+
+    def test_commit_and_expunge(self):
+        connection = self.orm_connection(flush_block_size=10, commit_on_flush=True, expunge_on_flush=True)
+        self.load(connection, 20)
+        self.assertEqual(len(connection.session.identity_map), 0)
+        self.assertEqual(self.orm_connection().session.query(Customer).count(), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from datapro.core.excel import ExcelException, read_workbook
+
+try:
+    import xlwt
+except ImportError:
+    xlwt = None
+
+
+@unittest.skipIf(xlwt is None, 'xlwt is not installed')
+class ReadWorkbookTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'book.xls')
+
+        book = xlwt.Workbook()
+        style = xlwt.easyxf(num_format_str='YYYY-MM-DD')
+        sales = book.add_sheet('sales')
+        for c, value in enumerate(('code', 'booked')):
+            sales.write(0, c, value)
+        for r, (code, booked) in enumerate((('A', datetime.date(2020, 1, 31)), ('B', 'n/a'), ('C', None)), 1):
+            sales.write(r, 0, code)
+            if booked is not None:
+                sales.write(r, 1, booked, style)
+        notes = book.add_sheet('notes')
+        notes.write(0, 0, 'note')
+        notes.write(1, 0, 'none booked')
+        book.save(self.path)
+
+    def test_unconverted_dates_are_kept_and_logged(self):
+        with self.assertLogs('datapro.core.excel', 'WARNING') as logs:
+            batches = list(read_workbook(self.path, sheets=['sales'], dates=['booked']))
+        self.assertEqual(batches[0].rows, [
+            {'code': 'A', 'booked': datetime.date(2020, 1, 31)},
+            {'code': 'B', 'booked': 'n/a'},
+            {'code': 'C', 'booked': None}
+        ])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('rows 3', logs.output[0])
+
+    def test_missing_date_column_skipped(self):
+        batches = list(read_workbook(self.path, dates=['booked']))
+        self.assertEqual([(b.sheet, len(b.rows)) for b in batches], [('sales', 3), ('notes', 1)])
+        self.assertEqual(batches[1].rows, [{'note': 'none booked'}])
+
+    def test_missing_date_column_strict(self):
+        with self.assertRaises(ExcelException):
+            list(read_workbook(self.path, dates=['booked'], strict=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
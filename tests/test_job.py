@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from datapro import STATUS_FAIL, STATUS_RUN, STATUS_STOP
+from datapro.core.db import Connection, engines
+from datapro.core.job import EtlJob, PartitionedJob
+from tests.support import DatabaseTestCase, Sale, sqlite_config
+
+
+class EngineDisposalTest(DatabaseTestCase):
+
+    def test_stop_keeps_shared_engines(self):
+        before = engines.keys()
+        with EtlJob('job'):
+            self.core_connection()
+        self.assertTrue(before)
+        self.assertEqual(engines.keys(), before)
+        self.assertEqual(self.connection.session.execute('SELECT 1').scalar(), 1)
+
+    def test_dispose_on_stop(self):
+        class DisposingJob(EtlJob):
+            dispose_engines_on_stop = True
+
+        with DisposingJob('job'):
+            pass
+        self.assertEqual(engines.keys(), set())
+
+    def test_dispose_selected_engines(self):
+        existing = engines.keys()
+        Connection(*sqlite_config(os.path.join(self.directory, 'other.db')))
+        created = engines.keys() - existing
+        self.assertEqual(len(created), 1)
+        engines.dispose(created)
+        self.assertEqual(engines.keys(), existing)
+
+
+def _work(partition, connections):
+    if partition == 'bad':
+        raise ValueError(partition)
+    return {'rows': 1}
+
+
+class PartitionedJobTest(unittest.TestCase):
+
+    def run_job(self, partitions):
+        with self.assertLogs('datapro.core.job', 'INFO') as logs:
+            with PartitionedJob('job', _work, partitions, workers=0, retries=0) as job:
+                job.run()
+        reports = [line for line in logs.output if 'Job report' in line]
+        return job, reports
+
+    def test_failed_partition_fails_job_report(self):
+        job, reports = self.run_job(['good', 'bad'])
+        self.assertEqual(job.report['status'], STATUS_FAIL)
+        self.assertEqual(len(reports), 1)
+        self.assertIn("'status': '{0}'".format(STATUS_FAIL), reports[0])
+        self.assertEqual(job.counts, {'rows': 1})
+
+    def test_job_stopped(self):
+        job, reports = self.run_job(['good'])
+        self.assertEqual(job.report['status'], STATUS_STOP)
+        self.assertIn("'status': '{0}'".format(STATUS_STOP), reports[0])
+
+
+class ProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def job_class(self):
+        class ProfiledJob(EtlJob):
+            profile_dir = self.directory
+        return ProfiledJob
+
+    def test_profile_written_on_stop(self):
+        with self.assertLogs('datapro.core.job', 'INFO') as logs:
+            with self.job_class()('daily sales/eu', profile=True) as job:
+                job.run_pipeline(range(100), lambda rows: (str(row) for row in rows))
+        path = job.report['profile']
+        self.assertEqual(os.path.dirname(path), self.directory)
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(path)])
+        self.assertRegex(os.path.basename(path), r'^daily_sales_eu-\d{8}T\d{6}\.prof$')
+        self.assertIn('run_pipeline', repr(pstats.Stats(path).stats))
+        self.assertTrue(any('Profile written to {0}'.format(path) in line for line in logs.output))
+        self.assertEqual(job.report['metrics']['counters'], {'rows_in': 100, 'rows_out': 100})
+
+    def test_no_profile_by_default(self):
+        with self.job_class()('job') as job:
+            pass
+        self.assertIsNone(job.report['profile'])
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+def _write(partition, connections):
+    if partition == 'die':
+        os._exit(1)     # the worker process dies, as when killed for using too much memory
+    session = list(connections.values())[0].session
+    session.add(Sale(note=partition))
+    session.commit()
+    return {'rows': 1}
+
+
+class ProcessPoolTest(DatabaseTestCase):
+
+    def run_job(self, partitions, retries=1):
+        job = PartitionedJob('job', _write, partitions, {self.name: {'config': self.config}}, workers=2,
+                             retries=retries)
+        with self.assertLogs('datapro.core.job', 'INFO'):
+            with job:
+                job.run()
+                self.assertEqual(job._status, STATUS_RUN)
+        return job
+
+    def test_partitions_run_in_workers(self):
+        before = engines.keys()
+        job = self.run_job(['a', 'b', 'c'])
+        self.assertEqual([(r.partition, r.status, r.attempts) for r in job.results],
+                         [('a', STATUS_STOP, 1), ('b', STATUS_STOP, 1), ('c', STATUS_STOP, 1)])
+        self.assertEqual(job.counts, {'rows': 3})
+        self.assertEqual(self.count(Sale), 3)
+        # the engines of the parent process are left alone
+        self.assertEqual(engines.keys(), before)
+        self.assertIs(self.core_connection().engine, self.connection.engine)
+
+    def test_dying_worker_fails_only_its_partition(self):
+        for retries in (0, 1, 2):
+            self.connection.session.query(Sale).delete()
+            self.connection.session.commit()
+            job = self.run_job(['a', 'die', 'b', 'c', 'd'], retries=retries)
+            self.assertEqual([(r.partition, r.status) for r in job.results], [
+                ('a', STATUS_STOP), ('die', STATUS_FAIL), ('b', STATUS_STOP), ('c', STATUS_STOP), ('d', STATUS_STOP)
+            ])
+            self.assertEqual(job.failed[0].attempts, max(retries, 1) + 1)
+            self.assertIn('BrokenProcessPool', job.failed[0].error)
+            self.assertEqual(job.report['status'], STATUS_FAIL)
+            self.assertEqual(sorted(n for n, in self.connection.session.query(Sale.note)), ['a', 'b', 'c', 'd'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import decimal
+import unittest
+from unittest import mock
+
+from sqlalchemy import Column, VARCHAR
+
+from datapro import IdMixin, Model
+from datapro.core.load import BulkLoader, BulkLoadException, BulkUpserter
+from tests.support import Customer, DatabaseTestCase, Sale
+
+
+class Tag(Model, IdMixin):
+    __schema__ = None
+    __table_name__ = 'TestTag'
+    __table_name_mask__ = '{__table_type__}_{__table_name__}'
+    __table_type__ = 'DIM'
+
+    code = Column(VARCHAR(20, collation='NOCASE'), nullable=False)
+    name = Column(VARCHAR(50))
+
+
+class BulkLoaderTest(DatabaseTestCase):
+
+    def rows(self):
+        return self.connection.session.query(Sale.id, Sale.customer_id, Sale.amount, Sale.note).order_by(Sale.id).all()
+
+    def test_default_columns_leave_out_generated_id(self):
+        loader = BulkLoader(self.connection, Sale)
+        self.assertEqual(loader._columns, ['customer_id', 'amount', 'note'])
+        loader.load([(1, 10, 'a'), (2, 20, 'b')])
+        self.assertEqual(self.rows(), [(1, 1, 10, 'a'), (2, 2, 20, 'b')])
+
+    def test_dict_rows(self):
+        stats = Sale.bulk_load(self.connection, [{'customer_id': 1, 'amount': 10}, {'amount': 20, 'customer_id': 2}],
+                               chunk_size=1)
+        self.assertEqual((stats['rows'], stats['chunks']), (2, 2))
+        self.assertEqual(self.rows(), [(1, 1, 10, None), (2, 2, 20, None)])
+
+    def test_values_method(self):
+        BulkLoader(self.connection, Sale, method='values').load([{'amount': 10}, {'amount': 20}])
+        self.assertEqual(self.rows(), [(1, None, 10, None), (2, None, 20, None)])
+
+    def test_rows_with_other_keys(self):
+        for method in ('executemany', 'values', 'copy'):
+            loader = BulkLoader(self.connection, Sale, method=method)
+            with mock.patch.object(loader, '_copy'):
+                with self.assertRaises(BulkLoadException):
+                    loader.load([{'customer_id': 1, 'amount': 10}, {'customer_id': 2, 'note': 'b'}])
+                with self.assertRaises(BulkLoadException):
+                    loader.load([{'customer_id': 1, 'amount': 10}, (2, 20, 'b')])
+        self.assertEqual(self.rows(), [])
+
+    def test_copy_columns(self):
+        loader = BulkLoader(self.connection, Sale, method='copy')
+        with mock.patch.object(loader, '_copy') as copy:
+            loader.load([{'amount': 10, 'customer_id': 1}, {'customer_id': 2, 'amount': 20}])
+            loader.load([(3, 30, 'c')])
+        self.assertEqual(copy.call_args_list[0][0][1:], (['amount', 'customer_id'], [(10, 1), (20, 2)]))
+        self.assertEqual(copy.call_args_list[1][0][1:], (['customer_id', 'amount', 'note'], [(3, 30, 'c')]))
+
+
+class BulkUpserterTest(DatabaseTestCase):
+
+    models = (Customer, Sale, Tag)
+
+    def customers(self):
+        return self.connection.session.query(Customer.code, Customer.region, Customer.name).order_by(Customer.id).all()
+
+    def test_upsert(self):
+        # on_conflict (picked by auto where SQLAlchemy supports it for SQLite) requires a unique key
+        self.connection.session.execute(
+            'CREATE UNIQUE INDEX "UX_TestCustomer" ON "{0}" (code, region)'.format(Customer.__tablename__)
+        )
+        for method in ('auto', 'select'):
+            self.connection.session.query(Customer).delete()
+            Customer.bulk_load(self.connection, [{'code': 'A', 'region': 1, 'name': 'a'}])
+            upserter = BulkUpserter(self.connection, Customer, ['code', 'region'], method=method)
+            upserter.load([
+                {'code': 'A', 'region': 1, 'name': 'changed'},
+                {'code': 'B', 'region': 1, 'name': 'b'},
+                {'code': 'B', 'region': 1, 'name': 'last'}
+            ])
+            if upserter.method == 'select':
+                self.assertEqual((upserter.stats['insert'], upserter.stats['update']), (1, 1))
+            self.assertEqual(self.customers(), [('A', 1, 'changed'), ('B', 1, 'last')])
+
+    def test_update_columns(self):
+        Customer.bulk_load(self.connection, [{'code': 'A', 'region': 1, 'current': 1, 'name': 'a'}])
+        upserter = BulkUpserter(self.connection, Customer, ['code', 'region'], update_columns=['current'],
+                                method='select')
+        upserter.load([{'code': 'A', 'region': 1, 'current': 0, 'name': 'ignored'}])
+        self.assertEqual(self.connection.session.query(Customer.current, Customer.name).all(), [(0, 'a')])
+
+    def test_insert_only(self):
+        Customer.bulk_load(self.connection, [{'code': 'A', 'region': 1, 'name': 'a'}])
+        stats = Customer.bulk_upsert(self.connection, [('A', 1, 1, 'x', None), ('B', 2, 1, 'b', None)],
+                                     ['code', 'region'], update_columns=(), method='select')
+        self.assertEqual((stats['insert'], stats['update']), (1, 0))
+        self.assertEqual(self.customers(), [('A', 1, 'a'), ('B', 2, 'b')])
+
+    def test_chunks(self):
+        rows = [{'code': str(i % 30), 'region': 1, 'name': str(i)} for i in range(100)]
+        stats = Customer.bulk_upsert(self.connection, rows, ['code', 'region'], chunk_size=7, method='select')
+        self.assertEqual((stats['rows'], stats['chunks']), (100, 15))
+        self.assertEqual(stats['insert'], 30)
+        self.assertEqual(sorted(self.customers(), key=lambda c: int(c[0])),
+                         [(str(i), 1, str(i + 90 if i < 10 else i + 60)) for i in range(30)])
+
+    def test_rows_with_other_keys(self):
+        with self.assertRaises(BulkLoadException):
+            Customer.bulk_upsert(self.connection, [{'code': 'A', 'region': 1}, {'code': 'B', 'region': 1, 'name': 'b'}],
+                                 ['code', 'region'], method='select')
+
+    def test_select_keys_of_another_type(self):
+        Customer.bulk_load(self.connection, [{'code': 'A', 'region': 1, 'name': 'a'}])
+        stats = Customer.bulk_upsert(self.connection, [
+            {'code': 'A', 'region': '1', 'name': 'string'},
+            {'code': 'A', 'region': decimal.Decimal('1'), 'name': 'decimal'},
+            {'code': 'B', 'region': 2.0, 'name': 'b'}
+        ], ['code', 'region'], method='select')
+        self.assertEqual((stats['insert'], stats['update']), (1, 1))
+        self.assertEqual(self.customers(), [('A', 1, 'decimal'), ('B', 2, 'b')])
+
+    def test_select_case_insensitive_keys(self):
+        Tag.bulk_load(self.connection, [{'code': 'Red', 'name': 'a'}])
+        stats = Tag.bulk_upsert(self.connection, [{'code': 'RED', 'name': 'b'}, {'code': 'blue', 'name': 'c'}],
+                                ['code'], method='select')
+        self.assertEqual((stats['insert'], stats['update']), (1, 1))
+        self.assertEqual(self.connection.session.query(Tag.code, Tag.name).order_by(Tag.id).all(),
+                         [('Red', 'b'), ('blue', 'c')])
+
+    def test_missing_update_columns(self):
+        Customer.bulk_load(self.connection, [{'code': 'A', 'region': 1, 'name': 'a'}])
+        with self.assertRaises(BulkLoadException):
+            Customer.bulk_upsert(self.connection, [{'code': 'A', 'region': 1}], ['code', 'region'],
+                                 update_columns=['name'], method='select')
+        self.assertEqual(self.customers(), [('A', 1, 'a')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest import mock
+
+from datapro.core.metrics import Metrics
+
+
+class Clock(object):
+    """perf_counter advancing one second per read, so every timed entry lasts one second.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        self.now += 1.0
+        return self.now
+
+
+class Source(object):
+
+    def __init__(self):
+        self.counts = {'hit': 0}
+        self.totals = {('amount', 'Not an int'): 2}
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('datapro.core.metrics.time', Clock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_section_context_manager(self):
+        metrics = Metrics()
+        for _ in range(3):
+            with metrics.section('load'):
+                pass
+        with self.assertRaises(KeyError):
+            with metrics.section('load'):
+                raise KeyError('x')
+        self.assertEqual(metrics.report()['sections'], {'load': {'calls': 4, 'seconds': 4.0, 'mean': 1.0, 'max': 1.0}})
+
+    def test_nested_sections(self):
+        metrics = Metrics()
+        with metrics.section('outer'):
+            with metrics.section('inner'):
+                pass
+            with metrics.section('outer'):     # re-entered: timings are stacked
+                pass
+        sections = metrics.report()['sections']
+        self.assertEqual((sections['inner']['seconds'], sections['outer']['calls']), (1.0, 2))
+        self.assertEqual((sections['outer']['seconds'], sections['outer']['max']), (1.0 + 5.0, 5.0))
+
+    def test_timed_decorator(self):
+        metrics = Metrics()
+
+        @metrics.timed()
+        def parse(line):
+            return line.split(',')
+
+        @metrics.timed('write')
+        def load(rows):
+            raise ValueError(rows)
+
+        self.assertEqual([parse('a,b') for _ in range(5)][0], ['a', 'b'])
+        self.assertEqual(parse.__name__, 'parse')
+        with self.assertRaises(ValueError):
+            load([])
+        sections = metrics.report()['sections']
+        self.assertEqual(sorted(sections), ['parse', 'write'])
+        self.assertEqual((sections['parse']['calls'], sections['parse']['seconds']), (5, 5.0))
+        self.assertEqual((sections['write']['calls'], sections['write']['seconds']), (1, 1.0))
+
+    def test_sampling_extrapolates_total(self):
+        metrics = Metrics(sample_rate=3)
+        for _ in range(10):
+            with metrics.section('row'):
+                pass
+        section = metrics.sections['row']
+        self.assertEqual((section.calls, section.timed, section.seconds), (10, 3, 3.0))
+        self.assertEqual(section.report(), {'calls': 10, 'seconds': 10.0, 'mean': 1.0, 'max': 1.0})
+
+        metrics.section('partition').record(2.5)      # recorded calls are always timed
+        metrics.section('partition').record(0.5)
+        self.assertEqual(metrics.report()['sections']['partition'],
+                         {'calls': 2, 'seconds': 3.0, 'mean': 1.5, 'max': 2.5})
+
+    def test_sampling_without_timed_entries(self):
+        metrics = Metrics(sample_rate=100)
+        for _ in range(99):
+            with metrics.section('row'):
+                pass
+        self.assertEqual(metrics.report()['sections']['row'], {'calls': 99, 'seconds': 0.0, 'mean': 0.0, 'max': 0.0})
+
+    def test_counters(self):
+        metrics = Metrics(sample_rate=10)
+        metrics.count('rows')
+        metrics.count('rows', 4)
+        self.assertEqual(list(metrics.counted('read', iter('abc'))), ['a', 'b', 'c'])
+        list(metrics.counted('empty', []))
+        self.assertEqual(metrics.report()['counters'], {'rows': 5, 'read': 3, 'empty': 0})
+
+    def test_watch_reads_gauges_on_report(self):
+        metrics = Metrics()
+        source = Source()
+        metrics.watch('customers', source)
+        source.counts['hit'] = 7            # read when the report is built, not when watched
+        metrics.gauge('rows', lambda: 12)
+        self.assertEqual(metrics.report()['gauges'], {
+            'customers.counts': {'hit': 7},
+            'customers.totals': {'amount: Not an int': 2},
+            'rows': 12
+        })
+
+        with self.assertRaises(ValueError):
+            metrics.watch('other', object())
+
+    def test_failing_gauge_skipped(self):
+        metrics = Metrics()
+        metrics.gauge('broken', lambda: 1 / 0)
+        metrics.gauge('rows', lambda: 1)
+        with self.assertLogs('datapro.core.metrics', 'WARNING') as logs:
+            self.assertEqual(metrics.report()['gauges'], {'rows': 1})
+        self.assertIn('broken', logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
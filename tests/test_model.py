@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import unittest
+
+from datapro.core.model.common import Date
+from datapro.core.model.init import extend_dates
+from tests.support import DatabaseTestCase
+
+
+class DateRowsTest(unittest.TestCase):
+
+    RANGES = (
+        (datetime.date(1899, 12, 20), datetime.date(1900, 3, 5)),     # 1900 is not a leap year
+        (datetime.date(1999, 11, 15), datetime.date(2001, 3, 10)),    # 2000 is
+        (datetime.date(2019, 12, 28), datetime.date(2021, 1, 4)),     # ISO weeks across years
+        (datetime.date(2099, 12, 1), datetime.date(2100, 3, 5)),
+        (datetime.date(2020, 2, 29), datetime.date(2020, 2, 29))
+    )
+
+    def test_same_as_from_date(self):
+        columns = [c.name for c in Date.__table__.columns if c.name != 'id']
+        for start_date, end_date in self.RANGES:
+            rows = Date.rows(start_date, end_date)
+            self.assertEqual(len(rows), (end_date - start_date).days + 1)
+            for i, row in enumerate(rows):
+                d = start_date + datetime.timedelta(days=i)
+                expected = Date.from_date(d)
+                self.assertEqual(sorted(row), sorted(columns))
+                for column in columns:
+                    self.assertEqual(row[column], getattr(expected, column), (d, column))
+
+    def test_empty_range(self):
+        self.assertEqual(Date.rows(datetime.date(2020, 1, 2), datetime.date(2020, 1, 1)), [])
+
+
+class ExtendDatesTest(DatabaseTestCase):
+
+    models = (Date, )
+    schemas = ('common', )
+
+    def dates(self):
+        return dict((d, i) for i, d in self.connection.session.query(Date.id, Date.date))
+
+    def test_inserts_missing_dates_only(self):
+        session = self.connection.session
+        self.assertEqual(extend_dates(self.connection, datetime.date(2020, 1, 1), datetime.date(2020, 1, 31)), 31)
+        session.query(Date).filter(Date.date.in_([datetime.date(2020, 1, 10), datetime.date(2020, 1, 20)])).delete(
+            synchronize_session=False
+        )
+        before = self.dates()
+
+        inserted = extend_dates(self.connection, datetime.date(2019, 12, 25), datetime.date(2020, 2, 5))
+        self.assertEqual(inserted, 7 + 2 + 5)
+        after = self.dates()
+        self.assertEqual(len(after), (datetime.date(2020, 2, 5) - datetime.date(2019, 12, 25)).days + 1)
+        self.assertEqual(dict((d, after[d]) for d in before), before)   # existing dates keep their ids
+        self.assertEqual(extend_dates(self.connection, datetime.date(2020, 1, 1), datetime.date(2020, 1, 31)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import threading
+import time
+import unittest
+
+from datapro.core.pipeline import Pipeline, batch, map_rows, prefetch, resolve_ids, threaded, unbatch, validate
+from datapro.core.tool import DimensionCache
+from datapro.core.validation import MESSAGE_INT, FailureCollector, RowValidator
+from tests.support import Customer, DatabaseTestCase
+
+
+class ValidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.validator = RowValidator([('amount', {'type': 'int'})])
+        self.rows = [{'amount': 'x{0}'.format(i)} for i in range(1000)] + [{'amount': '5'}]
+
+    def test_failures_grouped_by_message_class(self):
+        collector = FailureCollector(max_records=10)
+        rows = list(validate(self.validator, collector=collector)(self.rows))
+        self.assertEqual(rows, [{'amount': 5}])
+        self.assertEqual(collector.totals, {('amount', MESSAGE_INT): 1000})
+        failures = collector.drain()
+        self.assertEqual((failures[0].args, failures[0].context), (('x0', ), 1))
+
+    def test_failures_summarised_without_collector(self):
+        with self.assertLogs('datapro.core.validation', 'WARNING') as logs:
+            rows = list(validate(self.validator, drop_invalid=False)(self.rows))
+        self.assertEqual(len(rows), 1001)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('amount: 1000 failures', logs.output[0])
+
+
+class ResolveIdsTest(DatabaseTestCase):
+
+    def test_new_records_take_only_dimension_columns(self):
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'])
+        rows = [
+            {'id': 90, 'customer_code': 'A', 'region': 1, 'customer_name': 'Alice', 'amount': 10},
+            {'id': 91, 'customer_code': 'B', 'region': 1, 'customer_name': 'Bob', 'amount': 20},
+            {'id': 92, 'customer_code': 'A', 'region': 1, 'customer_name': 'Alice', 'amount': 30}
+        ]
+        stage = resolve_ids(cache, 'customer_id', fields={'code': 'customer_code', 'name': 'customer_name'})
+        rows = list(stage(rows))
+        self.assertEqual([row['customer_id'] for row in rows], [1, 2, 1])
+        self.assertEqual(self.count(Customer, 'WHERE id IN (1, 2)'), 2)
+        self.assertEqual(self.count(Customer, 'WHERE id >= 90'), 0)
+        customer = self.connection.session.query(Customer).get(2)
+        self.assertEqual((customer.code, customer.name), ('B', 'Bob'))
+
+
+class Counted(object):
+    """Endless source counting the rows taken from it.
+    """
+
+    def __init__(self):
+        self.taken = 0
+
+    def __iter__(self):
+        for i in itertools.count():
+            self.taken = i + 1
+            yield i
+
+
+def settle(value, timeout=2.0):
+    """Wait until a value read from another thread stops changing.
+
+    Returns:
+        the value
+    """
+    last = value()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(0.05)
+        current = value()
+        if current == last:
+            return current
+        last = current
+    return last
+
+
+def background_threads():
+    return [t for t in threading.enumerate() if t.name in ('datapro-prefetch', 'datapro-stage')]
+
+
+def failing(rows, after=3):
+    for i, row in enumerate(rows):
+        if i == after:
+            raise ValueError(row)
+        yield row
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def tearDown(self):
+        self.assertEqual(background_threads(), [])
+
+    def test_order_preserved(self):
+        self.assertEqual(list(prefetch(range(5000), maxsize=7)), list(range(5000)))
+        self.assertEqual(list(prefetch([])), [])
+
+    def test_exception_raised_in_consumer(self):
+        rows = prefetch(failing(range(10)), maxsize=2)
+        self.assertEqual([next(rows) for _ in range(3)], [0, 1, 2])
+        with self.assertRaises(ValueError):
+            next(rows)
+
+    def test_backpressure(self):
+        source = Counted()
+        rows = prefetch(source, maxsize=2)
+        self.assertEqual(next(rows), 0)
+        # one row consumed, two queued and one waiting for room: the thread goes no further
+        self.assertEqual(settle(lambda: source.taken), 4)
+        self.assertEqual(next(rows), 1)
+        self.assertEqual(settle(lambda: source.taken), 5)
+        rows.close()
+
+    def test_consumer_stops_early(self):
+        source = Counted()
+        self.assertEqual(list(itertools.islice(prefetch(source, maxsize=10), 3)), [0, 1, 2])
+        rows = prefetch(source, maxsize=1)
+        next(rows)
+        rows.close()
+        self.assertLess(settle(lambda: source.taken), 100)
+
+
+class ThreadedTest(unittest.TestCase):
+
+    def tearDown(self):
+        self.assertEqual(background_threads(), [])
+
+    def test_order_preserved(self):
+        rows = Pipeline(range(5000)).pipe(threaded(map_rows(lambda row: row * 2), maxsize=3))
+        self.assertEqual(list(rows), [row * 2 for row in range(5000)])
+        rows = Pipeline(range(5000), [batch(7), threaded(unbatch(), maxsize=1), threaded(batch(3), maxsize=2)])
+        self.assertEqual([row for chunk in rows for row in chunk], list(range(5000)))
+        self.assertEqual(list(threaded(map_rows(str))([])), [])
+
+    def test_exception_in_stage_raised_in_consumer(self):
+        rows = threaded(failing, maxsize=2)(range(100))
+        with self.assertRaises(ValueError):
+            list(rows)
+
+        stage = threaded(map_rows(lambda row: row), maxsize=2)     # raised upstream, in the calling thread
+        with self.assertRaises(ValueError):
+            list(stage(failing(range(100), after=50)))
+
+    def test_backpressure(self):
+        processed = []
+        rows = threaded(map_rows(processed.append), maxsize=2)(Counted())
+        for consumed in range(1, 10):
+            next(rows)
+            # the stage runs at most two queued rows (and one waiting for room) ahead of the consumer
+            self.assertLessEqual(settle(lambda: len(processed)), consumed + 3)
+        rows.close()
+
+    def test_consumer_stops_early(self):
+        source = Counted()
+        rows = Pipeline(source, [threaded(map_rows(str), maxsize=5)])
+        self.assertEqual(list(itertools.islice(rows, 10)), [str(i) for i in range(10)])
+        rows = iter(rows)
+        next(rows)
+        rows.close()
+        self.assertLess(settle(lambda: source.taken), 100)
+
+    def test_stage_stops_early(self):
+        stage = threaded(lambda rows: itertools.islice(rows, 3), maxsize=2)
+        self.assertEqual(list(stage(Counted())), [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
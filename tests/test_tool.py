@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import os
+import unittest
+
+from sqlalchemy import event
+
+from datapro.core.cache import DictCache
+from datapro.core.model.common import Date
+from datapro.core.model.init import extend_dates
+from datapro.core.tool import DateResolver, DimensionCache, DimensionCacheException, _title_case_word, title_case, \
+    title_case_many
+from tests.support import Customer, DatabaseTestCase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class QueryCounter(object):
+    """Counts the SELECT statements run through an engine.
+    """
+
+    def __init__(self, test_case, engine):
+        self.selects = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+        test_case.addCleanup(event.remove, engine, 'before_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.selects += 1
+
+
+class BatchedMergeTest(DatabaseTestCase):
+
+    def test_deferred_ids(self):
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'], batch_size=3)
+        first = cache.merge({'code': 'A', 'region': 1})
+        self.assertFalse(first.resolved)
+        self.assertIs(cache.merge({'code': 'A', 'region': 1}), first)
+        cache.merge({'code': 'B', 'region': 1})
+        cache.merge({'code': 'C', 'region': 1})     # fills the batch
+        self.assertTrue(first.resolved)
+        self.assertEqual(int(first), cache.lookup(('A', 1)))
+        self.assertEqual(cache.counts, {'exist': 1, 'insert': 3})
+        self.assertEqual(self.count(Customer), 3)
+
+    def test_key_values_of_another_type(self):
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'], batch_size=10)
+        staged = [cache.merge({'code': 'A', 'region': '3'}), cache.merge({'code': 7, 'region': 1})]
+        self.assertEqual(cache.flush(), 2)
+        self.assertEqual([int(d) for d in staged], [1, 2])
+        self.assertEqual(cache.lookup(('A', '3')), 1)
+        self.assertEqual(cache.merge_many([{'code': 'B', 'region': '4'}, {'code': 'A', 'region': '3'}]), [3, 1])
+
+    def test_flush_reselects_current_rows(self):
+        session = self.connection.session
+        session.add(Customer(id=1, code='A', region=1, current=0))
+        session.flush()
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'], where_clause=Customer.current == 1,
+                               batch_size=10, lazy=True)
+        deferred = cache.merge({'code': 'A', 'region': 1, 'current': 1})
+        cache.flush()
+        self.assertEqual(int(deferred), 2)
+        self.assertEqual(cache.counts, {'exist': 0, 'insert': 1})
+
+
+class MergeManyTest(DatabaseTestCase):
+
+    def test_records(self):
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'])
+        ids = cache.merge_many([{'code': 'A', 'region': 1}, {'code': 'B', 'region': 1}, {'code': 'A', 'region': 1}])
+        self.assertEqual(ids, [1, 2, 1])
+        self.assertEqual(cache.lookup_many([('B', 1), ('C', 1), ('A', 1)]), [2, None, 1])
+        self.assertEqual(cache.counts, {'exist': 1, 'insert': 2})
+
+    def test_columnar_batch(self):
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'])
+        ids = cache.merge_many({'code': ['A', 'B', 'A'], 'region': [1, 1, 1], 'name': ['a', 'b', 'c']})
+        self.assertEqual(ids, [1, 2, 1])
+        self.assertEqual(self.connection.session.query(Customer.name).order_by(Customer.id).all(), [('a', ), ('b', )])
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_numpy_columnar_batch(self):
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'], lazy=True)
+        batch = {
+            'code': numpy.array(['D', 'E', 'D']),
+            'region': numpy.array([3, 3, 3], dtype=numpy.int64),
+            'name': numpy.array(['d', 'e', 'd'])
+        }
+        ids = cache.merge_many(batch)
+        self.assertEqual(ids, [1, 2, 1])
+        self.assertTrue(all(type(i) is int for i in ids))
+        self.assertEqual(cache.lookup((numpy.str_('D'), numpy.int64(3))), 1)
+        self.assertEqual(cache.merge_many(batch), [1, 2, 1])
+        self.assertEqual(self.count(Customer), 2)
+
+
+class SnapshotTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(SnapshotTest, self).setUp()
+        self.snapshot_path = os.path.join(self.directory, 'customer.snapshot')
+        self.connection.session.add(Customer(code='O', region=1))
+        self.connection.session.commit()
+
+    def test_resume_with_concurrent_writers(self):
+        other = self.orm_connection()
+        a = DimensionCache(self.connection, Customer, ['code', 'region'])
+        b = DimensionCache(other, Customer, ['code', 'region'])
+        for cache, code in ((a, 'P'), (b, 'Q'), (a, 'R')):
+            cache.merge({'code': code, 'region': 1})
+            cache._connection.session.commit()
+        self.assertEqual(a.high_water, 1)
+        a.save_snapshot(self.snapshot_path)
+
+        resumed = DimensionCache(self.orm_connection(), Customer, ['code', 'region'], snapshot_path=self.snapshot_path)
+        self.assertIsNotNone(resumed.snapshot)
+        self.assertEqual(resumed.lookup(('Q', 1)), 3)
+        self.assertEqual(resumed.merge({'code': 'Q', 'region': 1}), 3)
+        self.assertEqual(resumed.high_water, 4)
+        self.assertEqual(self.count(Customer), 4)
+
+    def test_null_high_water_column(self):
+        session = self.connection.session
+        session.add(Customer(code='P', region=1, updated_at=datetime.datetime(2020, 1, 2)))
+        session.commit()
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'], high_water_column='updated_at')
+        self.assertEqual(cache.high_water, datetime.datetime(2020, 1, 2))
+        cache.save_snapshot(self.snapshot_path)
+
+        session.add(Customer(code='S', region=1, updated_at=datetime.datetime(2020, 1, 3)))
+        session.commit()
+        resumed = DimensionCache(self.connection, Customer, ['code', 'region'], snapshot_path=self.snapshot_path,
+                                 high_water_column='updated_at')
+        self.assertEqual(resumed.lookup_many([('O', 1), ('P', 1), ('S', 1)]), [1, 2, 3])
+        self.assertEqual(resumed.high_water, datetime.datetime(2020, 1, 3))
+
+
+class UpdateCounter(DictCache):
+    """Cache backend counting the batches of entries added to it.
+    """
+
+    def __init__(self):
+        super(UpdateCounter, self).__init__()
+        self.updates = 0
+
+    def update(self, other):
+        self.updates += 1
+        super(UpdateCounter, self).update(other)
+
+
+class WarmTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(WarmTest, self).setUp()
+        session = self.connection.session
+        session.add_all([Customer(id=i, code='C{0}'.format(i), region=i % 3, current=int(i % 4 != 0))
+                         for i in range(1, 51)])
+        session.commit()
+        self.expected = dict((('C{0}'.format(i), i % 3), i) for i in range(1, 51) if i % 4 != 0)
+
+    def test_warm_in_partitions(self):
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'], init_cache=False,
+                               cache_backend=UpdateCounter)
+        self.assertEqual(cache.warm(Customer.current == 1, partition_size=7), len(self.expected))
+        self.assertEqual(dict(cache._cache.items()), self.expected)
+        self.assertEqual(cache._cache.updates, 6)     # 38 rows in partitions of 7
+        self.assertEqual(cache.high_water, 50)
+        self.assertEqual(cache.lookup_many([('C2', 2), ('C4', 1), ('C49', 1)]), [2, None, 49])
+
+    def test_warmed_on_init(self):
+        class SmallPartitions(DimensionCache):
+            _WARM_PARTITION = 10
+
+        cache = SmallPartitions(self.connection, Customer, ['code', 'region'], where_clause=Customer.current == 1,
+                                cache_backend=UpdateCounter)
+        self.assertEqual(dict(cache._cache.items()), self.expected)
+        self.assertEqual(cache._cache.updates, 4)
+
+    def test_snapshot_of_lazy_cache(self):
+        with self.assertRaises(DimensionCacheException):
+            DimensionCache(self.connection, Customer, ['code', 'region'], lazy=True,
+                           snapshot_path=os.path.join(self.directory, 'customer.snapshot'))
+
+
+class LazyDimensionCacheTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(LazyDimensionCacheTest, self).setUp()
+        session = self.connection.session
+        session.add_all([
+            Customer(id=1, code='A', region=1, current=1),
+            Customer(id=2, code='A', region=1, current=0),
+            Customer(id=3, code='B', region=1, current=1)
+        ])
+        session.commit()
+
+    def cache(self, **kwargs):
+        return DimensionCache(self.connection, Customer, ['code', 'region'],
+                              where_clause=Customer.current == 1, **kwargs)
+
+    def test_where_clause_eager(self):
+        self.assertEqual(self.cache().lookup(('A', 1)), 1)
+
+    def test_where_clause_lazy_lookup(self):
+        self.assertEqual(self.cache(lazy=True).lookup(('A', 1)), 1)
+        self.assertEqual(self.cache(lazy=True).lookup_many([('A', 1), ('B', 1)]), [1, 3])
+
+    def test_where_clause_lazy_merge(self):
+        cache = self.cache(lazy=True, max_size=10)
+        self.assertEqual(cache.merge({'code': 'A', 'region': 1}), 1)
+        self.assertEqual(cache.merge_many([{'code': 'A', 'region': 1}]), [1])
+        self.assertEqual(cache.counts, {'exist': 2, 'insert': 0})
+
+    def test_where_clause_excludes_rows(self):
+        cache = DimensionCache(self.connection, Customer, ['code', 'region'], where_clause=Customer.current == 0,
+                               lazy=True)
+        self.assertIsNone(cache.lookup(('B', 1)))
+
+    def test_prefetch_batches_single_lookups(self):
+        cache = self.cache(lazy=True)
+        counter = QueryCounter(self, self.connection.engine)
+        keys = [('A', 1), ('B', 1), ('C', 1)]
+        cache.prefetch(keys)
+        self.assertEqual([cache.lookup(key) for key in keys], [1, 3, None])
+        # one query for the announced keys, one more for the key that is not in the dimension
+        self.assertEqual(counter.selects, 2)
+        self.assertEqual((cache.cache_counts['hit'], cache.cache_counts['miss']), (1, 2))
+
+    def test_prefetch_then_merge(self):
+        cache = self.cache(lazy=True)
+        cache.prefetch([('B', 1), ('C', 2)])
+        self.assertEqual(cache.merge({'code': 'B', 'region': 1}), 3)
+        new_id = cache.merge({'code': 'C', 'region': 2})
+        self.assertEqual(cache.counts, {'exist': 1, 'insert': 1})
+        self.assertEqual(cache.lookup(('C', 2)), new_id)
+
+    def test_evicted_keys_fetched_again(self):
+        cache = self.cache(lazy=True, max_size=2)
+        counter = QueryCounter(self, self.connection.engine)
+        self.assertEqual(cache.merge({'code': 'A', 'region': 1}), 1)
+        self.assertEqual(cache.merge({'code': 'B', 'region': 1}), 3)
+        new_id = cache.merge({'code': 'C', 'region': 1})
+        self.assertEqual(cache.cache_counts['evict'], 1)
+        self.assertEqual(cache.merge({'code': 'A', 'region': 1}), 1)     # evicted: selected again, not inserted
+        self.assertEqual(cache.lookup_many([('B', 1), ('C', 1)]), [3, new_id])
+        self.assertEqual(cache.merge_many([{'code': c, 'region': 1} for c in 'ABCAB']), [1, 3, new_id, 1, 3])
+        self.assertEqual(self.count(Customer), 4)
+        self.assertEqual(cache.counts, {'exist': 8, 'insert': 1})
+        self.assertGreater(counter.selects, 3)
+        self.assertEqual(cache.cache_counts['evict'], cache._cache.evictions)
+        self.assertEqual(len(cache._cache), 2)
+
+    def test_eviction_order(self):
+        for eviction, kept in (('lru', [('A', 1), ('C', 1)]), ('fifo', [('B', 1), ('C', 1)])):
+            cache = self.cache(lazy=True, max_size=2, eviction=eviction)
+            cache.lookup_many([('A', 1)])
+            cache.lookup_many([('B', 1)])
+            cache.lookup(('A', 1))
+            cache.merge({'code': 'C', 'region': 1})
+            self.assertEqual(sorted(k for k, _ in cache._cache.items()), kept, eviction)
+            self.assertEqual(cache.cache_counts, {'hit': 1, 'miss': 3, 'evict': 1}, eviction)
+            self.connection.session.rollback()
+
+    def test_bounded_batched_merge(self):
+        cache = self.cache(lazy=True, max_size=2, batch_size=4)
+        ids = [cache.merge({'code': c, 'region': 2}) for c in 'PQR']    # more staged records than cached entries
+        self.assertEqual([int(i) for i in ids], [4, 5, 6])
+        ids = [cache.merge({'code': c, 'region': 2}) for c in 'PQRS']
+        self.assertEqual([int(i) for i in ids], [4, 5, 6, 7])
+        self.assertEqual(self.count(Customer), 7)
+        self.assertEqual(cache.counts, {'exist': 3, 'insert': 4})
+
+    def test_bounded_cache_must_be_lazy(self):
+        with self.assertRaises(DimensionCacheException):
+            self.cache(max_size=2)
+
+
+class DateResolverTest(DatabaseTestCase):
+
+    models = (Date, )
+    schemas = ('common', )
+
+    def setUp(self):
+        super(DateResolverTest, self).setUp()
+        extend_dates(self.connection, datetime.date(2020, 1, 1), datetime.date(2020, 1, 31))
+        self.connection.session.query(Date).filter(Date.date == datetime.date(2020, 1, 15)).delete()
+        self.connection.session.commit()
+        self.resolver = DateResolver(self.connection)
+        self.counter = QueryCounter(self, self.connection.engine)
+
+    def test_resolve(self):
+        self.assertEqual(self.resolver.resolve(datetime.date(2020, 1, 1)), 1)
+        self.assertEqual(self.resolver.resolve(datetime.datetime(2020, 1, 31, 12)), 31)
+        self.assertEqual(self.counter.selects, 0)
+
+    def test_misses_are_cached(self):
+        for d in (datetime.date(2020, 1, 15), datetime.date(2021, 1, 1)) * 3:
+            self.assertIsNone(self.resolver.resolve(d))
+        self.assertEqual(self.counter.selects, 2)
+        self.assertEqual(self.resolver.resolve_many([datetime.date(2020, 1, 15), datetime.date(2020, 1, 16)]),
+                         [None, 16])
+        self.assertEqual(self.counter.selects, 2)
+
+    def test_resolve_many_misses_are_cached(self):
+        dates = [datetime.date(2020, 1, 14), datetime.date(2020, 1, 15), datetime.date(2021, 1, 1), None]
+        self.assertEqual(self.resolver.resolve_many(dates * 2), [14, None, None, None] * 2)
+        self.assertEqual(self.resolver.resolve_many(dates), [14, None, None, None])
+        self.assertEqual(self.counter.selects, 1)
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_resolve_datetime64(self):
+        dates = numpy.array(['2020-01-14', '2020-01-15', '2021-01-01', 'NaT'], dtype='datetime64[D]')
+        self.assertEqual(self.resolver.resolve_many(dates).tolist(), [14, 0, 0, 0])
+        self.assertEqual(self.resolver.resolve_many(dates).tolist(), [14, 0, 0, 0])
+        self.assertEqual(self.counter.selects, 1)
+
+
+class TitleCaseTest(unittest.TestCase):
+
+    # expectations of the implementation before title_case was memoised, quirks included
+    CASES = (
+        ('the quick brown fox jumps over a lazy dog', 'The Quick Brown Fox Jumps Over a Lazy Dog'),
+        ('a tale of two cities', 'A Tale of Two Cities'),
+        ('what is the point of it all?', 'What Is the Point of It All?'),
+        ('notes: on the art of war', 'Notes: On the Art of War'),
+        ('by the way', 'By the Way'),
+        ('mcdonald and macleod vs. machinery and macro economics',
+         'McDonald and MacLeod vs. Machinery and Macro Economics'),
+        ("o'neil, d'angelo and l'amour", "O'neil, D'Angelo and L'Amour"),
+        ('J.R.R. tolkien and e.e. cummings', 'J.R.R. Tolkien and e.e. Cummings'),
+        ('THE QUICK BROWN FOX', 'The Quick Brown Fox'),
+        ('ACME CORP. U.S.A. SALES REPORT', 'Acme Corp. U.S.A. Sales Report'),
+        ('north/south and east//west', 'North/South and East//west'),
+        ('self-service check-in for year-end', 'Self-Service Check-In for Year-End'),
+        ('iPhone and eBay listings', 'iPhone and eBay Listings'),
+        ('data warehouse\nquarterly report\r\nthe end', 'Data Warehouse\nQuarterly Report\nThe End'),
+        ('tab\tseparated  words', 'Tab Separated  Words'),
+        ('', '')
+    )
+
+    def setUp(self):
+        title_case.cache_clear()
+        _title_case_word.cache_clear()
+
+    def test_baseline(self):
+        for _ in range(2):  # cased, then memoised
+            for text, expected in self.CASES:
+                self.assertEqual(title_case(text), expected, text)
+
+    def test_word_memo_keeps_all_caps_apart(self):
+        self.assertEqual(title_case('U.S.A. report'), 'U.S.A. Report')
+        self.assertEqual(title_case('U.S.A. REPORT'), 'U.S.A. Report')
+        self.assertEqual(title_case('the a.b. test'), 'The a.b. Test')
+        self.assertEqual(title_case('THE A.B. TEST'), 'The A.B. Test')
+
+    def test_many(self):
+        values = ['by the way', None, 'THE QUICK BROWN FOX', 'by the way', None, '', 'by the way']
+        self.assertEqual(title_case_many(values), [
+            'By the Way', None, 'The Quick Brown Fox', 'By the Way', None, '', 'By the Way'
+        ])
+        self.assertEqual(title_case_many(iter(values)), [None if v is None else title_case(v) for v in values])
+        self.assertEqual(title_case_many([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import unittest
+from decimal import Decimal
+
+from datapro.core.validation import (
+    MESSAGE_DECIMAL, MESSAGE_INT, MESSAGE_MAX_LENGTH, MESSAGE_NULL, ColumnValidator, FailureCollector, RowValidator,
+    Validator
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def validate_values(method, values, *args, **options):
+    """Validate values one at a time with Validator.
+
+    Returns:
+        tuple: (valid, value) per value, and the failures counted per (field, message)
+    """
+    collector = FailureCollector()
+    validator = Validator(collector=collector)
+    outcomes = []
+    for value in values:
+        validator.reset()
+        getattr(validator, method)('field', value, *args, **options)
+        outcomes.append((validator.valid, validator.properties.get('field')))
+    return outcomes, collector.totals
+
+
+class RowValidatorTest(unittest.TestCase):
+
+    SCHEMA = [
+        ('amount', {'type': 'decimal', 'precision': 2}),
+        ('rate', {'type': 'decimal', 'precision': 4, 'nulls_ok': True}),
+        ('quantity', {'type': 'int', 'nulls_ok': True}),
+        ('booked', {'type': 'date', 'format': '%Y-%m-%d'}),
+        ('serial', {'type': 'date', 'format': 0, 'nulls_ok': True}),
+        ('shipped', {'type': 'datetime', 'format': '%Y-%m-%d %H:%M', 'tz': 'America/New_York', 'nulls_ok': True}),
+        ('name', {'type': 'string', 'max_length': 5}),
+        ('note', {'type': 'string', 'convert_nulls_to_blank': True, 'blanks_ok': True}),
+        ('status', {'type': 'lookup', 'dictionary': {'A': 1, 'C': 0}}),
+        ('region', {'type': 'lookup', 'dictionary': {'N': 1}, 'miss_ok': True, 'nulls_ok': True})
+    ]
+
+    ROWS = [
+        {'amount': '1.005', 'rate': '0.12345', 'quantity': '3', 'booked': '2020-02-29', 'serial': 43831.0,
+         'shipped': '2020-11-01 01:30', 'name': 'Bob', 'note': None, 'status': 'A', 'region': 'N'},
+        {'amount': '-2.5', 'rate': '', 'quantity': None, 'booked': '2021-02-29', 'serial': -1.0,
+         'shipped': '2020-03-08 02:30', 'name': 'Robert', 'note': 'x', 'status': 'B', 'region': 'S'},
+        {'amount': 'abc', 'rate': None, 'quantity': 'x', 'booked': '', 'serial': 'x', 'shipped': 'never',
+         'name': '', 'note': '', 'status': '', 'region': None},
+        {}
+    ]
+
+    def expected(self, row):
+        collector = FailureCollector()
+        validator = Validator(collector=collector)
+        validator.reset()
+        for key, options in self.SCHEMA:
+            options = dict(options)
+            getattr(validator, options.pop('type'))(key, row.get(key), **options)
+        values = dict((key, validator.properties.get(key)) for key, _ in self.SCHEMA)
+        return values, [(f.key, f.message, f.args) for f in collector.drain()]
+
+    def test_same_as_validator(self):
+        validator = RowValidator(self.SCHEMA)
+        for row in self.ROWS:
+            values, errors = validator.validate(row)
+            self.assertEqual((values, errors), self.expected(row), row)
+
+    def test_converted_values_and_errors(self):
+        values, errors = RowValidator(self.SCHEMA).validate(self.ROWS[0])
+        self.assertEqual(errors, [])
+        self.assertEqual((values['amount'], values['rate']), (Decimal('1.01'), Decimal('0.1235')))
+        self.assertEqual((values['booked'], values['serial']), (datetime.date(2020, 2, 29), datetime.date(2020, 1, 1)))
+        self.assertEqual(values['shipped'], datetime.datetime(2020, 11, 1, 6, 30))
+        self.assertEqual((values['note'], values['status']), ('', 1))
+
+        values, errors = RowValidator(self.SCHEMA).validate(self.ROWS[1])
+        self.assertIn(('name', MESSAGE_MAX_LENGTH, ('Robert', 6, 5)), errors)
+        self.assertEqual((values['name'], values['region']), (None, None))
+
+        values, errors = RowValidator(self.SCHEMA).validate(self.ROWS[2])
+        self.assertIn(('amount', MESSAGE_DECIMAL, ('abc', )), errors)
+        self.assertIsNone(values['amount'])
+
+    def test_tuple_output(self):
+        validator = RowValidator(self.SCHEMA, as_tuple=True)
+        for row in self.ROWS:
+            values, errors = validator.validate(row)
+            expected, expected_errors = self.expected(row)
+            self.assertEqual(values, tuple(expected[key] for key, _ in self.SCHEMA))
+            self.assertEqual(errors, expected_errors)
+        self.assertEqual(validator.keys, tuple(key for key, _ in self.SCHEMA))
+
+    def test_schema_dictionary_and_unknown_type(self):
+        validator = RowValidator({'quantity': {'type': 'int'}})
+        self.assertEqual(validator.validate({'quantity': '7'}), ({'quantity': 7}, []))
+        self.assertEqual(validator.validate({}), ({'quantity': None}, [('quantity', MESSAGE_NULL, ())]))
+        with self.assertRaises(ValueError):
+            RowValidator([('quantity', {'type': 'float'})])
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class ColumnValidatorTest(unittest.TestCase):
+
+    def assertSameAsValidator(self, method, values, *args, **options):
+        outcomes, totals = validate_values(method, values, *args, **options)
+        collector = FailureCollector()
+        result = getattr(ColumnValidator(collector=collector), method)('field', values, *args, **options)
+
+        self.assertEqual(result.errors.tolist(), [i for i, (valid, _) in enumerate(outcomes) if not valid])
+        converted, nulls = result.values.tolist(), result.nulls.tolist()
+        for i, (valid, value) in enumerate(outcomes):
+            if valid:
+                self.assertEqual(None if nulls[i] else converted[i], value, (method, values[i], options))
+        self.assertEqual(collector.totals, totals)
+        return result
+
+    def test_int(self):
+        values = ['1', '007', ' 3', '-4', '+5', 'x', '1e3', '', None, 2.5, 12, '99999999999999999999']
+        for nulls_ok in (False, True):
+            self.assertSameAsValidator('int', values, nulls_ok=nulls_ok)
+            self.assertSameAsValidator('int', numpy.array(['12', '0', '3', 'x', '-1', '']), nulls_ok=nulls_ok)
+            self.assertSameAsValidator('int', numpy.array([1.0, -2.9, numpy.inf]), nulls_ok=nulls_ok)
+        self.assertSameAsValidator('int', numpy.array([1, 2, 3], dtype=numpy.int32))
+
+    def test_int_digit_strings(self):
+        column = numpy.array([str(i) for i in range(1000)] + ['1_000', '٣'])
+        result = self.assertSameAsValidator('int', column)
+        self.assertEqual(result.values.dtype, numpy.int64)
+        self.assertEqual(result.values[-3:].tolist(), [999, 1000, 3])
+
+    def test_decimal(self):
+        values = ['1.005', '2', '-0.125', 'abc', 'inf', '', None, 3.14159, 7]
+        for nulls_ok in (False, True):
+            self.assertSameAsValidator('decimal', values, 2, nulls_ok=nulls_ok)
+        self.assertSameAsValidator('decimal', values, 0)
+
+    def test_date(self):
+        values = ['2020-01-31', '2020-02-29', '2021-02-29', '2020-1-5', 'x', '', None]
+        for nulls_ok in (False, True):
+            self.assertSameAsValidator('date', values, '%Y-%m-%d', nulls_ok=nulls_ok)
+        result = self.assertSameAsValidator('date', [43831.0, 43831.75, -1.0, 'x', None], 0)
+        self.assertEqual(result.values[0], datetime.date(2020, 1, 1))
+
+    def test_string(self):
+        values = ['abc', '', None, 'too long a value', 12]
+        for options in ({}, {'blanks_ok': True}, {'nulls_ok': True}, {'convert_nulls_to_blank': True},
+                        {'convert_nulls_to_blank': True, 'blanks_ok': True}, {'max_length': 5}):
+            self.assertSameAsValidator('string', values, **options)
+
+    def test_lookup(self):
+        dictionary = {'a': 1, 'b': 2, 3: 'three'}
+        values = ['a', 'b', 'c', 3, '', None, 'a']
+        for options in ({}, {'miss_ok': True}, {'nulls_ok': True}, {'miss_ok': True, 'nulls_ok': True}):
+            self.assertSameAsValidator('lookup', values, dictionary, **options)
+
+    def test_nan_is_null(self):
+        collector = FailureCollector()
+        validator = ColumnValidator(collector=collector)
+        result = validator.int('field', numpy.array([1.0, numpy.nan]), nulls_ok=True)
+        self.assertEqual((result.nulls.tolist(), result.errors.tolist()), ([False, True], []))
+        result = validator.int('field', numpy.array([numpy.nan, 2.0]))
+        self.assertEqual((result.nulls.tolist(), result.errors.tolist()), ([True, False], [0]))
+        result = validator.decimal('field', [Decimal('1.5'), float('nan'), None], 1, nulls_ok=True)
+        self.assertEqual(result.nulls.tolist(), [False, True, True])
+        self.assertEqual(validator.string('field', numpy.array([1.5, numpy.nan]), nulls_ok=True).values.tolist(),
+                         ['1.5', ''])
+        self.assertEqual(collector.totals, {('field', MESSAGE_NULL): 1})
+        self.assertNotIn(('field', MESSAGE_INT), collector.totals)
+
+
+if __name__ == '__main__':
+    unittest.main()